@@ -1,4 +1,4 @@
-
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
@@ -56,5 +56,25 @@ def create_app(config_class=Config):
 
     with app.app_context():
         db.create_all()
+        from .models.weather import WeatherCache
+        from .models.chat import ChatHistory
+        WeatherCache.ensure_schema()
+        ChatHistory.ensure_schema()
+
+    # 启动后台任务的工作线程，继续处理重启前排队或执行中断的任务
+    if app.config.get('JOB_QUEUE_AUTOSTART', True):
+        from .services import job_queue
+        job_queue.start(app)
+
+    @app.cli.command('warm-weather')
+    @click.option('--force', is_flag=True, help='同时刷新缓存未过期的网格')
+    def warm_weather(force):
+        """为所有用户保存的位置批量预热天气缓存"""
+        from .services import weather_service
+        result = weather_service.warm_user_locations(force=force)
+        click.echo(
+            f"位置 {result['locations']} 个，网格 {result['cells']} 个，跳过 {result['skipped']} 个，"
+            f"刷新 {result['refreshed']} 个，失败 {result['failed']} 个"
+        )
 
     return app
\ No newline at end of file
@@ -1,4 +1,6 @@
 # LLM服务模块初始化
+from .base import BaseLLM, LLMError
+from .providers import PROVIDERS, register_provider, create_provider
 from .service import LLMService
 
-__all__ = ['LLMService']
\ No newline at end of file
+__all__ = ['LLMService', 'BaseLLM', 'LLMError', 'PROVIDERS', 'register_provider', 'create_provider']
\ No newline at end of file
@@ -1,19 +1,122 @@
+import hashlib
 from abc import ABC, abstractmethod
-from typing import Optional
+from contextlib import asynccontextmanager, contextmanager
+from typing import Iterator, Optional
+from app.utils.ratelimit import llm_limiter, RateLimitExceeded
+
+class LLMError(Exception):
+    """LLM服务调用失败，异常信息可直接展示给用户"""
+    pass
 
 class BaseLLM(ABC):
-    """LLM服务基类"""
-    
-    def __init__(self, api_key: str, api_secret: Optional[str] = None):
+    """LLM服务基类
+
+    每个服务商实现一个子类并通过 app.llm.providers.register_provider 注册，
+    同时提供同步的 chat 和基于asyncio的 achat 两种调用方式。
+    """
+
+    name: str = None          # 对应 UserLLMConfig.model_type
+    display_name: str = None  # 展示名称
+    model: str = None         # 对话使用的模型标识
+
+    def __init__(self, api_key: str, api_secret: Optional[str] = None,
+                 app_id: Optional[str] = None, api_base: Optional[str] = None):
         self.api_key = api_key
         self.api_secret = api_secret
-        
+        self.app_id = app_id
+        self.api_base = api_base
+        self.last_usage = {}  # 最近一次调用的token用量
+        self.user_id = None  # 发起调用的用户，用于按用户限流
+
+    @classmethod
+    def from_config(cls, config) -> 'BaseLLM':
+        """根据 UserLLMConfig 创建服务实例"""
+        return cls(
+            api_key=config.api_key,
+            api_secret=config.api_secret,
+            app_id=config.app_id,
+            api_base=config.api_base
+        )
+
+    def validate(self) -> Optional[str]:
+        """检查配置是否完整，不完整时返回提示信息"""
+        if not self.api_key:
+            return "请先完成API配置（需要API Key）"
+        return None
+
+    def limit_keys(self) -> list:
+        """限流的键：发起调用的用户，以及服务商和API Key（共享同一Key的用户共用限制）"""
+        key_hash = hashlib.sha256((self.api_key or '').encode('utf-8')).hexdigest()[:16]
+        keys = [('provider', f"{self.name}:{key_hash}", self.name)]
+        if self.user_id is not None:
+            keys.insert(0, ('user', str(self.user_id), None))
+        return keys
+
+    @contextmanager
+    def limit(self):
+        """在速率和并发限制内执行外部调用，超出等待时限时抛出LLMError"""
+        try:
+            lease = llm_limiter.acquire(self.limit_keys())
+        except RateLimitExceeded as e:
+            raise LLMError("请求过于频繁，请稍后再试") from e
+        try:
+            yield
+        finally:
+            lease.release()
+
+    @asynccontextmanager
+    async def alimit(self):
+        """limit 的异步版本"""
+        try:
+            lease = await llm_limiter.aacquire(self.limit_keys())
+        except RateLimitExceeded as e:
+            raise LLMError("请求过于频繁，请稍后再试") from e
+        try:
+            yield
+        finally:
+            lease.release()
+
     @abstractmethod
     def chat(self, prompt: str) -> str:
         """发送消息并获取响应"""
         pass
-        
+
     @abstractmethod
+    async def achat(self, prompt: str) -> str:
+        """异步发送消息并获取响应，不阻塞事件循环"""
+        pass
+
+    def stream_chat(self, prompt: str) -> Iterator[str]:
+        """流式发送消息，逐段产出响应文本。默认一次性返回完整响应"""
+        yield self.chat(prompt)
+
+    def analyze_image(self, system_prompt: str, user_prompt: str, image_base64: str,
+                      mimetype: str = 'image/jpeg') -> str:
+        """分析图片并返回模型原始输出，mimetype为图片的实际类型"""
+        raise LLMError('目前仅openrouter支持图像识别')
+
+    def stream_image(self, system_prompt: str, user_prompt: str, image_base64: str,
+                     mimetype: str = 'image/jpeg') -> Iterator[str]:
+        """流式分析图片，逐段产出模型输出。默认一次性返回完整输出"""
+        yield self.analyze_image(system_prompt, user_prompt, image_base64, mimetype)
+
+    async def aanalyze_image(self, system_prompt: str, user_prompt: str, image_base64: str,
+                             mimetype: str = 'image/jpeg') -> str:
+        """异步分析图片并返回模型原始输出"""
+        raise LLMError('目前仅openrouter支持图像识别')
+
+    @staticmethod
+    def parse_usage(data: dict) -> dict:
+        """从响应体的usage字段中提取token用量"""
+        usage = data.get('usage') or {}
+        prompt_tokens = int(usage.get('prompt_tokens') or 0)
+        completion_tokens = int(usage.get('completion_tokens') or 0)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': int(usage.get('total_tokens') or prompt_tokens + completion_tokens)
+        }
+
     def get_usage(self) -> dict:
-        """获取API使用情况"""
-        pass
\ No newline at end of file
+        """获取最近一次调用的token用量，包含prompt_tokens、completion_tokens和total_tokens"""
+        return dict(self.last_usage)
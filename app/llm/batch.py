@@ -0,0 +1,207 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, List, Optional, Tuple
+from flask import current_app
+from app import db
+from app.models import Clothing
+from app.services import wardrobe_context
+from app.utils.cache import LRUCache
+
+SLOTS_BUSY_MESSAGE = '同时进行的识别过多，请稍后再试'
+
+
+class BatchImageAnalyzer:
+    """批量衣物图片识别
+
+    所有请求共享一个有界线程池（IMAGE_ANALYSIS_WORKERS），
+    同一用户同时进行的识别数量不超过 IMAGE_ANALYSIS_PER_USER_CONCURRENCY，
+    等待名额超过 IMAGE_ANALYSIS_SLOT_WAIT 秒时返回错误。
+    单张图片的流式识别（analyze_stream）也在该线程池中执行。
+    """
+
+    # 各用户的并发名额超过该秒数未使用时淘汰
+    SLOT_IDLE_TTL = 3600
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._user_slots = LRUCache(maxsize=10000, ttl=self.SLOT_IDLE_TTL)  # user_id -> BoundedSemaphore
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=current_app.config.get('IMAGE_ANALYSIS_WORKERS', 8),
+                        thread_name_prefix='image-analysis'
+                    )
+        return self._executor
+
+    def _get_user_slots(self, user_id) -> threading.BoundedSemaphore:
+        with self._lock:
+            slots = self._user_slots.get(user_id)
+            if slots is None:
+                slots = threading.BoundedSemaphore(
+                    current_app.config.get('IMAGE_ANALYSIS_PER_USER_CONCURRENCY', 3)
+                )
+            # 每次使用时刷新过期时间，只淘汰长时间未使用的用户
+            self._user_slots.set(user_id, slots)
+            return slots
+
+    @staticmethod
+    def _slot_wait() -> float:
+        return current_app.config.get('IMAGE_ANALYSIS_SLOT_WAIT', 30)
+
+    @staticmethod
+    def _analyze_one(app, user_id, config_id, index, filename, image_data, mimetype, category,
+                     force_refresh=False) -> dict:
+        """在工作线程中识别单张图片，需要时直接创建衣物记录"""
+        # 延迟导入，避免与 app.llm.service 循环导入
+        from app.llm.service import LLMService
+
+        with app.app_context():
+            llm_service = LLMService()
+            llm_service.set_user_id(user_id, config_id)
+            result = llm_service.analyze_clothing_image(image_data, force_refresh=force_refresh)
+            if 'error' in result:
+                return {'index': index, 'filename': filename, 'success': False, 'message': result['error']}
+
+            item = {'index': index, 'filename': filename, 'success': True, 'data': result}
+            try:
+                llm_service.record_usage()
+                if category:
+                    clothing = Clothing(
+                        user_id=user_id,
+                        category=category,
+                        description=result['description'],
+                        seasons=result['seasons'],
+                        occasions=result['occasions'],
+                        image_data=image_data,
+                        image_mimetype=mimetype
+                    )
+                    db.session.add(clothing)
+                    wardrobe_context.invalidate(user_id)
+                db.session.commit()
+                if category:
+                    item['clothing_id'] = clothing.id
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"保存批量识别结果时出错: {str(e)}")
+                if category:
+                    item['warning'] = '识别成功但保存衣物失败'
+            return item
+
+    def analyze(self, user_id, config_id, images: List[Tuple[str, bytes, str]],
+                category: Optional[str] = None, force_refresh: bool = False) -> Iterator[dict]:
+        """并发识别多张图片，按完成顺序产出结果
+
+        Args:
+            user_id: 用户ID
+            config_id: 可选，指定使用的LLM配置ID
+            images: [(文件名, 图片数据, MIME类型)]
+            category: 指定时为每张识别成功的图片创建该类别的衣物记录
+            force_refresh: 为True时忽略缓存的识别结果
+        """
+        app = current_app._get_current_object()
+        executor = self._get_executor()
+        slots = self._get_user_slots(user_id)
+        queue = list(enumerate(images))
+        pending = set()
+        indexes = {}  # future -> 图片下标
+
+        def submit(index, image):
+            filename, image_data, mimetype = image
+            future = executor.submit(self._analyze_one, app, user_id, config_id,
+                                     index, filename, image_data, mimetype, category, force_refresh)
+            future.add_done_callback(lambda _: slots.release())
+            pending.add(future)
+            indexes[future] = index
+
+        try:
+            while queue or pending:
+                # 在用户并发上限内尽量多地提交任务
+                while queue and slots.acquire(blocking=False):
+                    submit(*queue.pop(0))
+                if not pending:
+                    # 该用户的名额被其他请求占满，等待释放
+                    if not slots.acquire(timeout=self._slot_wait()):
+                        for index, (filename, _, _) in queue:
+                            yield {'index': index, 'filename': filename, 'success': False,
+                                   'message': SLOTS_BUSY_MESSAGE}
+                        return
+                    submit(*queue.pop(0))
+
+                done, pending_left = wait(pending, return_when=FIRST_COMPLETED)
+                pending.clear()
+                pending.update(pending_left)
+                for future in done:
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        current_app.logger.error(f"批量识别图片时出错: {str(e)}")
+                        yield {'index': indexes[future], 'success': False, 'message': f'分析图片时出错: {str(e)}'}
+        finally:
+            # 客户端断开时取消尚未开始的任务
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _analyze_streaming(app, user_id, config_id, image_data, force_refresh, events: queue.Queue):
+        """在工作线程中流式识别单张图片，识别出的字段和最终结果依次放入events"""
+        from app.llm.service import LLMService
+
+        with app.app_context():
+            try:
+                llm_service = LLMService()
+                llm_service.set_user_id(user_id, config_id)
+                result = llm_service.analyze_clothing_image(
+                    image_data,
+                    force_refresh=force_refresh,
+                    on_field=lambda name, value: events.put(('field', {'name': name, 'value': value}))
+                )
+                if 'error' in result:
+                    events.put(('error', {'success': False, 'message': result['error']}))
+                    return
+
+                try:
+                    llm_service.record_usage()
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"Error saving usage stats: {str(e)}")
+                events.put(('done', {
+                    'success': True,
+                    'data': result,
+                    'cached': llm_service.image_stats.get('cached', False),
+                    'image_stats': llm_service.image_stats
+                }))
+            except Exception as e:
+                current_app.logger.error(f"分析图片时出错: {str(e)}")
+                events.put(('error', {'success': False, 'message': f'分析图片时出错: {str(e)}'}))
+
+    def analyze_stream(self, user_id, config_id, image_data: bytes,
+                       force_refresh: bool = False) -> Iterator[Tuple[str, dict]]:
+        """流式识别单张图片，按到达顺序产出 (事件名, 数据)
+
+        事件依次为若干个 field（{"name": 字段名, "value": 值}），最后是 done（完整结果）或 error。
+        """
+        app = current_app._get_current_object()
+        slots = self._get_user_slots(user_id)
+        if not slots.acquire(timeout=self._slot_wait()):
+            yield 'error', {'success': False, 'message': SLOTS_BUSY_MESSAGE}
+            return
+        events = queue.Queue()
+        future = self._get_executor().submit(
+            self._analyze_streaming, app, user_id, config_id, image_data, force_refresh, events
+        )
+        future.add_done_callback(lambda _: slots.release())
+        while True:
+            event, data = events.get()
+            yield event, data
+            if event in ('done', 'error'):
+                return
+
+
+# 创建全局实例
+batch_analyzer = BatchImageAnalyzer()
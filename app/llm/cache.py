@@ -0,0 +1,57 @@
+import hashlib
+import threading
+from typing import Optional
+from flask import current_app
+from app.utils.cache import LRUCache
+
+
+class ResponseCache:
+    """LLM回复的精确匹配缓存
+
+    以 (服务商, 模型, 完整prompt) 的哈希为键。默认关闭，通过以下配置项启用：
+        LLM_RESPONSE_CACHE_ENABLED: 是否启用（默认False）
+        LLM_RESPONSE_CACHE_SIZE: 最大缓存条目数（默认256）
+        LLM_RESPONSE_CACHE_TTL: 缓存有效期，秒（默认600）
+    """
+
+    def __init__(self):
+        self._cache: Optional[LRUCache] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(current_app.config.get('LLM_RESPONSE_CACHE_ENABLED', False))
+
+    def _get_cache(self) -> LRUCache:
+        if self._cache is None:
+            with self._lock:
+                if self._cache is None:
+                    self._cache = LRUCache(
+                        maxsize=current_app.config.get('LLM_RESPONSE_CACHE_SIZE', 256),
+                        ttl=current_app.config.get('LLM_RESPONSE_CACHE_TTL', 600)
+                    )
+        return self._cache
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str) -> str:
+        raw = '\x00'.join([provider or '', model or '', prompt])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self._get_cache().get(key)
+
+    def set(self, key: str, response: str):
+        self._get_cache().set(key, response)
+
+    def clear(self):
+        if self._cache is not None:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        stats = self._cache.stats() if self._cache is not None else {}
+        stats['enabled'] = self.enabled
+        return stats
+
+
+# 创建全局缓存实例
+response_cache = ResponseCache()
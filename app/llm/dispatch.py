@@ -0,0 +1,69 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+from flask import current_app
+from app.llm.base import LLMError
+
+
+async def hedged_call(calls: List[Callable[[], Awaitable]], hedge_delay: float) -> Tuple[int, object]:
+    """按顺序发起对冲请求，返回最先成功的结果
+
+    先调用第一个候选；若 hedge_delay 秒内没有结果，再发起下一个候选，以此类推。
+    某个候选失败时立即发起下一个候选。任一候选成功后取消其余仍在进行的请求。
+
+    Args:
+        calls: 无参协程函数列表，按优先级排列
+        hedge_delay: 发起下一个候选前等待的秒数
+
+    Returns:
+        tuple: (成功候选的下标, 返回值)
+
+    Raises:
+        LLMError: 所有候选均失败，异常信息取最后一个失败原因
+    """
+    if not calls:
+        raise LLMError("请先配置AI服务")
+
+    tasks = {}  # task -> 候选下标
+    next_index = 0
+    last_error: Optional[BaseException] = None
+
+    def launch():
+        nonlocal next_index
+        task = asyncio.ensure_future(calls[next_index]())
+        tasks[task] = next_index
+        next_index += 1
+
+    launch()
+    try:
+        while tasks:
+            has_more = next_index < len(calls)
+            done, _ = await asyncio.wait(
+                tasks.keys(),
+                timeout=hedge_delay if has_more else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                # 超过对冲等待时间仍无结果，发起下一个候选
+                current_app.logger.info(f"LLM request exceeded hedge delay {hedge_delay}s, hedging with candidate {next_index}")
+                launch()
+                continue
+
+            for task in done:
+                index = tasks.pop(task)
+                if task.exception() is None:
+                    return index, task.result()
+                last_error = task.exception()
+                current_app.logger.warning(f"LLM candidate {index} failed: {last_error}")
+                # 失败时立即切换到下一个候选
+                if next_index < len(calls):
+                    launch()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks.keys(), return_exceptions=True)
+
+    if isinstance(last_error, LLMError):
+        raise last_error
+    raise LLMError("调用AI服务时发生错误") from last_error
@@ -0,0 +1,125 @@
+import io
+import threading
+from collections import namedtuple
+from flask import current_app
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装Pillow时直接上传原图
+    Image = None
+    ImageOps = None
+
+# 预处理后的图片及体积统计
+PreparedImage = namedtuple('PreparedImage', ['data', 'mimetype', 'original_bytes', 'bytes_saved'])
+
+OUTPUT_MIMETYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp'
+}
+
+
+def sniff_mimetype(data: bytes) -> str:
+    """根据文件头判断图片类型，无法识别时按JPEG处理"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+class ImagePreprocessStats:
+    """累计的图片预处理统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.original_bytes = 0
+        self.uploaded_bytes = 0
+
+    def record(self, original_bytes: int, uploaded_bytes: int):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original_bytes
+            self.uploaded_bytes += uploaded_bytes
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'images': self.images,
+                'original_bytes': self.original_bytes,
+                'uploaded_bytes': self.uploaded_bytes,
+                'bytes_saved': self.original_bytes - self.uploaded_bytes
+            }
+
+
+def _encode(image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    # 不传入exif参数，重新编码后的图片不包含EXIF信息
+    image.save(buffer, format=fmt, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image(data: bytes) -> PreparedImage:
+    """上传给视觉模型前压缩图片
+
+    解码图片并按EXIF方向旋转，去除EXIF信息，将最长边限制在 IMAGE_UPLOAD_MAX_EDGE 像素内，
+    再编码为 IMAGE_UPLOAD_FORMAT（JPEG或WEBP），逐步降低质量直到不超过 IMAGE_UPLOAD_MAX_BYTES。
+    原图已经是JPEG/PNG/WEBP、不含EXIF、尺寸和大小都在限制内且比重新编码的结果更小时直接上传原图。
+    未安装Pillow或图片无法解码时返回原图。
+    """
+    original_bytes = len(data)
+    if Image is None:
+        return PreparedImage(data, sniff_mimetype(data), original_bytes, 0)
+
+    max_edge = current_app.config.get('IMAGE_UPLOAD_MAX_EDGE', 1280)
+    max_bytes = current_app.config.get('IMAGE_UPLOAD_MAX_BYTES', 400 * 1024)
+    fmt = current_app.config.get('IMAGE_UPLOAD_FORMAT', 'JPEG').upper()
+    if fmt not in OUTPUT_MIMETYPES:
+        fmt = 'JPEG'
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_mimetype = Image.MIME.get(image.format)
+        keep_original = (
+            original_mimetype in ('image/jpeg', 'image/png', 'image/webp')
+            and original_bytes <= max_bytes
+            and max(image.size) <= max_edge
+            and not image.getexif()
+        )
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # 透明背景填充为白色
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        quality = 85
+        encoded = _encode(image, fmt, quality)
+        while len(encoded) > max_bytes:
+            if quality > 50:
+                quality -= 10
+            else:
+                # 质量已经较低仍超出大小限制时缩小尺寸
+                image = image.resize((max(1, int(image.width * 0.75)), max(1, int(image.height * 0.75))), Image.LANCZOS)
+                if image.width < 64 or image.height < 64:
+                    break
+            encoded = _encode(image, fmt, quality)
+    except Exception as e:
+        current_app.logger.warning(f"图片预处理失败，使用原图上传: {str(e)}")
+        return PreparedImage(data, sniff_mimetype(data), original_bytes, 0)
+
+    if keep_original and original_bytes <= len(encoded):
+        # 重新编码反而更大
+        return PreparedImage(data, original_mimetype, original_bytes, 0)
+    return PreparedImage(encoded, OUTPUT_MIMETYPES[fmt], original_bytes, original_bytes - len(encoded))
+
+
+# 创建全局统计实例
+image_preprocess_stats = ImagePreprocessStats()
@@ -0,0 +1,53 @@
+import base64
+from app import db
+from app.models.chat import Conversation
+from app.services.jobs import job_queue, JobFailed
+from app.llm.service import LLMService
+
+
+@job_queue.handler('chat')
+def chat_job(user_id, payload):
+    """后台执行 /api/chat 的请求，参数同该接口"""
+    conversation = Conversation.query.filter_by(id=payload['conversation_id'], user_id=user_id).first()
+    if not conversation:
+        raise JobFailed('对话不存在或无权限访问')
+
+    llm_service = LLMService()
+    llm_service.set_user_id(user_id, payload.get('config_id'))
+    if not llm_service.config:
+        raise JobFailed('请先配置AI服务')
+
+    response = llm_service.chat(
+        payload['message'],
+        use_cache=payload.get('use_cache', True),
+        hedged=payload.get('hedged')
+    )
+    if not response or len(response.strip()) == 0:
+        raise JobFailed('AI服务返回空响应')
+
+    chat_history = llm_service.save_chat_reply(conversation, payload['message'], response)
+    db.session.commit()
+    return {
+        'response': response,
+        'history_id': chat_history.id,
+        'prompt_stats': llm_service.prompt_stats
+    }
+
+
+@job_queue.handler('analyze_image')
+def analyze_image_job(user_id, payload):
+    """后台执行 /wardrobe/analyze-image 的请求，图片以base64存放在payload中"""
+    llm_service = LLMService()
+    llm_service.set_user_id(user_id, payload.get('config_id'))
+    image_data = base64.b64decode(payload['image'])
+    result = llm_service.analyze_clothing_image(image_data, force_refresh=payload.get('force_refresh', False))
+    if 'error' in result:
+        raise JobFailed(result['error'])
+
+    llm_service.record_usage()
+    db.session.commit()
+    return {
+        'data': result,
+        'cached': llm_service.image_stats.get('cached', False),
+        'image_stats': llm_service.image_stats
+    }
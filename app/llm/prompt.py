@@ -0,0 +1,163 @@
+import math
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from app.services.wardrobe import WardrobeItem, format_wardrobe_info, format_wardrobe_item
+
+# CJK统一表意文字、假名、全角标点等，每个字符大约对应一个token
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+# 衣物类别在用户问题中的常见说法
+CATEGORY_KEYWORDS = {
+    'tops': ['上衣', '上装', '衬衫', 'T恤', '外套', '大衣', '毛衣', '卫衣', '夹克'],
+    'bottoms': ['裤', '裙', '下装'],
+    'shoes': ['鞋', '靴'],
+    'accessories': ['配饰', '围巾', '帽', '包', '手套', '首饰', '领带']
+}
+
+# 雨雪天气优先的衣物关键词
+WET_WEATHER_CONDITIONS = {'Rain', 'Drizzle', 'Thunderstorm', 'Snow'}
+WET_WEATHER_KEYWORDS = ['防水', '雨', '冲锋', '靴']
+
+DROPPED_ITEMS_NOTE = "\n（另有{dropped}件衣物与当前季节和天气相关度较低，已省略）\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """离线估算文本的token数
+
+    CJK字符按每字一个token计算，其余字符按约4个字符一个token计算，结果偏保守。
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_RE.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / 4)
+
+
+def current_season(latitude: Optional[float] = None, now: Optional[datetime] = None) -> str:
+    """根据月份返回当前季节，南半球季节相反"""
+    month = (now or datetime.now()).month
+    seasons = ['冬', '冬', '春', '春', '春', '夏', '夏', '夏', '秋', '秋', '秋', '冬']
+    season = seasons[month - 1]
+    if latitude is not None and latitude < 0:
+        season = {'春': '秋', '夏': '冬', '秋': '春', '冬': '夏'}[season]
+    return season
+
+
+def seasons_for_temperature(temperature: Optional[float]) -> Set[str]:
+    """根据气温推断适合的衣物季节"""
+    if temperature is None:
+        return set()
+    if temperature >= 26:
+        return {'夏'}
+    if temperature >= 18:
+        return {'春', '夏', '秋'}
+    if temperature >= 10:
+        return {'春', '秋'}
+    if temperature >= 0:
+        return {'秋', '冬'}
+    return {'冬'}
+
+
+def _score_item(item: WardrobeItem, question: str, season: str,
+                weather_seasons: Set[str], wet_weather: bool) -> int:
+    """计算衣物与当前季节、天气和用户问题的相关度"""
+    score = 0
+    if not item.seasons:
+        score += 1  # 未标注季节视为四季通用
+    else:
+        if season in item.seasons:
+            score += 3
+        if weather_seasons & set(item.seasons):
+            score += 2
+
+    if any(occasion in question for occasion in item.occasions):
+        score += 3
+    if any(keyword in question for keyword in CATEGORY_KEYWORDS.get(item.category, [])):
+        score += 2
+    if item.description and item.description in question:
+        score += 4
+    if wet_weather and any(keyword in item.description for keyword in WET_WEATHER_KEYWORDS):
+        score += 2
+    return score
+
+
+def _item_tokens(item: WardrobeItem) -> int:
+    """单件衣物这一行的token数，类别标题在 select_wardrobe_items 中按类别单独计算"""
+    return estimate_tokens(format_wardrobe_item(item))
+
+
+def select_wardrobe_items(items: List[WardrobeItem], question: str, season: str,
+                          weather_data: Optional[Dict], budget: int) -> Tuple[List[WardrobeItem], int]:
+    """按相关度选择衣物，使格式化后的衣橱信息不超过token预算
+
+    Returns:
+        tuple: (选中的衣物，保持原有顺序; 被省略的衣物数量)
+    """
+    weather_data = weather_data or {}
+    weather_seasons = seasons_for_temperature(weather_data.get('temperature'))
+    wet_weather = weather_data.get('condition') in WET_WEATHER_CONDITIONS
+
+    ranked = sorted(
+        enumerate(items),
+        key=lambda pair: -_score_item(pair[1], question, season, weather_seasons, wet_weather)
+    )
+
+    selected = []
+    used = 0
+    categories = set()
+    for index, item in ranked:
+        cost = _item_tokens(item)
+        # 新类别需要额外的类别标题
+        if item.category not in categories:
+            cost += estimate_tokens(f"\n【{item.category}】\n")
+        if used + cost > budget:
+            continue
+        used += cost
+        categories.add(item.category)
+        selected.append((index, item))
+
+    selected.sort(key=lambda pair: pair[0])
+    return [item for _, item in selected], len(items) - len(selected)
+
+
+def build_wardrobe_info(items: List[WardrobeItem], question: str, weather_data: Optional[Dict] = None,
+                        latitude: Optional[float] = None, budget: Optional[int] = None,
+                        full_text: Optional[str] = None) -> Tuple[str, dict]:
+    """构建prompt中的衣橱信息
+
+    Args:
+        items: 用户的全部衣物
+        question: 用户的问题
+        weather_data: weather_service.get_weather 的返回值
+        latitude: 用户所在纬度，用于判断南北半球季节
+        budget: 衣橱信息的token预算，为None时不限制
+        full_text: 已格式化的全部衣物信息，未超出预算时直接使用
+
+    Returns:
+        tuple: (衣橱信息文本, 统计信息)
+    """
+    full_text = full_text if full_text is not None else format_wardrobe_info(items)
+    full_tokens = estimate_tokens(full_text)
+    stats = {
+        'wardrobe_items': len(items),
+        'selected_items': len(items),
+        'dropped_items': 0,
+        'wardrobe_tokens': full_tokens
+    }
+    if budget is None or full_tokens <= budget:
+        return full_text, stats
+
+    season = current_season(latitude)
+    # 为省略说明预留token
+    note_tokens = estimate_tokens(DROPPED_ITEMS_NOTE.format(dropped=len(items)))
+    selected, dropped = select_wardrobe_items(items, question, season, weather_data, budget - note_tokens)
+    text = format_wardrobe_info(selected)
+    if dropped:
+        text += DROPPED_ITEMS_NOTE.format(dropped=dropped)
+    stats.update({
+        'selected_items': len(selected),
+        'dropped_items': dropped,
+        'wardrobe_tokens': estimate_tokens(text)
+    })
+    return text, stats
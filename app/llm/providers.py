@@ -0,0 +1,419 @@
+import asyncio
+import json
+from typing import Dict, Iterator, Optional, Type
+from flask import current_app
+from app.llm.base import BaseLLM, LLMError
+from app.llm.token_cache import baidu_token_cache
+from app.utils.http import http_pool, async_http_pool, service_url
+from app.utils.resilience import CircuitOpenError
+
+# 穿搭助手的系统提示词
+CHAT_SYSTEM_PROMPT = (
+    "# role\n"
+    "你是一个精通穿搭的时尚专家，熟悉各种风格的衣物搭配方法和技巧。对于配色、款式等搭配都有一套成熟的方法。\n"
+    "# situation\n"
+    "你面对的是不太了解穿搭的人群，他们只有最基本的审美，对于颜色应该如何搭配、款式应该如何选择，只有感觉上的判断，无法作出理论上的分析。而你懂得颜色和款式搭配的基本原理，知道哪些搭配是视觉上舒适的、符合大众审美的，哪些搭配是不应该采取的。\n"
+    "# task\n"
+    "你能够综合用户给出的天气、地理位置、衣橱中的衣物以及用户的自定义的要求，给出符合需求的建议，包括但不限于为用户提供穿搭建议，购买建议，以及其他任何相关的知识或者建议。"
+    "\n"
+)
+
+# 百度接口中表示access_token无效或过期的错误码
+BAIDU_TOKEN_ERROR_CODES = (110, 111)
+
+# 已注册的服务商，model_type -> 服务类
+PROVIDERS: Dict[str, Type[BaseLLM]] = {}
+
+def register_provider(cls: Type[BaseLLM]) -> Type[BaseLLM]:
+    """注册服务商类，作为类装饰器使用"""
+    PROVIDERS[cls.name] = cls
+    return cls
+
+def create_provider(config) -> Optional[BaseLLM]:
+    """根据 UserLLMConfig 创建对应的服务实例，不支持的类型返回None"""
+    provider_cls = PROVIDERS.get(config.model_type)
+    if not provider_cls:
+        return None
+    return provider_cls.from_config(config)
+
+
+class OpenAICompatibleLLM(BaseLLM):
+    """OpenAI兼容的 /chat/completions 接口
+
+    子类只需声明接口地址和模型，必要时覆盖请求头、请求体或响应解析。
+    """
+
+    api_url: str = None
+    vision_model: Optional[str] = None  # 支持图像识别的模型，为None时不支持
+    temperature = 0.7
+    max_tokens = 2000
+    image_max_tokens = 1000
+
+    def get_api_url(self) -> str:
+        return service_url(self.name, self.api_url)
+
+    def get_headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def build_payload(self, messages: list, model: Optional[str] = None,
+                      max_tokens: Optional[int] = None, stream: bool = False) -> dict:
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": max_tokens or self.max_tokens,
+            "stream": stream
+        }
+
+    def build_chat_payload(self, prompt: str, stream: bool = False) -> dict:
+        messages = [
+            {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        return self.build_payload(messages, stream=stream)
+
+    def build_image_payload(self, system_prompt: str, user_prompt: str, image_base64: str,
+                            mimetype: str = 'image/jpeg', stream: bool = False) -> dict:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": user_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:{mimetype};base64,{image_base64}"}
+                    }
+                ]
+            }
+        ]
+        return self.build_payload(messages, model=self.vision_model, max_tokens=self.image_max_tokens, stream=stream)
+
+    def parse_response(self, data: dict) -> str:
+        """从响应体中提取回复文本，同时记录token用量"""
+        self.last_usage = self.parse_usage(data)
+        return data['choices'][0]['message']['content']
+
+    def status_error(self, status_code: int) -> LLMError:
+        """HTTP状态码非200时返回的异常"""
+        return LLMError(f"AI服务请求失败，状态码：{status_code}")
+
+    def _post(self, payload: dict) -> str:
+        with self.limit():
+            return self._send(payload)
+
+    def _send(self, payload: dict) -> str:
+        try:
+            response = http_pool.post(self.name, self.get_api_url(), headers=self.get_headers(), json=payload)
+            if response.status_code != 200:
+                current_app.logger.error(f"{self.display_name} API error: {response.text}")
+                raise self.status_error(response.status_code)
+            return self.parse_response(response.json())
+        except LLMError:
+            raise
+        except CircuitOpenError as e:
+            current_app.logger.warning(f"{self.display_name} API skipped: {str(e)}")
+            raise LLMError("AI服务暂时不可用，请稍后再试") from e
+        except Exception as e:
+            current_app.logger.error(f"Error calling {self.display_name} API: {str(e)}")
+            raise LLMError("调用AI服务时发生错误") from e
+
+    async def _apost(self, payload: dict) -> str:
+        async with self.alimit():
+            return await self._asend(payload)
+
+    async def _asend(self, payload: dict) -> str:
+        try:
+            response = await async_http_pool.post(self.name, self.get_api_url(), headers=self.get_headers(), json=payload)
+            if response.status_code != 200:
+                current_app.logger.error(f"{self.display_name} API error: {response.text}")
+                raise self.status_error(response.status_code)
+            return self.parse_response(response.json())
+        except LLMError:
+            raise
+        except CircuitOpenError as e:
+            current_app.logger.warning(f"{self.display_name} API skipped: {str(e)}")
+            raise LLMError("AI服务暂时不可用，请稍后再试") from e
+        except Exception as e:
+            current_app.logger.error(f"Error calling {self.display_name} API: {str(e)}")
+            raise LLMError("调用AI服务时发生错误") from e
+
+    def chat(self, prompt: str) -> str:
+        return self._post(self.build_chat_payload(prompt))
+
+    async def achat(self, prompt: str) -> str:
+        return await self._apost(self.build_chat_payload(prompt))
+
+    def stream_chat(self, prompt: str) -> Iterator[str]:
+        """以SSE方式调用接口，逐段产出回复文本，读取完整个流后才释放并发名额"""
+        with self.limit():
+            yield from self._stream(self.build_chat_payload(prompt, stream=True))
+
+    def _stream(self, payload: dict) -> Iterator[str]:
+        """发送stream为True的请求并逐段产出回复文本，调用方提前关闭生成器时同时关闭连接"""
+        try:
+            response = http_pool.post(self.name, self.get_api_url(), headers=self.get_headers(), json=payload, stream=True)
+        except CircuitOpenError as e:
+            current_app.logger.warning(f"{self.display_name} stream API skipped: {str(e)}")
+            raise LLMError("AI服务暂时不可用，请稍后再试") from e
+        except Exception as e:
+            current_app.logger.error(f"Error calling {self.display_name} stream API: {str(e)}")
+            raise LLMError("调用AI服务时发生错误") from e
+
+        try:
+            if response.status_code != 200:
+                current_app.logger.error(f"{self.display_name} stream API error: {response.text}")
+                raise self.status_error(response.status_code)
+
+            # text/event-stream 未声明编码时requests会按ISO-8859-1解码
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                # 跳过空行和注释行（如OpenRouter的": OPENROUTER PROCESSING"）
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                self.check_stream_chunk(chunk)
+                if chunk.get('usage'):
+                    # 用量通常在最后一个数据块中返回
+                    self.last_usage = self.parse_usage(chunk)
+                choices = chunk.get('choices') or []
+                if not choices:
+                    continue
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield content
+        except LLMError:
+            raise
+        except CircuitOpenError as e:
+            current_app.logger.warning(f"{self.display_name} API skipped: {str(e)}")
+            raise LLMError("AI服务暂时不可用，请稍后再试") from e
+        except Exception as e:
+            current_app.logger.error(f"Error reading {self.display_name} stream: {str(e)}")
+            raise LLMError("调用AI服务时发生错误") from e
+        finally:
+            response.close()
+
+    def check_stream_chunk(self, chunk: dict):
+        """检查流中的单个数据块，发现错误时抛出LLMError"""
+        pass
+
+    def analyze_image(self, system_prompt: str, user_prompt: str, image_base64: str,
+                      mimetype: str = 'image/jpeg') -> str:
+        if not self.vision_model:
+            return super().analyze_image(system_prompt, user_prompt, image_base64, mimetype)
+        return self._post(self.build_image_payload(system_prompt, user_prompt, image_base64, mimetype))
+
+    def stream_image(self, system_prompt: str, user_prompt: str, image_base64: str,
+                     mimetype: str = 'image/jpeg') -> Iterator[str]:
+        if not self.vision_model:
+            yield from super().stream_image(system_prompt, user_prompt, image_base64, mimetype)
+            return
+        with self.limit():
+            yield from self._stream(self.build_image_payload(system_prompt, user_prompt, image_base64, mimetype,
+                                                             stream=True))
+
+    async def aanalyze_image(self, system_prompt: str, user_prompt: str, image_base64: str,
+                             mimetype: str = 'image/jpeg') -> str:
+        if not self.vision_model:
+            return await super().aanalyze_image(system_prompt, user_prompt, image_base64, mimetype)
+        return await self._apost(self.build_image_payload(system_prompt, user_prompt, image_base64, mimetype))
+
+
+@register_provider
+class XunfeiLLM(OpenAICompatibleLLM):
+    """讯飞星火"""
+
+    name = 'xunfei'
+    display_name = 'Xunfei'
+    api_url = "https://spark-api-open.xf-yun.com/v1/chat/completions"
+    model = "lite"
+
+    def validate(self) -> Optional[str]:
+        if not self.api_key or not self.app_id:
+            return "请先完成API配置（需要API Key和AppID）"
+        return None
+
+    def get_headers(self) -> dict:
+        # 讯飞HTTP接口使用APIPassword（存放在app_id字段）鉴权
+        return {
+            "Authorization": f"Bearer {self.app_id}",
+            "Content-Type": "application/json"
+        }
+
+    def build_payload(self, messages: list, model: Optional[str] = None,
+                      max_tokens: Optional[int] = None, stream: bool = False) -> dict:
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "stream": stream
+        }
+
+    def parse_response(self, data: dict) -> str:
+        if data['code'] != 0:
+            raise LLMError(f"AI服务请求失败，错误码：{data['code']}")
+        return super().parse_response(data)
+
+    def status_error(self, status_code: int) -> LLMError:
+        return LLMError(f"http请求错误, {status_code}")
+
+    def check_stream_chunk(self, chunk: dict):
+        if chunk.get('code'):
+            raise LLMError(f"AI服务请求失败，错误码：{chunk['code']}")
+
+
+@register_provider
+class SiliconLLM(OpenAICompatibleLLM):
+    """硅基流动"""
+
+    name = 'silicon'
+    display_name = 'Silicon'
+    api_url = "https://api.siliconflow.cn/v1/chat/completions"
+    model = "Qwen/Qwen3-8B"
+
+    def get_api_url(self) -> str:
+        return self.api_base if self.api_base else service_url(self.name, self.api_url)
+
+
+@register_provider
+class OpenRouterLLM(OpenAICompatibleLLM):
+    """OpenRouter"""
+
+    name = 'openrouter'
+    display_name = 'OpenRouter'
+    api_url = "https://openrouter.ai/api/v1/chat/completions"
+    model = "deepseek/deepseek-chat-v3-0324:free"  # 可以根据需要选择模型
+    vision_model = "qwen/qwen2.5-vl-72b-instruct:free"  # 使用支持视觉的模型
+
+    def get_headers(self) -> dict:
+        headers = super().get_headers()
+        # headers["HTTP-Referer"] = "https://outfit-assistant.example.com"  # 根据OpenRouter要求添加
+        # headers["X-Title"] = "Outfit Assistant"  # 可选的应用名称
+        return headers
+
+
+@register_provider
+class BaiduLLM(BaseLLM):
+    """百度文心一言"""
+
+    name = 'baidu'
+    display_name = 'Baidu'
+    model = "ernie-bot"
+    token_url = "https://aip.baidubce.com/oauth/2.0/token"
+    api_url = "https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/completions"
+
+    def validate(self) -> Optional[str]:
+        if not self.api_key or not self.api_secret:
+            return "请先完成API配置（需要API Key和Secret Key）"
+        return None
+
+    def get_api_url(self) -> str:
+        return service_url(self.name, self.api_url)
+
+    @property
+    def _token_key(self) -> str:
+        return baidu_token_cache.make_key(self.api_key, self.api_secret)
+
+    def _fetch_access_token(self):
+        """从百度OAuth接口获取新的access_token
+
+        Returns:
+            tuple: (access_token, expires_in)，失败时返回 (None, None)
+        """
+        params = {
+            'grant_type': 'client_credentials',
+            'client_id': self.api_key,
+            'client_secret': self.api_secret
+        }
+
+        try:
+            response = http_pool.post(self.name, service_url('baidu-token', self.token_url), params=params)
+            if response.status_code == 200:
+                data = response.json()
+                return data.get('access_token'), data.get('expires_in')
+            current_app.logger.error(f"Baidu API token error: {response.text}")
+            return None, None
+        except Exception as e:
+            current_app.logger.error(f"Error getting Baidu access token: {str(e)}")
+            return None, None
+
+    def get_access_token(self) -> str:
+        """获取百度API的access_token（优先使用缓存，令牌有效期约30天）"""
+        access_token = baidu_token_cache.get(self._token_key, self._fetch_access_token)
+        if not access_token:
+            raise LLMError("无法连接到百度服务，请检查API配置")
+        return access_token
+
+    async def aget_access_token(self) -> str:
+        """异步获取access_token，缓存未命中时在线程池中刷新以免阻塞事件循环"""
+        access_token = baidu_token_cache.peek(self._token_key)
+        if access_token:
+            return access_token
+        return await asyncio.to_thread(self.get_access_token)
+
+    def build_payload(self, prompt: str) -> dict:
+        return {
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 2000
+        }
+
+    def parse_response(self, data: dict) -> str:
+        if data.get('error_code') in BAIDU_TOKEN_ERROR_CODES:
+            # 缓存的令牌已失效，清除后下次请求会重新获取
+            baidu_token_cache.invalidate(self._token_key)
+            current_app.logger.warning(f"Baidu access token rejected: {data.get('error_msg')}")
+            raise LLMError("AI服务暂时不可用，请稍后再试")
+        self.last_usage = self.parse_usage(data)
+        return data.get('result', '未获取到有效回复')
+
+    def chat(self, prompt: str) -> str:
+        access_token = self.get_access_token()
+        with self.limit():
+            return self._send(prompt, access_token)
+
+    def _send(self, prompt: str, access_token: str) -> str:
+        try:
+            response = http_pool.post(self.name, self.get_api_url(), params={'access_token': access_token},
+                                      json=self.build_payload(prompt))
+            if response.status_code == 200:
+                return self.parse_response(response.json())
+            current_app.logger.error(f"Baidu API error: {response.text}")
+            raise LLMError("AI服务暂时不可用，请稍后再试")
+        except LLMError:
+            raise
+        except CircuitOpenError as e:
+            current_app.logger.warning(f"{self.display_name} API skipped: {str(e)}")
+            raise LLMError("AI服务暂时不可用，请稍后再试") from e
+        except Exception as e:
+            current_app.logger.error(f"Error calling Baidu API: {str(e)}")
+            raise LLMError("调用AI服务时发生错误") from e
+
+    async def achat(self, prompt: str) -> str:
+        access_token = await self.aget_access_token()
+        async with self.alimit():
+            return await self._asend(prompt, access_token)
+
+    async def _asend(self, prompt: str, access_token: str) -> str:
+        try:
+            response = await async_http_pool.post(self.name, self.get_api_url(), params={'access_token': access_token},
+                                                  json=self.build_payload(prompt))
+            if response.status_code == 200:
+                return self.parse_response(response.json())
+            current_app.logger.error(f"Baidu API error: {response.text}")
+            raise LLMError("AI服务暂时不可用，请稍后再试")
+        except LLMError:
+            raise
+        except CircuitOpenError as e:
+            current_app.logger.warning(f"{self.display_name} API skipped: {str(e)}")
+            raise LLMError("AI服务暂时不可用，请稍后再试") from e
+        except Exception as e:
+            current_app.logger.error(f"Error calling Baidu API: {str(e)}")
+            raise LLMError("调用AI服务时发生错误") from e
@@ -1,20 +1,53 @@
-import requests
-import json
-import time
-import hashlib
 import base64
-import hmac
-from urllib.parse import urlparse
+import hashlib
+from contextlib import closing
 from datetime import datetime
 from flask import current_app
 from app import db
-from app.models import UserLLMConfig, UserLocation, Clothing
-from app.services import weather_service, location_service
+from app.models import UserLocation
+from app.models.cache import ImageAnalysisCache
+from app.models.chat import ChatHistory, UsageStats
+from app.services import weather_service, forecast_service, location_service, wardrobe_context, llm_config_cache
+from app.llm.base import LLMError
+from app.llm.providers import create_provider
+from app.llm.cache import response_cache
+from app.llm.prompt import build_wardrobe_info, estimate_tokens
+from app.llm.dispatch import hedged_call
+from app.llm.image import prepare_image, image_preprocess_stats
+from app.utils.http import run_async
+from app.utils.json_stream import IncrementalJSONParser, extract_json_object
+from app.utils.singleflight import single_flight
+
+# 衣物图片识别的系统提示词
+IMAGE_SYSTEM_PROMPT = """
+## role 
+你是一个服装从业者，熟悉服装的款式、颜色、材料等。
+
+## task
+当用户提供给你一张包含衣物服饰的图片时，你需要识别其中的服装的种类、颜色、款式、适合季节、适用场合。然后将这些信息以json的格式输出，例如：
+{
+"description": "珍珠白褶皱雪纺衬衫",
+"season":  ["春", "夏"],
+"occasion": ["日常"]
+}
+其中，occasion仅从['日常', '工作', '运动', '正式', '休闲', '派对']中选择，season仅从["春", "夏", "秋", "冬"]中选择。
+"""
+IMAGE_USER_PROMPT = "请分析这张衣物图片，并以JSON格式返回描述、适用季节和场合信息。"
+# 识别结果的JSON字段 -> 返回结果中的字段名
+IMAGE_RESULT_FIELDS = {
+    'description': 'description',
+    'season': 'seasons',
+    'occasion': 'occasions'
+}
 
 class LLMService:
     def __init__(self):
         self.user_id = None
         self.config = None
+        self.prompt_stats = {}  # 最近一次构建prompt的统计信息
+        self.last_usage = {}  # 最近一次调用的token用量，命中缓存时为空
+        self.used_config = None  # 最近一次实际返回结果的配置（对冲或故障转移时可能不是self.config）
+        self.image_stats = {}  # 最近一次图片预处理的体积统计
 
     def set_user_id(self, user_id, config_id=None):
         """设置用户ID并加载配置
@@ -23,261 +56,33 @@ class LLMService:
             config_id: 可选，指定使用的配置ID。如果未提供，优先使用默认配置，其次使用第一个活跃配置
         """
         self.user_id = user_id
-        if config_id:
-            self.config = UserLLMConfig.query.filter_by(
-                id=config_id,
-                user_id=user_id,
-                is_active=True
-            ).first()
-        else:
-            # 优先尝试获取默认配置
-            self.config = UserLLMConfig.query.filter_by(
-                user_id=user_id,
-                is_active=True,
-                is_default=True
-            ).first()
-            
-            # 如果没有默认配置，使用第一个活跃配置
-            if not self.config:
-                self.config = UserLLMConfig.query.filter_by(
-                    user_id=user_id,
-                    is_active=True
-                ).first()
-
-    def _format_wardrobe_info(self, clothing_items):
-        """格式化衣橱信息"""
-        if not clothing_items:
-            return "暂无衣物信息"
-            
-        wardrobe_by_category = {}
-        for item in clothing_items:
-            if item.category not in wardrobe_by_category:
-                wardrobe_by_category[item.category] = []
-            wardrobe_by_category[item.category].append(item)
-        
-        wardrobe_str = ""
-        for category, items in wardrobe_by_category.items():
-            wardrobe_str += f"\n【{category}】\n"
-            for item in items:
-                wardrobe_str += f"- {item.description}"
-                if item.seasons_list:
-                    wardrobe_str += f" (适用季节: {','.join(item.seasons_list)})"
-                if item.occasions_list:
-                    wardrobe_str += f" (适用场合: {','.join(item.occasions_list)})"
-                wardrobe_str += "\n"
-        
-        return wardrobe_str
-
-    def _get_baidu_access_token(self):
-        """获取百度API的access_token"""
-        url = "https://aip.baidubce.com/oauth/2.0/token"
-        params = {
-            'grant_type': 'client_credentials',
-            'client_id': self.config.api_key,
-            'client_secret': self.config.api_secret
-        }
-        
-        try:
-            response = requests.post(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('access_token')
-            current_app.logger.error(f"Baidu API token error: {response.text}")
-            return None
-        except Exception as e:
-            current_app.logger.error(f"Error getting Baidu access token: {str(e)}")
-            return None
+        # 按用户缓存的配置快照，配置保存时失效
+        self.config = llm_config_cache.get_config(user_id, config_id)
 
-    def _call_baidu_api(self, prompt):
-        """调用百度文心一言API"""
-        if not self.config or not self.config.api_key or not self.config.api_secret:
-            return "请先完成API配置（需要API Key和Secret Key）"
-            
-        access_token = self._get_baidu_access_token()
-        if not access_token:
-            return "无法连接到百度服务，请检查API配置"
-            
-        url = f"https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/completions?access_token={access_token}"
-        
-        payload = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000
-        }
-        
-        try:
-            response = requests.post(url, json=payload)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('result', '未获取到有效回复')
-            current_app.logger.error(f"Baidu API error: {response.text}")
-            return "AI服务暂时不可用，请稍后再试"
-        except Exception as e:
-            current_app.logger.error(f"Error calling Baidu API: {str(e)}")
-            return "调用AI服务时发生错误"
+    def get_provider(self, config=None):
+        """根据配置创建服务商实例
 
-    def _call_xunfei_api(self, prompt):
-        """调用讯飞星火API"""
-        if not self.config or not self.config.api_key or not self.config.app_id:
-            return "请先完成API配置（需要API Key和AppID）"
-            
-        api_url = "https://spark-api-open.xf-yun.com/v1/chat/completions"
-        host = "spark-api.xf-yun.com"
-        
-        try:
-                        
-            headers = {
-                "Authorization": f"Bearer {self.config.app_id}",
-                "Content-Type": "application/json",
-                # "host": host
-            }
-            
-            data = {
-                "model": "lite",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": (
-                            "# role\n"
-                            "你是一个精通穿搭的时尚专家，熟悉各种风格的衣物搭配方法和技巧。对于配色、款式等搭配都有一套成熟的方法。\n"
-                            "# situation\n"
-                            "你面对的是不太了解穿搭的人群，他们只有最基本的审美，对于颜色应该如何搭配、款式应该如何选择，只有感觉上的判断，无法作出理论上的分析。而你懂得颜色和款式搭配的基本原理，知道哪些搭配是视觉上舒适的、符合大众审美的，哪些搭配是不应该采取的。\n"
-                            "# task\n"
-                            "你能够综合用户给出的天气、地理位置、衣橱中的衣物以及用户的自定义的要求，给出符合需求的建议，包括但不限于为用户提供穿搭建议，购买建议，以及其他任何相关的知识或者建议。"
-                            "\n"
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "stream": False
-            }
-            
-            response = requests.post(api_url, headers=headers, json=data)
-            if response.status_code == 200:
-                data = response.json()
-                if data['code'] == 0:
-                    return data['choices'][0]['message']['content']
-                else:
-                    return f"AI服务请求失败，错误码：{data['code']}"
-            current_app.logger.error(f"Xunfei API error: {response.text}")
-            return f"http请求错误, {response.status_code}"
-        except Exception as e:
-            current_app.logger.error(f"Error calling Xunfei API: {str(e)}")
-            return "调用AI服务时发生错误"
+        Raises:
+            LLMError: 服务类型不支持或配置不完整
+        """
+        config = config or self.config
+        if not config:
+            raise LLMError("请先配置AI服务")
+        provider = create_provider(config)
+        if not provider:
+            raise LLMError("不支持的AI服务类型")
+        error = provider.validate()
+        if error:
+            raise LLMError(error)
+        provider.user_id = self.user_id
+        return provider
 
-    def _call_silicon_api(self, prompt):
-        """调用硅基流动API"""
-        if not self.config or not self.config.api_key:
-            return "请先完成API配置（需要API Key）"
-            
-        api_url = self.config.api_base if self.config.api_base else "https://api.siliconflow.cn/v1/chat/completions"
-        
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.config.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "Qwen/Qwen3-8B",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": (
-                            "# role\n"
-                            "你是一个精通穿搭的时尚专家，熟悉各种风格的衣物搭配方法和技巧。对于配色、款式等搭配都有一套成熟的方法。\n"
-                            "# situation\n"
-                            "你面对的是不太了解穿搭的人群，他们只有最基本的审美，对于颜色应该如何搭配、款式应该如何选择，只有感觉上的判断，无法作出理论上的分析。而你懂得颜色和款式搭配的基本原理，知道哪些搭配是视觉上舒适的、符合大众审美的，哪些搭配是不应该采取的。\n"
-                            "# task\n"
-                            "你能够综合用户给出的天气、地理位置、衣橱中的衣物以及用户的自定义的要求，给出符合需求的建议，包括但不限于为用户提供穿搭建议，购买建议，以及其他任何相关的知识或者建议。"
-                            "\n"
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
-            
-            response = requests.post(api_url, headers=headers, json=data)
-            if response.status_code == 200:                
-                data = response.json()
-                return data['choices'][0]['message']['content']
-            current_app.logger.error(f"Silicon API error: {response.text}")
-            return f"AI服务请求失败，状态码：{response.status_code}"
-        except Exception as e:
-            current_app.logger.error(f"Error calling Silicon API: {str(e)}")
-            return "调用AI服务时发生错误"
-            
-    def _call_openrouter_api(self, prompt):
-        """调用OpenRouter API"""
-        if not self.config or not self.config.api_key:
-            return "请先完成API配置（需要API Key）"
-            
-        api_url = "https://openrouter.ai/api/v1/chat/completions"
-        
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.config.api_key}",
-                "Content-Type": "application/json",
-                # "HTTP-Referer": "https://outfit-assistant.example.com",  # 根据OpenRouter要求添加
-                # "X-Title": "Outfit Assistant"  # 可选的应用名称
-            }
-            
-            data = {
-                "model": "deepseek/deepseek-chat-v3-0324:free",  # 可以根据需要选择模型
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": (
-                            "# role\n"
-                            "你是一个精通穿搭的时尚专家，熟悉各种风格的衣物搭配方法和技巧。对于配色、款式等搭配都有一套成熟的方法。\n"
-                            "# situation\n"
-                            "你面对的是不太了解穿搭的人群，他们只有最基本的审美，对于颜色应该如何搭配、款式应该如何选择，只有感觉上的判断，无法作出理论上的分析。而你懂得颜色和款式搭配的基本原理，知道哪些搭配是视觉上舒适的、符合大众审美的，哪些搭配是不应该采取的。\n"
-                            "# task\n"
-                            "你能够综合用户给出的天气、地理位置、衣橱中的衣物以及用户的自定义的要求，给出符合需求的建议，包括但不限于为用户提供穿搭建议，购买建议，以及其他任何相关的知识或者建议。"
-                            "\n"
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
-            
-            response = requests.post(api_url, headers=headers, json=data)
-            if response.status_code == 200:
-                data = response.json()
-                return data['choices'][0]['message']['content']
-            current_app.logger.error(f"OpenRouter API error: {response.text}")
-            return f"AI服务请求失败，状态码：{response.status_code}"
-        except Exception as e:
-            current_app.logger.error(f"Error calling OpenRouter API: {str(e)}")
-            return "调用AI服务时发生错误"
-    
-    def chat(self, prompt):
-        """集成天气和位置信息的聊天接口"""
-        if not self.config:
-            return "请先配置AI服务"
-            
-        # 获取用户衣橱信息
-        clothing_items = Clothing.query.filter_by(user_id=self.user_id).all()
-        wardrobe_info = self._format_wardrobe_info(clothing_items)
-        
+    def _build_full_prompt(self, prompt):
+        """结合衣橱、位置、天气和问题涉及时段的天气预报构建完整prompt
+
+        衣物较多时按 LLM_WARDROBE_TOKEN_BUDGET 选择与季节、天气和问题最相关的衣物，
+        统计信息记录在 self.prompt_stats 中。
+        """
         # 获取用户位置
         user_location = UserLocation.query.filter_by(user_id=self.user_id).first()
         
@@ -290,13 +95,40 @@ class LLMService:
                 user_location.city
             )
         
+        # 获取用户衣橱信息（按用户缓存，衣物变更时重建）
+        wardrobe_items, wardrobe_text = wardrobe_context.get_wardrobe(self.user_id)
+        wardrobe_info, self.prompt_stats = build_wardrobe_info(
+            wardrobe_items,
+            prompt,
+            weather_data=weather_data,
+            latitude=user_location.latitude if user_location else None,
+            budget=current_app.config.get('LLM_WARDROBE_TOKEN_BUDGET', 2000),
+            full_text=wardrobe_text
+        )
+        if self.prompt_stats['dropped_items']:
+            current_app.logger.info(
+                f"Wardrobe prompt for user {self.user_id} trimmed: "
+                f"{self.prompt_stats['dropped_items']}/{self.prompt_stats['wardrobe_items']} items dropped"
+            )
+        
         # 格式化信息
         location_info = location_service.format_location_for_prompt(
             user_location if user_location else None
         )
         weather_info = weather_service.format_weather_for_prompt(weather_data) if weather_data else "天气信息暂不可用"
-       
-        
+
+        # 从缓存的逐时预报中截取问题涉及的时段
+        forecast_info = ""
+        if user_location and forecast_service.enabled():
+            forecast = forecast_service.get_forecast(
+                user_location.latitude,
+                user_location.longitude,
+                user_location.city
+            )
+            forecast_info = forecast_service.format_forecast_for_prompt(forecast, prompt)
+        if forecast_info:
+            weather_info += f"\n天气预报：\n{forecast_info}"
+
         # 构建完整prompt
         full_prompt = (
             f"当前地点：{location_info}\n"
@@ -304,24 +136,232 @@ class LLMService:
             f"衣橱中的衣物：\n{wardrobe_info}\n\n"
             f"{prompt}\n\n"
         )
-        
-        # 根据配置的模型类型调用相应的API
-        if self.config.model_type == 'baidu':
-            return self._call_baidu_api(full_prompt)
-        elif self.config.model_type == 'xunfei':
-            return self._call_xunfei_api(full_prompt)
-        elif self.config.model_type == 'silicon':
-            return self._call_silicon_api(full_prompt)
-        elif self.config.model_type == 'openrouter':
-            return self._call_openrouter_api(full_prompt)
-        else:
-            return "不支持的AI服务类型"
+        self.prompt_stats['prompt_tokens'] = estimate_tokens(full_prompt)
+        return full_prompt
+    
+    def get_fallback_configs(self):
+        """获取除当前配置外的其他活跃配置，默认配置优先"""
+        if not self.config:
+            return []
+        return [
+            config for config in llm_config_cache.get_active_configs(self.user_id)
+            if config.id != self.config.id
+        ]
+
+    def _get_candidates(self, hedged=None):
+        """获取候选服务商列表 [(配置, 服务实例)]，第一个为当前配置
+
+        Args:
+            hedged: 是否加入其他活跃配置作为对冲/故障转移候选，为None时按 LLM_DISPATCH_MODE 配置决定
+        """
+        if hedged is None:
+            hedged = current_app.config.get('LLM_DISPATCH_MODE', 'single') == 'hedged'
+
+        candidates = [(self.config, self.get_provider())]
+        if hedged:
+            for config in self.get_fallback_configs():
+                try:
+                    candidates.append((config, self.get_provider(config)))
+                except LLMError:
+                    # 跳过不完整或不支持的配置
+                    continue
+        return candidates
+
+    async def _dispatch(self, candidates, full_prompt):
+        """在事件循环中对候选服务商发起对冲请求"""
+        calls = [lambda provider=provider: provider.achat(full_prompt) for _, provider in candidates]
+        index, response = await hedged_call(calls, current_app.config.get('LLM_HEDGE_DELAY', 3.0))
+        config, provider = candidates[index]
+        self.used_config = config
+        self.last_usage = provider.get_usage()
+        return response
+
+    def _flight_key(self, candidates, full_prompt):
+        """并发合并的键，候选配置不同的请求不合并"""
+        config_ids = ','.join(str(config.id) for config, _ in candidates)
+        raw = '\x00'.join([str(self.user_id), config_ids, full_prompt])
+        return 'chat:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _cache_key(self, provider, full_prompt, use_cache):
+        """返回回复缓存键，缓存未启用或本次请求跳过缓存时返回None"""
+        if not use_cache or not response_cache.enabled:
+            return None
+        return response_cache.make_key(provider.name, provider.model, full_prompt)
+
+    def _cache_response(self, candidates, full_prompt, use_cache, response):
+        """以实际回复的配置（used_config）写入回复缓存
+
+        对冲请求由备用配置回复时，回复缓存在备用配置的键下，不会被当作首选配置的回复返回。
+        """
+        provider = next(p for config, p in candidates if config.id == self.used_config.id)
+        cache_key = self._cache_key(provider, full_prompt, use_cache)
+        if cache_key:
+            response_cache.set(cache_key, response)
+
+    def chat(self, prompt, use_cache=True, hedged=None):
+        """集成天气和位置信息的聊天接口
+
+        Args:
+            prompt: 用户消息
+            use_cache: 为False时跳过回复缓存，强制调用AI服务
+            hedged: 是否启用对冲请求。启用后若当前配置在 LLM_HEDGE_DELAY 秒内未返回，
+                    或调用失败，则依次调用用户的其他活跃配置，返回最先成功的结果
+        """
+        self.last_usage = {}
+        try:
+            candidates = self._get_candidates(hedged)
+            full_prompt = self._build_full_prompt(prompt)
+            cache_key = self._cache_key(candidates[0][1], full_prompt, use_cache)
+            if cache_key:
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+            def call():
+                if len(candidates) > 1:
+                    response = run_async(self._dispatch(candidates, full_prompt))
+                else:
+                    config, provider = candidates[0]
+                    response = provider.chat(full_prompt)
+                    self.used_config = config
+                    self.last_usage = provider.get_usage()
+                self._cache_response(candidates, full_prompt, use_cache, response)
+                return response, self.used_config.id
+
+            # 相同用户、配置和prompt的并发请求（如重复点击发送）只调用一次AI服务
+            (response, config_id), shared = single_flight.do(
+                self._flight_key(candidates, full_prompt), call
+            )
+            if shared:
+                # 用量已由实际调用的请求记录
+                self.used_config = llm_config_cache.get_config(self.user_id, config_id)
+            return response
+        except LLMError as e:
+            return str(e)
+
+    async def achat(self, prompt, use_cache=True, hedged=None):
+        """异步聊天接口，外部API调用不阻塞事件循环
+
+        衣橱、位置和天气信息仍在当前线程中同步读取。参数同 chat。
+        """
+        self.last_usage = {}
+        try:
+            candidates = self._get_candidates(hedged)
+            full_prompt = self._build_full_prompt(prompt)
+            cache_key = self._cache_key(candidates[0][1], full_prompt, use_cache)
+            if cache_key:
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            response = await self._dispatch(candidates, full_prompt)
+            self._cache_response(candidates, full_prompt, use_cache, response)
+            return response
+        except LLMError as e:
+            return str(e)
+
+    def chat_stream(self, prompt, use_cache=True, hedged=None):
+        """流式聊天接口，逐段产出AI回复文本
+
+        OpenAI兼容的服务商（硅基流动、OpenRouter、讯飞）使用 stream 模式逐字返回，
+        百度接口一次性返回完整回复。命中缓存时一次性返回缓存的回复。
+        启用 hedged 时，若某个服务商在返回首段内容前失败，则切换到下一个活跃配置。
+
+        Raises:
+            LLMError: 配置无效或调用失败
+        """
+        self.last_usage = {}
+        candidates = self._get_candidates(hedged)
+        full_prompt = self._build_full_prompt(prompt)
+        cache_key = self._cache_key(candidates[0][1], full_prompt, use_cache)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        for index, (config, provider) in enumerate(candidates):
+            chunks = []
+            try:
+                for chunk in provider.stream_chat(full_prompt):
+                    chunks.append(chunk)
+                    yield chunk
+            except LLMError as e:
+                # 已输出部分内容或没有其他候选时无法切换
+                if chunks or index == len(candidates) - 1:
+                    raise
+                current_app.logger.warning(f"LLM stream candidate {config.model_type} failed, failing over: {e}")
+                continue
+
+            self.used_config = config
+            self.last_usage = provider.get_usage()
+            # 完整读取流后才写入缓存，中途断开的回复不缓存
+            self._cache_response(candidates, full_prompt, use_cache, ''.join(chunks))
+            return
+
+    def _parse_image_result(self, result, data=None):
+        """从模型输出中解析衣物信息
+
+        Args:
+            result: 模型输出的文本
+            data: 可选，流式读取时已解析出的JSON对象
+        """
+        try:
+            # 查找JSON部分，可能被包含在其他文本中
+            if data is None:
+                data = extract_json_object(result, IMAGE_RESULT_FIELDS)
+            if data is not None:
+                # 标准化结果格式
+                return {
+                    "description": data.get("description", "未识别的衣物"),
+                    "seasons": data.get("season", []),
+                    "occasions": data.get("occasion", [])
+                }
+            else:
+                return {"error": "无法从AI响应中解析出JSON数据"}
+        except Exception as e:
+            current_app.logger.error(f"解析AI响应时出错: {str(e)}, 原始响应: {result}")
+            return {"error": f"解析AI响应时出错: {str(e)}"}
     
-    def analyze_clothing_image(self, image_data):
+    def record_usage(self):
+        """将最近一次调用的用量累加到用户和服务商的统计中，随调用方的事务一起提交"""
+        config = self.used_config or self.config
+        if config and self.last_usage:
+            UsageStats.record(self.user_id, config.model_type, self.last_usage)
+
+    def save_chat_reply(self, conversation, user_message, response):
+        """保存一轮对话并累加用量，随调用方的事务一起提交
+
+        Returns:
+            ChatHistory: 新建的聊天记录
+        """
+        usage = self.last_usage
+        chat_history = ChatHistory(
+            user_id=self.user_id,
+            conversation_id=conversation.id,
+            user_message=user_message,
+            ai_response=response,
+            message_type='chat',
+            provider=(self.used_config or self.config).model_type,
+            tokens_used=usage.get('total_tokens'),
+            prompt_tokens=usage.get('prompt_tokens'),
+            completion_tokens=usage.get('completion_tokens')
+        )
+        db.session.add(chat_history)
+        self.record_usage()
+        # 更新对话的最后更新时间
+        conversation.updated_at = datetime.utcnow()
+        return chat_history
+
+    def analyze_clothing_image(self, image_data, force_refresh=False, on_field=None):
         """分析衣物图片并返回识别结果
+
+        以流式方式调用视觉模型，解析出包含全部字段的JSON对象后立即停止读取。
         
         Args:
             image_data: 二进制图片数据
+            force_refresh: 为True时忽略已缓存的识别结果，重新调用模型
+            on_field: 可选，回调函数 on_field(字段名, 值)，流式识别时每个字段完整后立即调用，
+                      字段名为 description、seasons 或 occasions；命中缓存或合并到其他请求时不调用
             
         Returns:
             dict: 包含解析后的衣物信息，如description, seasons, occasions
@@ -329,221 +369,92 @@ class LLMService:
         if not self.config:
             return {"error": "请先配置AI服务"}
             
-        # 将图片转换为base64编码
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        
-        # 准备提示词
-        system_prompt = """
-## role 
-你是一个服装从业者，熟悉服装的款式、颜色、材料等。
+        self.last_usage = {}
+        self.image_stats = {}
+        try:
+            provider = self.get_provider()
+        except LLMError as e:
+            return {"error": str(e)}
 
-## task
-当用户提供给你一张包含衣物服饰的图片时，你需要识别其中的服装的种类、颜色、款式、适合季节、适用场合。然后将这些信息以json的格式输出，例如：
-{
-"description": "珍珠白褶皱雪纺衬衫",
-"season":  ["春", "夏"],
-"occasion": ["日常"]
-}
-其中，occasion仅从['日常', '工作', '运动', '正式', '休闲', '派对']中选择，season仅从["春", "夏", "秋", "冬"]中选择。
-"""
-        user_prompt = "请分析这张衣物图片，并以JSON格式返回描述、适用季节和场合信息。"
+        # 同一张图片在同一模型下的识别结果直接从缓存返回
+        cache_enabled = current_app.config.get('IMAGE_ANALYSIS_CACHE_ENABLED', True)
+        model_id = f"{provider.name}:{getattr(provider, 'vision_model', None) or provider.model}"
+        cache_key = ImageAnalysisCache.make_key(model_id, image_data)
+        if cache_enabled and not force_refresh:
+            cached = ImageAnalysisCache.lookup(cache_key)
+            if cached is not None:
+                self.used_config = self.config
+                self.image_stats = {'cached': True}
+                return cached
+
+        # 相同图片的并发识别只调用一次AI服务
+        parsed, shared = single_flight.do(
+            f"image:{cache_key}",
+            lambda: self._analyze_image_uncached(provider, image_data, cache_key, model_id, cache_enabled, on_field)
+        )
+        if shared:
+            # 用量已由实际调用的请求记录
+            self.used_config = self.config
+            self.image_stats = {'cached': False, 'coalesced': True}
+        return dict(parsed)
+
+    def _analyze_image_uncached(self, provider, image_data, cache_key, model_id, cache_enabled, on_field=None):
+        """压缩图片并流式调用视觉模型，识别成功时写入识别结果缓存"""
+        # 缩小并重新压缩图片，减少上传体积和视觉模型的token消耗
+        prepared = prepare_image(image_data)
+        image_preprocess_stats.record(prepared.original_bytes, len(prepared.data))
+        self.image_stats = {
+            'cached': False,
+            'original_bytes': prepared.original_bytes,
+            'uploaded_bytes': len(prepared.data),
+            'bytes_saved': prepared.bytes_saved
+        }
+        current_app.logger.info(
+            f"图片预处理: {prepared.original_bytes} -> {len(prepared.data)} bytes ({prepared.mimetype})"
+        )
+        # 将图片转换为base64编码
+        image_base64 = base64.b64encode(prepared.data).decode('utf-8')
         
-        # 根据配置的模型类型调用相应的API
+        parser = IncrementalJSONParser(IMAGE_RESULT_FIELDS)
+        chunks = []
+        stopped_early = False
         try:
-            if self.config.model_type == 'baidu':
-                result = '目前仅openrouter支持图像识别'
-                # result = self._call_baidu_image_api(system_prompt, user_prompt, image_base64)
-            elif self.config.model_type == 'xunfei':
-                result = '目前仅openrouter支持图像识别'
-                # result = self._call_xunfei_image_api(system_prompt, user_prompt, image_base64)
-            elif self.config.model_type == 'silicon':
-                result = '目前仅openrouter支持图像识别'
-                # result = self._call_silicon_image_api(system_prompt, user_prompt, image_base64)
-            elif self.config.model_type == 'openrouter':
-                result = self._call_openrouter_image_api(system_prompt, user_prompt, image_base64)
-            else:
-                return {"error": "不支持的AI服务类型"}
-                
-            # 解析返回的JSON结果
-            try:
-                # 查找JSON部分，可能被包含在其他文本中
-                import re
-                json_match = re.search(r'\{.*\}', result, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    data = json.loads(json_str)
-                    
-                    # 标准化结果格式
-                    return {
-                        "description": data.get("description", "未识别的衣物"),
-                        "seasons": data.get("season", []),
-                        "occasions": data.get("occasion", [])
-                    }
-                else:
-                    return {"error": "无法从AI响应中解析出JSON数据"}
-            except Exception as e:
-                current_app.logger.error(f"解析AI响应时出错: {str(e)}, 原始响应: {result}")
-                return {"error": f"解析AI响应时出错: {str(e)}"}
+            with closing(provider.stream_image(
+                IMAGE_SYSTEM_PROMPT, IMAGE_USER_PROMPT, image_base64, prepared.mimetype
+            )) as stream:
+                for chunk in stream:
+                    chunks.append(chunk)
+                    for key, value in parser.feed(chunk):
+                        if on_field and key in IMAGE_RESULT_FIELDS:
+                            on_field(IMAGE_RESULT_FIELDS[key], value)
+                    if parser.done:
+                        # 已得到完整结果，关闭连接，不再读取模型后续的说明文字
+                        stopped_early = True
+                        break
+            result = ''.join(chunks)
+            self.used_config = self.config
+            self.last_usage = provider.get_usage()
+            if not self.last_usage:
+                # 提前结束时服务商不会返回用量，按已读取的输出估算
+                completion_tokens = estimate_tokens(result)
+                self.last_usage = {
+                    'prompt_tokens': 0,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': completion_tokens
+                }
+            self.image_stats['early_stop'] = stopped_early
+            self.image_stats['output_chars'] = len(result)
+        except LLMError as e:
+            return {"error": str(e)}
         except Exception as e:
             current_app.logger.error(f"调用AI图像分析服务时出错: {str(e)}")
             return {"error": f"调用AI服务时出错: {str(e)}"}
-    
-    def _call_openrouter_image_api(self, system_prompt, user_prompt, image_base64):
-        """调用OpenRouter多模态API分析图片"""
-        if not self.config or not self.config.api_key:
-            return "请先完成API配置（需要API Key）"
-            
-        api_url = "https://openrouter.ai/api/v1/chat/completions"
-        
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.config.api_key}",
-                "Content-Type": "application/json",
-                # "HTTP-Referer": "https://outfit-assistant.example.com",
-                # "X-Title": "Outfit Assistant"
-            }
-            
-            # 构建多模态消息
-            data = {
-                "model": "qwen/qwen2.5-vl-72b-instruct:free", # 使用支持视觉的模型
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": user_prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                "temperature": 0.7,
-                "max_tokens": 1000
-            }
-            
-            response = requests.post(api_url, headers=headers, json=data)
-            if response.status_code == 200:
-                data = response.json()
-                return data['choices'][0]['message']['content']
-            current_app.logger.error(f"OpenRouter API error: {response.text}")
-            return f"AI服务请求失败，状态码：{response.status_code}"
-        except Exception as e:
-            current_app.logger.error(f"Error calling OpenRouter API: {str(e)}")
-            return f"调用AI服务时发生错误: {str(e)}"
-    
-    def _call_baidu_image_api(self, system_prompt, user_prompt, image_base64):
-        """调用百度文心一言多模态API分析图片"""
-        if not self.config or not self.config.api_key or not self.config.api_secret:
-            return "请先完成API配置（需要API Key和Secret Key）"
-            
-        access_token = self._get_baidu_access_token()
-        if not access_token:
-            return "无法连接到百度服务，请检查API配置"
-            
-        api_url = f"https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/completions_pro?access_token={access_token}"
-        
-        try:
-            payload = {
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text", 
-                                "text": user_prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                "temperature": 0.7,
-                "max_output_tokens": 1000
-            }
-            
-            response = requests.post(api_url, json=payload)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('result', '未获取到有效回复')
-            current_app.logger.error(f"Baidu Image API error: {response.text}")
-            return "AI服务暂时不可用，请稍后再试"
-        except Exception as e:
-            current_app.logger.error(f"Error calling Baidu Image API: {str(e)}")
-            return f"调用AI服务时发生错误: {str(e)}"
-            
-    def _call_xunfei_image_api(self, system_prompt, user_prompt, image_base64):
-        """调用讯飞星火多模态API分析图片"""
-        # 注意：讯飞目前的API可能不支持直接处理图像，此处提供一个模拟实现
-        # 实际使用时应查阅讯飞最新的API文档
-        if not self.config or not self.config.api_key or not self.config.app_id:
-            return "请先完成API配置（需要API Key和AppID）"
-            
-        return "讯飞星火API暂不支持图像分析功能，请选择其他服务提供商"
-            
-    def _call_silicon_image_api(self, system_prompt, user_prompt, image_base64):
-        """调用硅基流动多模态API分析图片"""
-        if not self.config or not self.config.api_key:
-            return "请先完成API配置（需要API Key）"
-            
-        api_url = self.config.api_base if self.config.api_base else "https://api.siliconflow.cn/v1/chat/completions"
-        
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.config.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "Qwen/Qwen-VL-Plus",  # 使用支持视觉的模型
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": user_prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                "temperature": 0.7,
-                "max_tokens": 1000
-            }
-            
-            response = requests.post(api_url, headers=headers, json=data)
-            if response.status_code == 200:
-                data = response.json()
-                return data['choices'][0]['message']['content']
-            current_app.logger.error(f"Silicon Image API error: {response.text}")
-            return f"AI服务请求失败，状态码：{response.status_code}"
-        except Exception as e:
-            current_app.logger.error(f"Error calling Silicon Image API: {str(e)}")
-            return f"调用AI服务时发生错误: {str(e)}"
\ No newline at end of file
+
+        parsed = self._parse_image_result(result, parser.result)
+        if cache_enabled and 'error' not in parsed:
+            # 随调用方记录用量的事务一起提交
+            ImageAnalysisCache.store(
+                cache_key, model_id, parsed,
+                max_entries=current_app.config.get('IMAGE_ANALYSIS_CACHE_SIZE', 1000)
+            )
+        return parsed
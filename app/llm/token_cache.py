@@ -0,0 +1,89 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+class AccessTokenCache:
+    """OAuth access_token 缓存
+
+    按 (api_key, api_secret) 缓存令牌并遵循接口返回的 expires_in，
+    在过期前 refresh_margin 秒开始刷新。同一密钥的并发刷新只会触发一次请求，
+    刷新期间若旧令牌仍未过期，其他线程直接使用旧令牌而不等待。
+    """
+
+    def __init__(self, refresh_margin: int = 300, default_ttl: int = 3600):
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self._tokens: Dict[str, Tuple[str, float]] = {}  # key -> (token, 过期时间戳)
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(api_key: str, api_secret: str) -> str:
+        """使用哈希作为缓存键，避免在内存中以明文键保存密钥组合"""
+        return hashlib.sha256(f"{api_key}:{api_secret}".encode('utf-8')).hexdigest()
+
+    def _get_key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def get(self, key: str, fetcher: Callable[[], Tuple[Optional[str], Optional[int]]]) -> Optional[str]:
+        """获取令牌，必要时调用 fetcher 刷新
+
+        Args:
+            key: 缓存键，见 make_key
+            fetcher: 无参函数，返回 (access_token, expires_in)，失败时返回 (None, None)
+        """
+        now = time.time()
+        entry = self._tokens.get(key)
+        if entry and now < entry[1] - self.refresh_margin:
+            return entry[0]
+
+        key_lock = self._get_key_lock(key)
+        # 旧令牌尚未真正过期时，若已有线程在刷新则直接使用旧令牌
+        if entry and now < entry[1]:
+            if not key_lock.acquire(blocking=False):
+                return entry[0]
+        else:
+            key_lock.acquire()
+
+        try:
+            # 获得锁后再次检查，可能已被其他线程刷新
+            entry = self._tokens.get(key)
+            if entry and time.time() < entry[1] - self.refresh_margin:
+                return entry[0]
+
+            token, expires_in = fetcher()
+            if not token:
+                # 刷新失败时，仍可使用未过期的旧令牌
+                if entry and time.time() < entry[1]:
+                    return entry[0]
+                return None
+
+            ttl = int(expires_in) if expires_in else self.default_ttl
+            self._tokens[key] = (token, time.time() + ttl)
+            return token
+        finally:
+            key_lock.release()
+
+    def peek(self, key: str) -> Optional[str]:
+        """仅在令牌无需刷新时返回缓存的令牌，不触发刷新"""
+        entry = self._tokens.get(key)
+        if entry and time.time() < entry[1] - self.refresh_margin:
+            return entry[0]
+        return None
+
+    def invalidate(self, key: str):
+        """令牌被服务端判定失效时移除缓存"""
+        self._tokens.pop(key, None)
+
+    def clear(self):
+        self._tokens.clear()
+
+
+# 创建全局令牌缓存实例，供所有请求和工作线程共享
+baidu_token_cache = AccessTokenCache()
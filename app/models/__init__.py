@@ -2,4 +2,6 @@
 from app.models.user import User
 from app.models.clothing import Clothing, CATEGORIES, SEASONS, OCCASIONS, DESCRIPTION_EXAMPLES
 from app.models.llm_config import UserLLMConfig
-from app.models.weather import UserLocation
\ No newline at end of file
+from app.models.weather import UserLocation
+from app.models.cache import CacheVersion, ImageAnalysisCache, FlightLock
+from app.models.job import Job
\ No newline at end of file
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+class CacheVersion(db.Model):
+    """缓存版本号
+
+    进程内缓存以版本号判断是否失效：数据变更时递增版本号，
+    各个worker读取到的版本号与本地缓存不一致时重新构建缓存。
+    """
+    name = db.Column(db.String(100), primary_key=True)  # 缓存名称，如 wardrobe:1
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+    @staticmethod
+    def get_version(name):
+        """获取当前版本号，不存在时返回0"""
+        version = db.session.query(CacheVersion.version).filter_by(name=name).scalar()
+        return version or 0
+
+    @staticmethod
+    def bump(name):
+        """递增版本号，随调用方的事务一起提交"""
+        values = {
+            CacheVersion.version: CacheVersion.version + 1,
+            CacheVersion.updated_at: datetime.utcnow()
+        }
+        updated = CacheVersion.query.filter_by(name=name).update(values, synchronize_session=False)
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(CacheVersion(name=name, version=1))
+            except IntegrityError:
+                # 其他请求已同时创建该记录
+                CacheVersion.query.filter_by(name=name).update(values, synchronize_session=False)
+
+
+class ImageAnalysisCache(db.Model):
+    """衣物图片识别结果缓存
+
+    以图片内容和视觉模型的哈希为键，同一张图片重复识别时直接返回已解析的结果。
+    """
+    key = db.Column(db.String(64), primary_key=True)     # sha256(模型标识 + 图片数据)
+    model = db.Column(db.String(100), nullable=False)    # 服务商和视觉模型，如 openrouter:qwen/qwen2.5-vl-72b-instruct:free
+    description = db.Column(db.String(200), nullable=False)
+    seasons = db.Column(db.String(50))                   # 存储为JSON数组
+    occasions = db.Column(db.String(100))                # 存储为JSON数组
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # 按最近使用时间淘汰
+
+    def __repr__(self):
+        return f'<ImageAnalysisCache {self.key[:12]} {self.model}>'
+
+    @staticmethod
+    def make_key(model, image_data):
+        digest = hashlib.sha256(model.encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(image_data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def lookup(key):
+        """查找缓存的识别结果并更新使用时间，未命中时返回None"""
+        entry = db.session.get(ImageAnalysisCache, key)
+        if entry is None:
+            return None
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_used_at = datetime.utcnow()
+        return entry.to_result()
+
+    @staticmethod
+    def store(key, model, result, max_entries=None):
+        """保存识别结果，随调用方的事务一起提交
+
+        Args:
+            result: 包含description、seasons和occasions的识别结果
+            max_entries: 缓存条目上限，超出时淘汰最久未使用的条目
+        """
+        values = {
+            'model': model,
+            'description': (result.get('description') or '')[:200],
+            'seasons': json.dumps(result.get('seasons') or [], ensure_ascii=False),
+            'occasions': json.dumps(result.get('occasions') or [], ensure_ascii=False),
+            'last_used_at': datetime.utcnow()
+        }
+        updated = ImageAnalysisCache.query.filter_by(key=key).update(values, synchronize_session=False)
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(ImageAnalysisCache(key=key, **values))
+            except IntegrityError:
+                # 其他请求已同时写入该图片的结果
+                ImageAnalysisCache.query.filter_by(key=key).update(values, synchronize_session=False)
+
+        if max_entries:
+            ImageAnalysisCache.evict(max_entries)
+
+    @staticmethod
+    def evict(max_entries):
+        """只保留最近使用的 max_entries 条缓存"""
+        overflow = ImageAnalysisCache.query.count() - max_entries
+        if overflow <= 0:
+            return 0
+        stale_keys = [
+            key for (key,) in db.session.query(ImageAnalysisCache.key)
+            .order_by(ImageAnalysisCache.last_used_at.asc())
+            .limit(overflow)
+        ]
+        return ImageAnalysisCache.query.filter(ImageAnalysisCache.key.in_(stale_keys)).delete(
+            synchronize_session=False
+        )
+
+    def to_result(self):
+        return {
+            'description': self.description,
+            'seasons': json.loads(self.seasons) if self.seasons else [],
+            'occasions': json.loads(self.occasions) if self.occasions else []
+        }
+
+
+class FlightLock(db.Model):
+    """跨进程的调用锁
+
+    多个worker同时需要刷新同一份共享数据（如天气缓存）时，只有持有锁的worker调用外部服务，
+    其余worker等待锁释放后重新读取缓存。锁超过有效期未释放时可被其他worker接管。
+    """
+    key = db.Column(db.String(200), primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<FlightLock {self.key} {self.owner}>'
+
+    @staticmethod
+    def acquire(key, owner, ttl):
+        """尝试获取锁，使用独立连接立即提交，不影响调用方的事务"""
+        now = datetime.utcnow()
+        table = FlightLock.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key, table.c.expires_at < now))
+                conn.execute(table.insert().values(key=key, owner=owner,
+                                                   expires_at=now + timedelta(seconds=ttl)))
+            return True
+        except IntegrityError:
+            return False
+
+    @staticmethod
+    def release(key, owner):
+        table = FlightLock.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.key == key, table.c.owner == owner))
+
+    @staticmethod
+    @contextmanager
+    def hold(key, ttl=30, poll_interval=0.1):
+        """获取锁后执行代码块，锁被占用时最多等待ttl秒，超时后不加锁继续执行"""
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + ttl
+        acquired = FlightLock.acquire(key, owner, ttl)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            acquired = FlightLock.acquire(key, owner, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                FlightLock.release(key, owner)
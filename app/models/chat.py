@@ -1,4 +1,6 @@
 from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
 from app import db
 
 class Conversation(db.Model):
@@ -34,11 +36,28 @@ class ChatHistory(db.Model):
     ai_response = db.Column(db.Text, nullable=False)
     message_type = db.Column(db.String(20), default='chat')  # 消息类型：chat, system 等
     tokens_used = db.Column(db.Integer)  # 记录token消耗
+    prompt_tokens = db.Column(db.Integer)  # 输入token数
+    completion_tokens = db.Column(db.Integer)  # 输出token数
+    provider = db.Column(db.String(20))  # 生成回复的服务商
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
         return f'<ChatHistory {self.id}>'
 
+    @staticmethod
+    def ensure_schema():
+        """旧版本的表没有用量相关的列，聊天记录需要保留，逐列追加（新列均可为空）"""
+        table = ChatHistory.__table__
+        existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+        added = False
+        with db.engine.begin() as connection:
+            for column in (table.c.prompt_tokens, table.c.completion_tokens, table.c.provider):
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    added = True
+        return added
+
     @property
     def formatted_time(self):
         """返回格式化的时间字符串"""
@@ -51,5 +70,70 @@ class ChatHistory(db.Model):
             'user_message': self.user_message,
             'ai_response': self.ai_response,
             'timestamp': self.timestamp.isoformat(),
-            'type': self.message_type
-        }
\ No newline at end of file
+            'type': self.message_type,
+            'tokens_used': self.tokens_used
+        }
+
+class UsageStats(db.Model):
+    """按用户和服务商累计的token用量"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    provider = db.Column(db.String(20), nullable=False)
+    request_count = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    total_tokens = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'provider', name='uq_usage_stats_user_provider'),
+    )
+
+    def __repr__(self):
+        return f'<UsageStats {self.user_id}-{self.provider}: {self.total_tokens}>'
+
+    @staticmethod
+    def record(user_id, provider, usage):
+        """累加一次调用的用量，随调用方的事务一起提交
+
+        Args:
+            usage: 服务商返回的用量，包含prompt_tokens、completion_tokens和total_tokens
+        """
+        usage = usage or {}
+        values = {
+            UsageStats.request_count: UsageStats.request_count + 1,
+            UsageStats.prompt_tokens: UsageStats.prompt_tokens + usage.get('prompt_tokens', 0),
+            UsageStats.completion_tokens: UsageStats.completion_tokens + usage.get('completion_tokens', 0),
+            UsageStats.total_tokens: UsageStats.total_tokens + usage.get('total_tokens', 0),
+            UsageStats.updated_at: datetime.utcnow()
+        }
+        updated = UsageStats.query.filter_by(user_id=user_id, provider=provider).update(
+            values, synchronize_session=False
+        )
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(UsageStats(
+                        user_id=user_id,
+                        provider=provider,
+                        request_count=1,
+                        prompt_tokens=usage.get('prompt_tokens', 0),
+                        completion_tokens=usage.get('completion_tokens', 0),
+                        total_tokens=usage.get('total_tokens', 0)
+                    ))
+            except IntegrityError:
+                # 其他请求已同时创建该记录
+                UsageStats.query.filter_by(user_id=user_id, provider=provider).update(
+                    values, synchronize_session=False
+                )
+
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'provider': self.provider,
+            'request_count': self.request_count,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'updated_at': self.updated_at.isoformat()
+        }
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+import json
+from app import db
+
+class Job(db.Model):
+    """后台任务
+
+    任务写入数据库后由 app.services.jobs 中的工作线程按优先级领取执行，
+    多个进程共享同一个数据库时也不会重复执行同一任务。
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)           # 任务类型，如 chat、analyze_image
+    priority = db.Column(db.Integer, nullable=False, default=0)  # 数值越大越先执行
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    payload = db.Column(db.Text)                              # 任务参数，存储为JSON
+    result = db.Column(db.Text)                               # 执行结果，存储为JSON
+    error = db.Column(db.String(500))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_priority', 'status', 'priority', 'id'),
+    )
+
+    def __init__(self, **kwargs):
+        super(Job, self).__init__(**kwargs)
+        if 'payload' in kwargs and not isinstance(kwargs['payload'], str):
+            self.payload = json.dumps(kwargs['payload'], ensure_ascii=False)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+    @property
+    def payload_dict(self):
+        return json.loads(self.payload) if self.payload else {}
+
+    @property
+    def result_dict(self):
+        return json.loads(self.result) if self.result else None
+
+    @property
+    def finished(self):
+        return self.status in (Job.SUCCEEDED, Job.FAILED)
+
+    @staticmethod
+    def claim_next():
+        """领取优先级最高的排队任务并标记为执行中，没有任务时返回None
+
+        以带状态条件的UPDATE领取，其他线程或进程已领取的任务会被跳过。
+        """
+        candidates = db.session.query(Job.id).filter_by(status=Job.QUEUED)\
+            .order_by(Job.priority.desc(), Job.id.asc())\
+            .limit(5)\
+            .all()
+        for (job_id,) in candidates:
+            claimed = Job.query.filter_by(id=job_id, status=Job.QUEUED).update({
+                Job.status: Job.RUNNING,
+                Job.started_at: datetime.utcnow(),
+                Job.attempts: Job.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+        return None
+
+    @staticmethod
+    def requeue_stale(timeout, max_attempts):
+        """执行时间超过timeout秒的任务视为所在进程已退出，重新排队或标记失败"""
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        stale = Job.query.filter(Job.status == Job.RUNNING, Job.started_at < cutoff)
+        failed = stale.filter(Job.attempts >= max_attempts).update({
+            Job.status: Job.FAILED,
+            Job.error: '任务执行超时',
+            Job.finished_at: datetime.utcnow(),
+            Job.payload: None
+        }, synchronize_session=False)
+        requeued = stale.filter(Job.attempts < max_attempts).update({
+            Job.status: Job.QUEUED
+        }, synchronize_session=False)
+        db.session.commit()
+        return requeued + failed
+
+    @staticmethod
+    def purge_finished(retention):
+        """删除结束超过retention秒的任务"""
+        cutoff = datetime.utcnow() - timedelta(seconds=retention)
+        deleted = Job.query.filter(
+            Job.status.in_([Job.SUCCEEDED, Job.FAILED]),
+            Job.finished_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def queue_position(self):
+        """排在该任务之前的排队任务数量"""
+        if self.status != Job.QUEUED:
+            return 0
+        return Job.query.filter(
+            Job.status == Job.QUEUED,
+            db.or_(
+                Job.priority > self.priority,
+                db.and_(Job.priority == self.priority, Job.id < self.id)
+            )
+        ).count()
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.status == Job.QUEUED:
+            data['queue_position'] = self.queue_position()
+        if self.status == Job.SUCCEEDED:
+            data['result'] = self.result_dict
+        if self.status == Job.FAILED:
+            data['error'] = self.error
+        return data
@@ -1,25 +1,148 @@
-
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
 from app import db
 
 class WeatherCache(db.Model):
-    """天气数据缓存模型"""
+    """天气数据缓存模型
+
+    每个缓存键（经纬度所在的geohash网格）只保留一行，刷新时原地更新；过期的行由 purge_expired 定期清理。
+    """
     id = db.Column(db.Integer, primary_key=True)
-    location = db.Column(db.String(100), nullable=False)
+    cache_key = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    location = db.Column(db.String(100), nullable=False)  # 最近一次刷新时的城市名，仅用于展示
     temperature = db.Column(db.Float, nullable=False)
     weather_condition = db.Column(db.String(50), nullable=False)
     humidity = db.Column(db.Integer)
     wind_speed = db.Column(db.Float)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f'<WeatherCache {self.location} {self.temperature}°C {self.weather_condition}>'
     
+    @staticmethod
+    def cache_duration() -> timedelta:
+        """缓存有效期，由 WEATHER_CACHE_DURATION 配置，默认1小时"""
+        return current_app.config.get('WEATHER_CACHE_DURATION', timedelta(hours=1))
+
+    @property
+    def expires_in(self) -> float:
+        """距离过期的秒数，已过期时为负数"""
+        return (self.timestamp + self.cache_duration() - datetime.utcnow()).total_seconds()
+
     @property
     def is_valid(self):
-        """检查缓存是否有效（1小时内）"""
-        age = datetime.utcnow() - self.timestamp
-        return age.total_seconds() < 3600  # 1小时有效期
+        """检查缓存是否在有效期内"""
+        return self.expires_in > 0
+
+    @staticmethod
+    def lookup(cache_key):
+        """按缓存键查找，不存在时返回None"""
+        return WeatherCache.query.filter_by(cache_key=cache_key).first()
+
+    @staticmethod
+    def upsert(cache_key, location, values):
+        """写入或原地更新缓存行，随调用方的事务一起提交
+
+        Args:
+            values: temperature、weather_condition、humidity、wind_speed
+        """
+        values = dict(values, location=location, timestamp=datetime.utcnow())
+        updated = WeatherCache.query.filter_by(cache_key=cache_key).update(values, synchronize_session=False)
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(WeatherCache(cache_key=cache_key, **values))
+            except IntegrityError:
+                # 其他请求已同时写入该缓存键
+                WeatherCache.query.filter_by(cache_key=cache_key).update(values, synchronize_session=False)
+
+    @staticmethod
+    def fresh_keys(cache_keys, chunk_size=500):
+        """返回 cache_keys 中缓存未过期的键，分批查询以避免超出SQL参数数量限制"""
+        since = datetime.utcnow() - WeatherCache.cache_duration()
+        fresh = set()
+        for start in range(0, len(cache_keys), chunk_size):
+            rows = db.session.query(WeatherCache.cache_key).filter(
+                WeatherCache.cache_key.in_(cache_keys[start:start + chunk_size]),
+                WeatherCache.timestamp > since
+            ).all()
+            fresh.update(cache_key for cache_key, in rows)
+        return fresh
+
+    @staticmethod
+    def purge_expired(max_age: timedelta):
+        """删除超过 max_age 未更新的缓存行，返回删除的行数"""
+        return WeatherCache.query.filter(
+            WeatherCache.timestamp < datetime.utcnow() - max_age
+        ).delete(synchronize_session=False)
+
+    @staticmethod
+    def ensure_schema():
+        """旧版本的表没有cache_key列且按行追加，缓存数据可丢弃，直接重建"""
+        columns = {column['name'] for column in inspect(db.engine).get_columns(WeatherCache.__tablename__)}
+        if 'cache_key' not in columns:
+            WeatherCache.__table__.drop(db.engine)
+            WeatherCache.__table__.create(db.engine)
+
+class WeatherForecastCache(db.Model):
+    """逐时天气预报缓存模型
+
+    与 WeatherCache 一样每个缓存键（经纬度所在的geohash网格）只保留一行，有效期单独配置。
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    location = db.Column(db.String(100), nullable=False)
+    timezone_offset = db.Column(db.Integer, default=0)  # 当地时间与UTC相差的秒数
+    entries = db.Column(db.Text, nullable=False)  # JSON列表，每项为一个预报时段
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<WeatherForecastCache {self.location} {self.timestamp}>'
+
+    @staticmethod
+    def cache_duration() -> timedelta:
+        """缓存有效期，由 WEATHER_FORECAST_CACHE_DURATION 配置，默认3小时"""
+        return current_app.config.get('WEATHER_FORECAST_CACHE_DURATION', timedelta(hours=3))
+
+    @property
+    def expires_in(self) -> float:
+        """距离过期的秒数，已过期时为负数"""
+        return (self.timestamp + self.cache_duration() - datetime.utcnow()).total_seconds()
+
+    @staticmethod
+    def lookup(cache_key):
+        """按缓存键查找，不存在时返回None"""
+        return WeatherForecastCache.query.filter_by(cache_key=cache_key).first()
+
+    @staticmethod
+    def upsert(cache_key, location, timezone_offset, entries):
+        """写入或原地更新缓存行，随调用方的事务一起提交"""
+        values = {
+            'location': location,
+            'timezone_offset': timezone_offset,
+            'entries': json.dumps(entries, ensure_ascii=False),
+            'timestamp': datetime.utcnow()
+        }
+        updated = WeatherForecastCache.query.filter_by(cache_key=cache_key).update(values, synchronize_session=False)
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(WeatherForecastCache(cache_key=cache_key, **values))
+            except IntegrityError:
+                WeatherForecastCache.query.filter_by(cache_key=cache_key).update(values, synchronize_session=False)
+
+    @staticmethod
+    def purge_expired(max_age: timedelta):
+        """删除超过 max_age 未更新的缓存行，返回删除的行数"""
+        return WeatherForecastCache.query.filter(
+            WeatherForecastCache.timestamp < datetime.utcnow() - max_age
+        ).delete(synchronize_session=False)
+
+    def to_list(self) -> list:
+        return json.loads(self.entries)
 
 class UserLocation(db.Model):
     """用户位置模型"""
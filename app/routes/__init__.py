@@ -1,12 +1,20 @@
 
-from flask import Blueprint, render_template
-from flask_login import current_user
+import time
+from flask import Blueprint, current_app, render_template, jsonify, request
+from flask_login import current_user, login_required
 # routes/__init__.py
 from .auth import auth_bp
 from .wardrobe import wardrobe_bp
 from .weather import weather_bp
 from .chat import chat_bp
 from .api_keys import bp as api_keys_bp
+from app import db
+from app.models import Job
+from app.services import job_queue
+from app.utils.ratelimit import llm_limiter
+from app.utils.resilience import outbound
+from app.utils.singleflight import single_flight
+from app.llm import jobs  # 注册后台任务的处理函数
 
 # 创建主蓝图
 main_bp = Blueprint('main', __name__)
@@ -15,4 +23,45 @@ __all__ = ['auth_bp', 'wardrobe_bp', 'weather_bp', 'chat_bp', 'api_keys_bp', 'ma
 
 @main_bp.route('/')
 def index():
-    return render_template('index.html')    
\ No newline at end of file
+    return render_template('index.html')
+
+@main_bp.route('/api/status/outbound')
+@login_required
+def outbound_status():
+    """外部依赖的熔断器状态、限流排队和并发合并统计，供监控使用"""
+    return jsonify({
+        'success': True,
+        'breakers': outbound.breaker_states(redact=True),
+        'rate_limits': llm_limiter.stats(),
+        'single_flight': single_flight.stats()
+    })
+
+@main_bp.route('/api/jobs/<int:job_id>')
+@login_required
+def get_job(job_id):
+    """查询后台任务的状态和结果
+
+    参数:
+    - wait: 可选，任务未结束时最多等待的秒数，不超过 JOB_POLL_MAX_WAIT（默认3秒）。
+            等待期间占用一个worker线程，较长的任务应由客户端定时轮询
+    """
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    job_queue.start()
+    wait = max(0.0, min(request.args.get('wait', 0, type=float), current_app.config.get('JOB_POLL_MAX_WAIT', 3)))
+    deadline = time.monotonic() + wait
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.25)
+        db.session.refresh(job)
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+@main_bp.route('/api/status/jobs')
+@login_required
+def job_status():
+    """后台任务队列的深度和耗时，供监控使用"""
+    return jsonify({
+        'success': True,
+        'jobs': job_queue.stats()
+    })
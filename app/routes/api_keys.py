@@ -4,6 +4,7 @@ from app import db
 from app.models import UserLLMConfig
 from app.forms import APIKeyForm
 from app.llm.service import LLMService
+from app.services import llm_config_cache
 
 bp = Blueprint('api_keys', __name__, url_prefix='/api_keys')
 
@@ -85,6 +86,8 @@ def manage():
                 config.app_id = None
                 config.api_base = None
             
+            # 使缓存的配置失效，版本号与配置一起提交
+            llm_config_cache.invalidate(current_user.id)
             db.session.commit()
             flash(f'{model_type} API配置已保存', 'success')
             return redirect(url_for('api_keys.manage'))
@@ -103,7 +106,10 @@ def manage():
 @login_required
 def test_api():
     """测试API配置"""
-    config = UserLLMConfig.query.filter_by(user_id=current_user.id).first()
+    # 创建LLM服务实例，与聊天时解析的配置相同
+    service = LLMService()
+    service.set_user_id(current_user.id)
+    config = service.config
     if not config:
         return jsonify({
             'success': False,
@@ -117,13 +123,9 @@ def test_api():
         }), 400
         
     try:
-        # 创建LLM服务实例
-        service = LLMService()
-        service.set_user_id(current_user.id)
-        
-        # 发送测试请求
+        # 发送测试请求：跳过回复缓存，也不故障转移到其他配置，结果只反映当前配置
         test_prompt = "你好，这是一个测试消息，请回复'测试成功'。"
-        response = service.chat(test_prompt)
+        response = service.chat(test_prompt, use_cache=False, hedged=False)
         
         if response and '测试成功' in response:
             return jsonify({
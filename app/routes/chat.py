@@ -1,11 +1,15 @@
 
-from flask import Blueprint, render_template, jsonify, request, current_app 
+from flask import Blueprint, render_template, jsonify, request, current_app, Response, stream_with_context, url_for
 from flask_login import login_required, current_user
 from app.llm.service import LLMService
+from app.llm.base import LLMError
+from app.llm.cache import response_cache
 from app import db
-from app.models.chat import ChatHistory, Conversation
+from app.models.chat import ChatHistory, Conversation, UsageStats
+from app.services import job_queue, llm_config_cache
 from app.utils.chat_migration import migrate_chat_history
 from datetime import datetime
+import json
 
 chat_bp = Blueprint('chat', __name__)
 
@@ -62,6 +66,9 @@ def chat():
     - message: 必需，用户消息内容
     - conversation_id: 必需，对话ID
     - config_id: 可选，指定使用的LLM配置ID
+    - no_cache: 可选，为true时跳过回复缓存
+    - dispatch: 可选，'hedged' 启用跨配置的对冲/故障转移，'single' 只使用指定配置，默认按 LLM_DISPATCH_MODE
+    - async: 可选，为true时放入后台任务队列并立即返回job_id，通过 /api/jobs/<job_id> 获取结果
     """
     data = request.get_json()
     if not data or 'message' not in data:
@@ -70,6 +77,8 @@ def chat():
     user_message = data['message']
     conversation_id = data.get('conversation_id')
     config_id = data.get('config_id')
+    use_cache = not data.get('no_cache', False)
+    hedged = {'hedged': True, 'single': False}.get(data.get('dispatch'))
     
     # 验证对话ID
     if not conversation_id:
@@ -93,9 +102,23 @@ def chat():
         if not llm_service.config:
             current_app.logger.error(f"No LLM config for user {current_user.id}")
             return jsonify({'error': '请先配置AI服务'}), 400
+
+        if data.get('async'):
+            job = job_queue.enqueue('chat', current_user.id, {
+                'message': user_message,
+                'conversation_id': conversation_id,
+                'config_id': config_id,
+                'use_cache': use_cache,
+                'hedged': hedged
+            })
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status_url': url_for('main.get_job', job_id=job.id)
+            }), 202
             
         # 获取AI响应
-        response = llm_service.chat(user_message)
+        response = llm_service.chat(user_message, use_cache=use_cache, hedged=hedged)
         
         if not response or len(response.strip()) == 0:
             current_app.logger.error(f"Empty response from LLM for user {current_user.id}")
@@ -103,18 +126,7 @@ def chat():
         
         # 保存聊天记录
         try:
-            chat_history = ChatHistory(
-                user_id=current_user.id,
-                conversation_id=conversation_id,
-                user_message=user_message,
-                ai_response=response,
-                message_type='chat'
-            )
-            db.session.add(chat_history)
-            
-            # 更新对话的最后更新时间
-            conversation.updated_at = datetime.utcnow()
-            
+            chat_history = llm_service.save_chat_reply(conversation, user_message, response)
             db.session.commit()
         except Exception as db_error:
             current_app.logger.error(f"Error saving chat history: {str(db_error)}")
@@ -128,7 +140,8 @@ def chat():
         return jsonify({
             'success': True,
             'response': response,
-            'history_id': chat_history.id
+            'history_id': chat_history.id,
+            'prompt_stats': llm_service.prompt_stats
         })
         
     except Exception as e:
@@ -140,6 +153,118 @@ def chat():
             'details': str(e)
         }), 500
 
+def _sse_event(data, event=None):
+    """格式化一条Server-Sent Events消息"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@chat_bp.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """以Server-Sent Events流式返回聊天回复
+    参数同 /api/chat。每段回复以 {"delta": "..."} 推送，
+    结束时推送 done 事件（包含history_id），出错时推送 error 事件。
+    """
+    data = request.get_json()
+    if not data or 'message' not in data:
+        return jsonify({'error': '无效的请求数据'}), 400
+        
+    user_message = data['message']
+    conversation_id = data.get('conversation_id')
+    config_id = data.get('config_id')
+    use_cache = not data.get('no_cache', False)
+    hedged = {'hedged': True, 'single': False}.get(data.get('dispatch'))
+    
+    if not conversation_id:
+        return jsonify({'error': '缺少对话ID'}), 400
+        
+    conversation = Conversation.query.filter_by(
+        id=conversation_id, 
+        user_id=current_user.id
+    ).first()
+    
+    if not conversation:
+        return jsonify({'error': '对话不存在或无权限访问'}), 404
+    
+    llm_service = LLMService()
+    llm_service.set_user_id(current_user.id, config_id)
+    
+    if not llm_service.config:
+        current_app.logger.error(f"No LLM config for user {current_user.id}")
+        return jsonify({'error': '请先配置AI服务'}), 400
+
+    def generate():
+        chunks = []
+        try:
+            for chunk in llm_service.chat_stream(user_message, use_cache=use_cache, hedged=hedged):
+                chunks.append(chunk)
+                yield _sse_event({'delta': chunk})
+        except LLMError as e:
+            yield _sse_event({'error': str(e)}, event='error')
+            return
+        except Exception as e:
+            current_app.logger.error(f"Chat stream error for user {current_user.id}: {str(e)}")
+            yield _sse_event({'error': '处理请求时发生错误', 'details': str(e)}, event='error')
+            return
+
+        response = ''.join(chunks)
+        if not response.strip():
+            current_app.logger.error(f"Empty response from LLM for user {current_user.id}")
+            yield _sse_event({'error': 'AI服务返回空响应'}, event='error')
+            return
+
+        # 流结束后保存完整回复
+        try:
+            chat_history = llm_service.save_chat_reply(conversation, user_message, response)
+            db.session.commit()
+        except Exception as db_error:
+            current_app.logger.error(f"Error saving chat history: {str(db_error)}")
+            db.session.rollback()
+            yield _sse_event({'success': True, 'warning': '聊天记录保存失败'}, event='done')
+            return
+
+        yield _sse_event({
+            'success': True,
+            'history_id': chat_history.id,
+            'prompt_stats': llm_service.prompt_stats
+        }, event='done')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no'}  # 禁止反向代理缓冲，保证逐段推送
+    )
+
+@chat_bp.route('/api/chat/cache-stats')
+@login_required
+def get_cache_stats():
+    """获取LLM回复缓存和配置缓存的命中统计"""
+    return jsonify({
+        'success': True,
+        'stats': response_cache.stats(),
+        'config_stats': llm_config_cache.stats()
+    })
+
+@chat_bp.route('/api/usage')
+@login_required
+def get_usage():
+    """获取当前用户按服务商累计的token用量"""
+    stats = UsageStats.query.filter_by(user_id=current_user.id)\
+        .order_by(UsageStats.total_tokens.desc())\
+        .all()
+
+    totals = {
+        'request_count': sum(s.request_count for s in stats),
+        'prompt_tokens': sum(s.prompt_tokens for s in stats),
+        'completion_tokens': sum(s.completion_tokens for s in stats),
+        'total_tokens': sum(s.total_tokens for s in stats)
+    }
+    return jsonify({
+        'success': True,
+        'providers': [s.to_dict() for s in stats],
+        'totals': totals
+    })
+
 @chat_bp.route('/api/chat/history')
 @login_required
 def get_chat_history():
@@ -172,7 +297,8 @@ def get_chat_history():
             'user_message': h.user_message,
             'ai_response': h.ai_response,
             'timestamp': h.timestamp.isoformat(),
-            'type': h.message_type
+            'type': h.message_type,
+            'tokens_used': h.tokens_used
         } for h in history.items],
         'total': history.total,
         'pages': history.pages,
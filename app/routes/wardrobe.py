@@ -1,11 +1,14 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
+import base64
 import json
 import os
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import Clothing, CATEGORIES, SEASONS, OCCASIONS, DESCRIPTION_EXAMPLES
 from app.llm.service import LLMService
+from app.llm.batch import batch_analyzer
+from app.services import wardrobe_context, job_queue
 
 wardrobe_bp = Blueprint('wardrobe', __name__, url_prefix='/wardrobe')
 
@@ -63,6 +66,7 @@ def add():
             # 创建新衣物
             clothing = Clothing(**data)
             db.session.add(clothing)
+            wardrobe_context.invalidate(current_user.id)
             db.session.commit()
             
             flash('衣物添加成功！', 'success')
@@ -112,6 +116,7 @@ def edit(id):
                     else:
                         flash('不支持的图片格式。请使用JPG、PNG、GIF或WEBP格式。', 'error')
             
+            wardrobe_context.invalidate(current_user.id)
             db.session.commit()
             flash('衣物更新成功！', 'success')
             return redirect(url_for('wardrobe.index'))
@@ -135,6 +140,7 @@ def delete(id):
     
     try:
         db.session.delete(clothing)
+        wardrobe_context.invalidate(current_user.id)
         db.session.commit()
         return jsonify({'success': True, 'message': '衣物已删除'})
     except Exception as e:
@@ -158,7 +164,14 @@ def get_image(id):
 @wardrobe_bp.route('/analyze-image', methods=['POST'])
 @login_required
 def analyze_image():
-    """分析衣物图片"""
+    """分析衣物图片
+
+    参数:
+    - clothing_image: 必需，图片文件
+    - config_id: 可选，指定使用的LLM配置ID
+    - force_refresh: 可选，为true时忽略缓存的识别结果
+    - async: 可选，为true时放入后台任务队列并立即返回job_id，通过 /api/jobs/<job_id> 获取结果
+    """
     if 'clothing_image' not in request.files:
         return jsonify({'success': False, 'message': '没有收到图片文件'}), 400
         
@@ -184,15 +197,154 @@ def analyze_image():
         config_id = request.form.get('config_id')
         llm_service.set_user_id(current_user.id, config_id)
         
-        result = llm_service.analyze_clothing_image(image_data)
+        force_refresh = request.form.get('force_refresh', '').lower() in ('1', 'true', 'on')
+
+        if request.form.get('async', '').lower() in ('1', 'true', 'on'):
+            if not llm_service.config:
+                return jsonify({'success': False, 'message': '请先配置AI服务'}), 400
+            job = job_queue.enqueue('analyze_image', current_user.id, {
+                'config_id': config_id,
+                'force_refresh': force_refresh,
+                'image': base64.b64encode(image_data).decode('utf-8')
+            })
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status_url': url_for('main.get_job', job_id=job.id)
+            }), 202
+
+        result = llm_service.analyze_clothing_image(image_data, force_refresh=force_refresh)
         
         if 'error' in result:
             return jsonify({'success': False, 'message': result['error']}), 400
+
+        # 记录图片识别的token用量
+        try:
+            llm_service.record_usage()
+            db.session.commit()
+        except Exception as db_error:
+            current_app.logger.error(f"Error saving usage stats: {str(db_error)}")
+            db.session.rollback()
             
         return jsonify({
             'success': True, 
-            'data': result
+            'data': result,
+            'cached': llm_service.image_stats.get('cached', False),
+            'image_stats': llm_service.image_stats
         })
     except Exception as e:
         current_app.logger.error(f"分析图片时出错: {str(e)}")
-        return jsonify({'success': False, 'message': f'分析图片时出错: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'message': f'分析图片时出错: {str(e)}'}), 500
+
+@wardrobe_bp.route('/analyze-image/stream', methods=['POST'])
+@login_required
+def analyze_image_stream():
+    """以Server-Sent Events流式返回图片识别结果
+
+    参数同 /wardrobe/analyze-image（不支持async）。每个字段识别完成时推送 field 事件
+    {"name": "description|seasons|occasions", "value": ...}，结束时推送 done 事件（包含完整结果），
+    出错时推送 error 事件。命中缓存时直接推送 done 事件。
+    """
+    if 'clothing_image' not in request.files:
+        return jsonify({'success': False, 'message': '没有收到图片文件'}), 400
+
+    image_file = request.files['clothing_image']
+    if not image_file or not image_file.filename:
+        return jsonify({'success': False, 'message': '请选择有效的图片文件'}), 400
+
+    file_ext = os.path.splitext(image_file.filename)[1][1:].lower()
+    if file_ext not in current_app.config['ALLOWED_IMAGE_EXTENSIONS']:
+        return jsonify({'success': False, 'message': '不支持的图片格式。请使用JPG、PNG、GIF或WEBP格式。'}), 400
+
+    image_data = image_file.read()
+    if not image_data:
+        return jsonify({'success': False, 'message': '无法读取图片数据'}), 400
+
+    config_id = request.form.get('config_id')
+    force_refresh = request.form.get('force_refresh', '').lower() in ('1', 'true', 'on')
+    llm_service = LLMService()
+    llm_service.set_user_id(current_user.id, config_id)
+    if not llm_service.config:
+        return jsonify({'success': False, 'message': '请先配置AI服务'}), 400
+
+    user_id = current_user.id
+
+    def generate():
+        for event, data in batch_analyzer.analyze_stream(user_id, config_id, image_data, force_refresh):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no'}  # 禁止反向代理缓冲，保证逐段推送
+    )
+
+@wardrobe_bp.route('/analyze-images', methods=['POST'])
+@login_required
+def analyze_images():
+    """批量分析衣物图片
+
+    参数:
+    - clothing_images: 必需，多个图片文件
+    - config_id: 可选，指定使用的LLM配置ID
+    - category: 可选，指定时为每张识别成功的图片直接创建该类别的衣物
+    - force_refresh: 可选，为true时忽略缓存的识别结果
+
+    以NDJSON格式逐行返回每张图片的识别结果（按完成顺序），最后一行为汇总信息。
+    """
+    image_files = request.files.getlist('clothing_images')
+    if not image_files:
+        return jsonify({'success': False, 'message': '没有收到图片文件'}), 400
+
+    max_images = current_app.config.get('BATCH_ANALYSIS_MAX_IMAGES', 100)
+    if len(image_files) > max_images:
+        return jsonify({'success': False, 'message': f'每次最多上传{max_images}张图片'}), 400
+
+    category = request.form.get('category') or None
+    if category and category not in CATEGORIES:
+        return jsonify({'success': False, 'message': '无效的衣物类别'}), 400
+
+    config_id = request.form.get('config_id')
+    force_refresh = request.form.get('force_refresh', '').lower() in ('1', 'true', 'on')
+    llm_service = LLMService()
+    llm_service.set_user_id(current_user.id, config_id)
+    if not llm_service.config:
+        return jsonify({'success': False, 'message': '请先配置AI服务'}), 400
+
+    # 先校验所有文件，无效文件直接返回错误结果
+    images = []
+    rejected = []
+    for image_file in image_files:
+        file_ext = os.path.splitext(image_file.filename or '')[1][1:].lower()
+        if file_ext not in current_app.config['ALLOWED_IMAGE_EXTENSIONS']:
+            rejected.append({'filename': image_file.filename, 'success': False,
+                             'message': '不支持的图片格式。请使用JPG、PNG、GIF或WEBP格式。'})
+            continue
+        image_data = image_file.read()
+        if not image_data:
+            rejected.append({'filename': image_file.filename, 'success': False, 'message': '无法读取图片数据'})
+            continue
+        images.append((image_file.filename, image_data, image_file.mimetype))
+
+    user_id = current_user.id
+
+    def generate():
+        succeeded = 0
+        for item in rejected:
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+        for item in batch_analyzer.analyze(user_id, config_id, images, category, force_refresh):
+            if item.get('success'):
+                succeeded += 1
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+        yield json.dumps({
+            'done': True,
+            'total': len(image_files),
+            'succeeded': succeeded
+        }, ensure_ascii=False) + '\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
@@ -1,7 +1,7 @@
 
 from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
-from app.services import weather_service, location_service
+from app.services import weather_service, forecast_service, location_service
 from app.models.weather import UserLocation
 from app import db
 from datetime import datetime
@@ -112,4 +112,15 @@ def get_weather():
             'longitude': longitude,
             'city': city
         }
-    })
\ No newline at end of file
+    })
+
+@weather_bp.route('/api/weather/cache-stats')
+@login_required
+def get_weather_cache_stats():
+    """获取天气缓存各级、天气预报缓存和IP定位缓存的命中统计"""
+    return jsonify({
+        'success': True,
+        'stats': weather_service.stats(),
+        'forecast_stats': forecast_service.stats(),
+        'location_stats': location_service.stats()
+    })
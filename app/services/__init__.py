@@ -1,5 +1,8 @@
-
 from .location import location_service
 from .weather import weather_service
+from .forecast import forecast_service
+from .wardrobe import wardrobe_context
+from .jobs import job_queue
+from .llm_config import llm_config_cache
 
-__all__ = ['location_service', 'weather_service']
\ No newline at end of file
+__all__ = ['location_service', 'weather_service', 'forecast_service', 'wardrobe_context', 'job_queue', 'llm_config_cache']
@@ -0,0 +1,270 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from flask import current_app
+from app import db
+from app.models.weather import WeatherForecastCache
+from app.utils.cache import LRUCache
+from app.utils.http import http_pool, service_url
+from app.services.weather import weather_service, CONDITION_NAMES
+from app.services.weather_prefetch import WeatherPrefetcher
+
+# 问题中的时段关键词 -> 当地时间的小时范围 [开始, 结束)
+PERIODS = [
+    (('早上', '早晨', '清晨', '上午', '明早', '早饭', '早餐'), 6, 12),
+    (('中午', '午饭', '午餐'), 11, 14),
+    (('下午',), 12, 18),
+    (('傍晚', '黄昏'), 17, 20),
+    (('晚上', '今晚', '明晚', '夜里', '夜间', '夜晚', '晚饭', '晚餐'), 18, 24),
+]
+TOMORROW_WORDS = ('明天', '明早', '明晚', '明日')
+WHOLE_DAY_WORDS = ('今天', '今日', '全天', '一天', '整天')
+DAY_NAMES = ['今天', '明天', '后天']
+
+
+class ForecastService:
+    """逐时天气预报服务
+
+    使用 OpenWeatherMap 的5天/3小时预报接口，每个geohash网格（与 WeatherService 相同的缓存键）
+    获取一次未来 WEATHER_FORECAST_HOURS 小时的预报，缓存在进程内和数据库（WeatherForecastCache）中，
+    有效期由 WEATHER_FORECAST_CACHE_DURATION 单独配置。用户提问时只从缓存中截取问题涉及的时段，
+    同一区域一整天的提问共用一次预报请求。预报始终由后台的 WeatherPrefetcher 获取和提前刷新，
+    聊天请求不等待预报API，还没有预报时prompt中不包含预报。
+    """
+
+    def __init__(self):
+        self.base_url = "http://api.openweathermap.org/data/2.5/forecast"
+        self._memory: Optional[LRUCache] = None  # cache_key -> 未过期的预报
+        self._failures: Optional[LRUCache] = None  # 最近获取失败的网格，期间不再重试
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.prefetcher = WeatherPrefetcher(self, 'forecast')
+
+    @staticmethod
+    def enabled() -> bool:
+        return current_app.config.get('WEATHER_FORECAST_ENABLED', True)
+
+    def _get_memory(self) -> LRUCache:
+        if self._memory is None:
+            with self._lock:
+                if self._memory is None:
+                    self._memory = LRUCache(maxsize=current_app.config.get('WEATHER_MEMORY_CACHE_SIZE', 1024))
+        return self._memory
+
+    def _get_failures(self) -> LRUCache:
+        if self._failures is None:
+            with self._lock:
+                if self._failures is None:
+                    self._failures = LRUCache(
+                        maxsize=current_app.config.get('WEATHER_MEMORY_CACHE_SIZE', 1024),
+                        ttl=current_app.config.get('WEATHER_FORECAST_RETRY_INTERVAL', 300)
+                    )
+        return self._failures
+
+    def fetch_forecast(self, latitude: float, longitude: float) -> Optional[Dict]:
+        """从OpenWeatherMap API获取预报，返回 {'timezone_offset': 秒, 'entries': [时段]}"""
+        try:
+            hours = current_app.config.get('WEATHER_FORECAST_HOURS', 48)
+            params = {
+                'lat': latitude,
+                'lon': longitude,
+                'appid': weather_service.get_api_key(),
+                'units': 'metric',
+                'cnt': max(1, -(-hours // 3))  # 每个时段3小时
+            }
+            response = http_pool.get(
+                'openweather', service_url('openweather-forecast', self.base_url), params=params
+            )
+            if response.status_code != 200:
+                current_app.logger.error(
+                    f"Forecast API error: {response.status_code} - {response.text}"
+                )
+                return None
+            data = response.json()
+            return {
+                'timezone_offset': int((data.get('city') or {}).get('timezone') or 0),
+                'entries': [
+                    {
+                        'dt': item['dt'],
+                        'temperature': item['main']['temp'],
+                        'condition': item['weather'][0]['main'],
+                        'humidity': item['main']['humidity'],
+                        'wind_speed': item['wind']['speed'],
+                        'pop': item.get('pop', 0)  # 降水概率，0~1
+                    }
+                    for item in data.get('list', [])
+                ]
+            }
+        except Exception as e:
+            current_app.logger.error(f"Error fetching forecast: {str(e)}")
+            return None
+
+    def get_forecast(self, latitude: float, longitude: float, city: str) -> Optional[Dict]:
+        """获取预报，只读取缓存，不在请求中等待预报API
+
+        缓存过期或不存在时交给后台线程刷新，期间返回过期的缓存（已经过去的时段在截取时会被跳过），
+        没有缓存时返回None。
+        """
+        cache_key = weather_service.cache_key(latitude, longitude)
+        self.prefetcher.track(cache_key, latitude, longitude, city)
+        memory = self._get_memory()
+        forecast = memory.get(cache_key)
+        if forecast is not None:
+            return forecast
+
+        cache = WeatherForecastCache.lookup(cache_key)
+        if cache and cache.expires_in > 0:
+            forecast = self._cache_to_dict(cache)
+            memory.set(cache_key, forecast, ttl=cache.expires_in)
+            return forecast
+
+        if self._get_failures().get(cache_key) is None:
+            self.prefetcher.schedule(cache_key)
+        return self._cache_to_dict(cache) if cache else None
+
+    def cache_expires_in(self, cache_key: str) -> Optional[float]:
+        """数据库中的预报距离过期的秒数，没有缓存时返回None"""
+        cache = WeatherForecastCache.lookup(cache_key)
+        return cache.expires_in if cache else None
+
+    def needs_refresh(self, cache_key: str, lead: float) -> bool:
+        """预报不存在或距离过期不足lead秒，且最近没有获取失败"""
+        if self._get_failures().get(cache_key) is not None:
+            return False
+        expires_in = self.cache_expires_in(cache_key)
+        return expires_in is None or expires_in < lead
+
+    def refresh_forecast(self, latitude: float, longitude: float, city: str) -> Optional[Dict]:
+        """从API获取预报并写入两级缓存"""
+        return self.refresh_many([(latitude, longitude, city)]).get(weather_service.cache_key(latitude, longitude))
+
+    def refresh_many(self, locations: Iterable[Tuple[float, float, str]]) -> Dict[str, Dict]:
+        """批量获取多个网格的预报并在一个事务中写入缓存，获取失败的网格在
+        WEATHER_FORECAST_RETRY_INTERVAL 秒内不再重试
+
+        Returns:
+            cache_key -> 预报，获取失败的网格不包含在内
+        """
+        cells = {}
+        for latitude, longitude, city in locations:
+            cells.setdefault(weather_service.cache_key(latitude, longitude), (latitude, longitude, city))
+        if not cells:
+            return {}
+
+        app = current_app._get_current_object()
+        executor = weather_service._get_executor()
+        futures = {
+            cache_key: executor.submit(self._fetch_in_context, app, latitude, longitude)
+            for cache_key, (latitude, longitude, _) in cells.items()
+        }
+        forecasts = {}
+        for cache_key, future in futures.items():
+            forecast = future.result()
+            if forecast:
+                forecasts[cache_key] = forecast
+            else:
+                self._get_failures().set(cache_key, True)
+        if not forecasts:
+            return {}
+
+        try:
+            for cache_key, forecast in forecasts.items():
+                city = cells[cache_key][2]
+                WeatherForecastCache.upsert(
+                    cache_key, city or cache_key, forecast['timezone_offset'], forecast['entries']
+                )
+            self._purge_expired()
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(f"Error saving forecast cache: {str(e)}")
+            db.session.rollback()
+            return forecasts
+        memory = self._get_memory()
+        ttl = WeatherForecastCache.cache_duration().total_seconds()
+        for cache_key, forecast in forecasts.items():
+            memory.set(cache_key, forecast, ttl=ttl)
+        return forecasts
+
+    def _fetch_in_context(self, app, latitude: float, longitude: float) -> Optional[Dict]:
+        with app.app_context():
+            return self.fetch_forecast(latitude, longitude)
+
+    def _purge_expired(self):
+        """每 WEATHER_CACHE_PURGE_INTERVAL 秒最多清理一次过期一天以上的预报"""
+        interval = current_app.config.get('WEATHER_CACHE_PURGE_INTERVAL', 600)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_purge < interval:
+                return
+            self._last_purge = now
+        WeatherForecastCache.purge_expired(WeatherForecastCache.cache_duration() + timedelta(days=1))
+
+    @staticmethod
+    def _cache_to_dict(cache: WeatherForecastCache) -> Dict:
+        return {'timezone_offset': cache.timezone_offset or 0, 'entries': cache.to_list()}
+
+    @staticmethod
+    def select_window(prompt: str, local_now: datetime) -> Tuple[datetime, datetime]:
+        """根据问题中的时段关键词确定需要的时间范围（当地时间）
+
+        没有时段关键词时返回未来 WEATHER_FORECAST_DEFAULT_HOURS 小时；
+        问今天已经过去的时段（如晚上问"早上"）时返回明天的该时段。
+        """
+        tomorrow = any(word in prompt for word in TOMORROW_WORDS)
+        ranges = [(start, end) for words, start, end in PERIODS if any(word in prompt for word in words)]
+        if ranges:
+            start_hour, end_hour = min(r[0] for r in ranges), max(r[1] for r in ranges)
+        elif tomorrow:
+            start_hour, end_hour = 6, 24
+        elif any(word in prompt for word in WHOLE_DAY_WORDS):
+            start_hour, end_hour = local_now.hour, 24
+        else:
+            hours = current_app.config.get('WEATHER_FORECAST_DEFAULT_HOURS', 12)
+            return local_now, local_now + timedelta(hours=hours)
+
+        day = datetime.combine(local_now.date(), datetime.min.time())
+        if tomorrow:
+            day += timedelta(days=1)
+        start, end = day + timedelta(hours=start_hour), day + timedelta(hours=end_hour)
+        if end <= local_now:
+            start, end = start + timedelta(days=1), end + timedelta(days=1)
+        return max(start, local_now), end
+
+    def select_entries(self, forecast: Dict, prompt: str, now: Optional[datetime] = None) -> List[Dict]:
+        """截取问题涉及的时段，返回的每项增加当地时间 local_time"""
+        offset = timedelta(seconds=forecast.get('timezone_offset') or 0)
+        local_now = (now or datetime.utcnow()) + offset
+        start, end = self.select_window(prompt, local_now)
+        selected = []
+        for entry in forecast.get('entries', []):
+            local_time = datetime.utcfromtimestamp(entry['dt']) + offset
+            # 每个时段覆盖之后的3小时
+            if local_time + timedelta(hours=3) > start and local_time < end:
+                selected.append(dict(entry, local_time=local_time))
+        return selected
+
+    def format_forecast_for_prompt(self, forecast: Optional[Dict], prompt: str,
+                                   now: Optional[datetime] = None) -> str:
+        """将问题涉及时段的预报格式化为适合prompt的字符串，没有相关时段时返回空字符串"""
+        if not forecast:
+            return ""
+        offset = timedelta(seconds=forecast.get('timezone_offset') or 0)
+        today = ((now or datetime.utcnow()) + offset).date()
+        lines = []
+        for entry in self.select_entries(forecast, prompt, now):
+            days = (entry['local_time'].date() - today).days
+            day_name = DAY_NAMES[days] if 0 <= days < len(DAY_NAMES) else entry['local_time'].strftime('%m月%d日')
+            condition = CONDITION_NAMES.get(entry['condition'], entry['condition'])
+            lines.append(
+                f"{day_name}{entry['local_time']:%H:%M} {condition}，"
+                f"{entry['temperature']:.1f}°C，降水概率{round((entry.get('pop') or 0) * 100)}%，"
+                f"风速{entry['wind_speed']}米/秒"
+            )
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {'memory': self._get_memory().stats(), 'prefetch': self.prefetcher.stats()}
+
+# 创建全局服务实例
+forecast_service = ForecastService()
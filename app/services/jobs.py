@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from flask import current_app
+from app import db
+from app.models.job import Job
+
+# 各类任务的默认优先级，可通过配置项 JOB_PRIORITIES 覆盖
+DEFAULT_PRIORITIES = {
+    'chat': 10,
+    'analyze_image': 5
+}
+
+
+class JobFailed(Exception):
+    """任务执行失败，异常信息会作为任务的错误信息展示给用户"""
+    pass
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+class JobQueue:
+    """基于数据库的后台任务队列
+
+    请求线程调用 enqueue 写入任务后立即返回任务ID，由进程内的工作线程按优先级领取执行，
+    客户端轮询任务状态获取结果。不依赖外部消息队列，多个进程共享数据库时各自的工作线程都会领取任务。
+    工作线程在 create_app 中启动，重启前未执行的任务和超时的任务由任意进程继续处理。
+    任务结束后清空payload（其中可能有整张图片），只保留结果。
+    配置项：
+        JOB_QUEUE_AUTOSTART: 是否在 create_app 中启动工作线程（默认True），关闭时在首次写入或查询任务时启动
+        JOB_QUEUE_WORKERS: 每个进程的工作线程数（默认4）
+        JOB_QUEUE_POLL_INTERVAL: 空闲时检查新任务的间隔，秒（默认1）
+        JOB_VISIBILITY_TIMEOUT: 执行超过该时间的任务视为所在进程已退出，重新排队（默认300）
+        JOB_MAX_ATTEMPTS: 任务最多执行次数（默认2）
+        JOB_RETENTION: 已结束任务的保留时间，秒（默认86400）
+        JOB_PRIORITIES: 按任务类型覆盖优先级
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[int, dict], dict]] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_maintenance = 0.0
+        # 本进程最近完成的任务耗时：(任务类型, 排队秒数, 执行秒数)
+        self._latencies = deque(maxlen=1000)
+
+    def handler(self, kind: str):
+        """注册任务处理函数的装饰器，处理函数接收 (user_id, payload) 并返回可JSON序列化的结果"""
+        def decorator(func):
+            self._handlers[kind] = func
+            return func
+        return decorator
+
+    def get_priority(self, kind: str) -> int:
+        priorities = dict(DEFAULT_PRIORITIES)
+        priorities.update(current_app.config.get('JOB_PRIORITIES', {}))
+        return priorities.get(kind, 0)
+
+    def enqueue(self, kind: str, user_id, payload: dict, priority: Optional[int] = None) -> Job:
+        """写入任务并唤醒工作线程，返回已提交的任务"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = Job(
+            user_id=user_id,
+            kind=kind,
+            priority=self.get_priority(kind) if priority is None else priority,
+            payload=payload
+        )
+        db.session.add(job)
+        db.session.commit()
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def start(self, app=None):
+        """启动本进程的工作线程，已启动时直接返回"""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            app = app or current_app._get_current_object()
+            for i in range(app.config.get('JOB_QUEUE_WORKERS', 4)):
+                thread = threading.Thread(target=self._worker, args=(app,), name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self, app):
+        poll_interval = app.config.get('JOB_QUEUE_POLL_INTERVAL', 1)
+        while True:
+            try:
+                with app.app_context():
+                    self._maintain()
+                    job = Job.claim_next()
+                    if job is not None:
+                        self._run(job)
+                        continue
+            except Exception as e:
+                app.logger.error(f"Job worker error: {str(e)}")
+            # 没有任务时等待新任务写入或轮询间隔到期
+            self._wakeup.wait(poll_interval)
+            self._wakeup.clear()
+
+    def _maintain(self):
+        """每分钟最多一次：回收超时任务并清理过期任务"""
+        now = time.monotonic()
+        if now - self._last_maintenance < 60:
+            return
+        self._last_maintenance = now
+        config = current_app.config
+        Job.requeue_stale(config.get('JOB_VISIBILITY_TIMEOUT', 300), config.get('JOB_MAX_ATTEMPTS', 2))
+        Job.purge_finished(config.get('JOB_RETENTION', 86400))
+
+    def _run(self, job: Job):
+        handler = self._handlers.get(job.kind)
+        job_id, kind = job.id, job.kind
+        queued_seconds = (job.started_at - job.created_at).total_seconds()
+        started = time.monotonic()
+        try:
+            if handler is None:
+                raise JobFailed(f'未知的任务类型: {kind}')
+            result = handler(job.user_id, job.payload_dict)
+            values = {
+                Job.status: Job.SUCCEEDED,
+                Job.result: json.dumps(result, ensure_ascii=False)
+            }
+        except JobFailed as e:
+            db.session.rollback()
+            values = {Job.status: Job.FAILED, Job.error: str(e)[:500]}
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Job {job_id} ({kind}) failed: {str(e)}")
+            values = {Job.status: Job.FAILED, Job.error: f'处理任务时发生错误: {str(e)}'[:500]}
+
+        values[Job.finished_at] = datetime.utcnow()
+        values[Job.payload] = None
+        Job.query.filter_by(id=job_id).update(values, synchronize_session=False)
+        db.session.commit()
+        self._latencies.append((kind, queued_seconds, time.monotonic() - started))
+
+    def stats(self) -> dict:
+        """队列深度（所有进程）和本进程最近完成任务的排队、执行耗时"""
+        rows = db.session.query(Job.kind, Job.status, db.func.count(Job.id))\
+            .filter(Job.status.in_([Job.QUEUED, Job.RUNNING]))\
+            .group_by(Job.kind, Job.status)\
+            .all()
+        depth = {}
+        for kind, status, count in rows:
+            depth.setdefault(kind, {Job.QUEUED: 0, Job.RUNNING: 0})[status] = count
+
+        latencies = {}
+        for kind, queued_seconds, run_seconds in list(self._latencies):
+            entry = latencies.setdefault(kind, {'queued': [], 'run': []})
+            entry['queued'].append(queued_seconds)
+            entry['run'].append(run_seconds)
+
+        return {
+            'workers': len(self._threads),
+            'depth': depth,
+            'latency': {
+                kind: {
+                    'samples': len(entry['run']),
+                    'queued_p50': _percentile(entry['queued'], 50),
+                    'queued_p95': _percentile(entry['queued'], 95),
+                    'run_p50': _percentile(entry['run'], 50),
+                    'run_p95': _percentile(entry['run'], 95)
+                }
+                for kind, entry in latencies.items()
+            }
+        }
+
+
+# 创建全局任务队列实例
+job_queue = JobQueue()
@@ -0,0 +1,68 @@
+from typing import List, Optional
+from app.models import UserLLMConfig
+from app.models.cache import CacheVersion
+from app.utils.cache import LRUCache
+
+
+def snapshot_config(config: UserLLMConfig) -> UserLLMConfig:
+    """复制为不属于任何session的配置对象，可在请求和线程之间共享，只读使用"""
+    return UserLLMConfig(**{
+        column.name: getattr(config, column.name)
+        for column in UserLLMConfig.__table__.columns
+    })
+
+
+class LLMConfigCacheService:
+    """按用户缓存活跃的LLM配置
+
+    每个用户缓存一份按默认优先、ID升序排列的活跃配置快照，
+    解析当前配置和对冲/故障转移的候选配置都不再查询配置表。
+    配置保存时调用 invalidate 递增该用户的版本号（CacheVersion表），
+    每次读取只需查询一次版本号，多个worker据此保持一致。
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self._cache = LRUCache(maxsize=maxsize)  # user_id -> (version, configs)
+
+    @staticmethod
+    def _version_name(user_id) -> str:
+        return f"llm_config:{user_id}"
+
+    def _load_configs(self, user_id) -> List[UserLLMConfig]:
+        configs = UserLLMConfig.query.filter_by(
+            user_id=user_id,
+            is_active=True
+        ).order_by(UserLLMConfig.is_default.desc(), UserLLMConfig.id).all()
+        return [snapshot_config(config) for config in configs]
+
+    def get_active_configs(self, user_id) -> List[UserLLMConfig]:
+        """获取用户的活跃配置，默认配置在前"""
+        version = CacheVersion.get_version(self._version_name(user_id))
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != version:
+            entry = (version, self._load_configs(user_id))
+            self._cache.set(user_id, entry)
+        return entry[1]
+
+    def get_config(self, user_id, config_id=None) -> Optional[UserLLMConfig]:
+        """解析用户使用的配置
+
+        Args:
+            config_id: 可选，指定使用的配置ID。如果未提供，优先使用默认配置，其次使用第一个活跃配置
+        """
+        configs = self.get_active_configs(user_id)
+        if config_id:
+            return next((c for c in configs if str(c.id) == str(config_id)), None)
+        return configs[0] if configs else None
+
+    def invalidate(self, user_id):
+        """配置变更时调用，版本号随调用方的事务一起提交"""
+        CacheVersion.bump(self._version_name(user_id))
+        self._cache.delete(user_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+# 创建全局服务实例
+llm_config_cache = LLMConfigCacheService()
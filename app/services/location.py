@@ -1,19 +1,84 @@
 
+import ipaddress
+import threading
 import requests
 from flask import current_app
 import json
 from typing import Optional, Tuple, Dict
 from app.models.weather import UserLocation
+from app.utils.cache import LRUCache
+from app.utils.http import http_pool, service_url
+from app.utils.singleflight import single_flight
 
 class LocationService:
+    """位置服务
+
+    IP定位结果缓存在进程内的LRU缓存中，同一网段（IPv4按 IP_LOCATION_IPV4_PREFIX，默认/24；
+    IPv6按 IP_LOCATION_IPV6_PREFIX，默认/48）的地址共用一条缓存，同一出口地址的用户不再重复请求ip-api。
+    """
+
     def __init__(self):
         self.ip_api_url = "http://ip-api.com/json/"  # 免费的IP定位服务
-        
+        self.nominatim_url = "https://nominatim.openstreetmap.org/reverse"
+        self._ip_cache: Optional[LRUCache] = None  # 网段 -> 位置信息，定位失败时为False
+        self._lock = threading.Lock()
+
+    def _get_ip_cache(self) -> LRUCache:
+        if self._ip_cache is None:
+            with self._lock:
+                if self._ip_cache is None:
+                    self._ip_cache = LRUCache(
+                        maxsize=current_app.config.get('IP_LOCATION_CACHE_SIZE', 4096),
+                        ttl=current_app.config.get('IP_LOCATION_CACHE_TTL', 6 * 3600)
+                    )
+        return self._ip_cache
+
+    @staticmethod
+    def ip_cache_key(ip: Optional[str]) -> Optional[str]:
+        """IP定位缓存的键：地址所在的网段。未提供IP时ip-api按服务器自身的出口地址定位；无法解析时返回None"""
+        if not ip:
+            return 'self'
+        try:
+            address = ipaddress.ip_address(ip.strip())
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if address.version == 4:
+            prefix = current_app.config.get('IP_LOCATION_IPV4_PREFIX', 24)
+        else:
+            prefix = current_app.config.get('IP_LOCATION_IPV6_PREFIX', 48)
+        return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
     def get_location_by_ip(self, ip: str = None) -> Optional[Dict]:
-        """通过IP地址获取位置信息"""
+        """通过IP地址获取位置信息，优先使用同一网段的缓存结果"""
+        cache_key = self.ip_cache_key(ip)
+        if cache_key is None:
+            return self._fetch_location_by_ip(ip) or None
+
+        cache = self._get_ip_cache()
+        location = cache.get(cache_key)
+        if location is None:
+            # 同一网段的并发请求只调用一次ip-api
+            location, _ = single_flight.do(f"ip-location:{cache_key}", lambda: self._resolve_ip(cache_key, ip))
+        return dict(location) if location else None
+
+    def _resolve_ip(self, cache_key: str, ip: Optional[str]):
+        """请求ip-api并写入缓存，ip-api明确返回失败时（如内网地址）短时间缓存失败结果"""
+        location = self._fetch_location_by_ip(ip)
+        if location:
+            self._get_ip_cache().set(cache_key, location)
+        elif location is False:
+            self._get_ip_cache().set(
+                cache_key, False, ttl=current_app.config.get('IP_LOCATION_NEGATIVE_TTL', 300)
+            )
+        return location
+
+    def _fetch_location_by_ip(self, ip: Optional[str]):
+        """请求ip-api获取位置信息，ip-api返回定位失败时返回False，请求出错时返回None"""
         try:
-            url = self.ip_api_url + (ip if ip else '')
-            response = requests.get(url)
+            url = service_url('ip-api', self.ip_api_url) + (ip.strip() if ip else '')
+            response = http_pool.get('ip-api', url)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('status') == 'success':
@@ -24,7 +89,9 @@ class LocationService:
                         'country': data.get('country'),
                         'region': data.get('regionName')
                     }
-            current_app.logger.warning(f"IP定位失败: {response.text}")  # 记录失败信息，便于调
+                current_app.logger.warning(f"IP定位失败: {response.text}")  # 记录失败信息，便于调
+                return False
+            current_app.logger.warning(f"IP定位失败: {response.text}")
             return None
         except Exception as e:
             current_app.logger.error(f"Error getting location by IP: {str(e)}")
@@ -54,9 +121,10 @@ class LocationService:
             return None
 
         try:
-            url = f"https://nominatim.openstreetmap.org/reverse?lat={latitude}&lon={longitude}&format=json"
+            url = service_url('nominatim', self.nominatim_url)
+            params = {'lat': latitude, 'lon': longitude, 'format': 'json'}
             headers = {'User-Agent': 'OutfitAssistant/1.0'}
-            response = requests.get(url, headers=headers, timeout=3)
+            response = http_pool.get('nominatim', url, params=params, headers=headers)
             
             if response.status_code == 200:
                 data = response.json()
@@ -131,5 +199,9 @@ class LocationService:
         default = current_app.config['DEFAULT_LOCATION']
         return (default['latitude'], default['longitude'])
 
+    def stats(self) -> dict:
+        """IP定位缓存的命中统计"""
+        return self._get_ip_cache().stats()
+
 # 创建全局服务实例
 location_service = LocationService()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import json
+from collections import namedtuple
+from typing import List, Tuple
+from app import db
+from app.models.clothing import Clothing
+from app.models.cache import CacheVersion
+from app.utils.cache import LRUCache
+
+# prompt使用的衣物信息，不包含图片数据
+WardrobeItem = namedtuple('WardrobeItem', ['category', 'description', 'seasons', 'occasions'])
+
+def format_wardrobe_item(item: WardrobeItem) -> str:
+    """格式化单件衣物，不包含类别标题"""
+    line = f"- {item.description}"
+    if item.seasons:
+        line += f" (适用季节: {','.join(item.seasons)})"
+    if item.occasions:
+        line += f" (适用场合: {','.join(item.occasions)})"
+    return line + "\n"
+
+
+def format_wardrobe_info(items: List[WardrobeItem]) -> str:
+    """格式化衣橱信息"""
+    if not items:
+        return "暂无衣物信息"
+
+    wardrobe_by_category = {}
+    for item in items:
+        wardrobe_by_category.setdefault(item.category, []).append(item)
+
+    wardrobe_str = ""
+    for category, category_items in wardrobe_by_category.items():
+        wardrobe_str += f"\n【{category}】\n"
+        for item in category_items:
+            wardrobe_str += format_wardrobe_item(item)
+
+    return wardrobe_str
+
+
+class WardrobeContextService:
+    """按用户缓存prompt中的衣橱信息
+
+    衣物增删改时调用 invalidate 递增该用户的版本号（CacheVersion表），
+    每次读取只需查询一次版本号，版本一致时直接使用缓存，多个worker据此保持一致。
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self._cache = LRUCache(maxsize=maxsize)  # user_id -> (version, items, text)
+
+    @staticmethod
+    def _version_name(user_id) -> str:
+        return f"wardrobe:{user_id}"
+
+    def _load_items(self, user_id) -> List[WardrobeItem]:
+        """只查询prompt需要的列，避免读取图片数据"""
+        rows = db.session.query(
+            Clothing.category,
+            Clothing.description,
+            Clothing.seasons,
+            Clothing.occasions
+        ).filter_by(user_id=user_id).order_by(Clothing.id).all()
+
+        return [
+            WardrobeItem(
+                category=row.category,
+                description=row.description,
+                seasons=json.loads(row.seasons) if row.seasons else [],
+                occasions=json.loads(row.occasions) if row.occasions else []
+            )
+            for row in rows
+        ]
+
+    def _get_entry(self, user_id):
+        version = CacheVersion.get_version(self._version_name(user_id))
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != version:
+            items = self._load_items(user_id)
+            entry = (version, items, format_wardrobe_info(items))
+            self._cache.set(user_id, entry)
+        return entry
+
+    def get_items(self, user_id) -> List[WardrobeItem]:
+        """获取用户的衣物列表"""
+        return self._get_entry(user_id)[1]
+
+    def get_wardrobe_info(self, user_id) -> str:
+        """获取格式化后的衣橱信息"""
+        return self._get_entry(user_id)[2]
+
+    def get_wardrobe(self, user_id) -> Tuple[List[WardrobeItem], str]:
+        """同时获取衣物列表和格式化后的衣橱信息，只查询一次版本号"""
+        _, items, text = self._get_entry(user_id)
+        return items, text
+
+    def invalidate(self, user_id):
+        """衣物变更时调用，版本号随调用方的事务一起提交"""
+        CacheVersion.bump(self._version_name(user_id))
+        self._cache.delete(user_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+# 创建全局服务实例
+wardrobe_context = WardrobeContextService()
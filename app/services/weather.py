@@ -1,15 +1,50 @@
 
-import requests
-from datetime import datetime
-from typing import Optional, Dict
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 from flask import current_app
 from app import db
-from app.models.weather import WeatherCache
+from app.models.cache import FlightLock
+from app.models.weather import UserLocation, WeatherCache
+from app.utils import geohash
+from app.utils.cache import LRUCache
+from app.utils.http import http_pool, service_url
+from app.utils.singleflight import single_flight
+from app.services.weather_prefetch import WeatherPrefetcher
+
+# OpenWeatherMap 天气状况的中文名称
+CONDITION_NAMES = {
+    'Clear': '晴天',
+    'Clouds': '多云',
+    'Rain': '雨天',
+    'Snow': '雪天',
+    'Thunderstorm': '雷暴',
+    'Drizzle': '毛毛雨',
+    'Mist': '薄雾',
+    'Fog': '雾'
+}
 
 class WeatherService:
+    """天气服务
+
+    两级缓存：进程内LRU缓存在前，数据库缓存（WeatherCache）在后，都按经纬度所在的geohash网格
+    （精度由 WEATHER_CACHE_GEOHASH_PRECISION 配置）共享，附近的用户即使城市名不同也使用同一份天气数据。
+    最近被请求过的网格由 WeatherPrefetcher 在过期前提前刷新。
+    """
+
     def __init__(self):
         self.base_url = "http://api.openweathermap.org/data/2.5/weather"
         self.api_key = None  # 将从配置中获取
+        self._last_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self._memory: Optional[LRUCache] = None  # 进程内缓存，cache_key -> 天气信息
+        self._stats_lock = threading.Lock()
+        self._db_hits = 0
+        self._db_misses = 0
+        self._executor: Optional[ThreadPoolExecutor] = None  # 批量获取天气的线程池
+        self.prefetcher = WeatherPrefetcher(self)
 
     def get_api_key(self) -> str:
         """从Flask配置中获取API密钥"""
@@ -17,16 +52,101 @@ class WeatherService:
             self.api_key = current_app.config.get('OPENWEATHER_API_KEY')
         return self.api_key
 
-    def get_weather_from_cache(self, location: str) -> Optional[WeatherCache]:
-        """从缓存中获取天气数据"""
-        cache = WeatherCache.query.filter_by(location=location).order_by(
-            WeatherCache.timestamp.desc()
-        ).first()
-        
-        if cache and cache.is_valid:
-            return cache
+    def _get_memory(self) -> LRUCache:
+        if self._memory is None:
+            with self._stats_lock:
+                if self._memory is None:
+                    self._memory = LRUCache(maxsize=current_app.config.get('WEATHER_MEMORY_CACHE_SIZE', 1024))
+        return self._memory
+
+    @staticmethod
+    def cache_key(latitude: float, longitude: float) -> str:
+        """天气缓存的键：经纬度所在的geohash网格"""
+        precision = current_app.config.get('WEATHER_CACHE_GEOHASH_PRECISION', 5)
+        return f"gh{precision}:{geohash.encode(latitude, longitude, precision)}"
+
+    @staticmethod
+    def stale_ttl() -> float:
+        """缓存过期后仍可作为旧数据返回的秒数"""
+        return current_app.config.get('WEATHER_CACHE_STALE_TTL', 3600)
+
+    @staticmethod
+    def _expires_in(weather: Dict) -> float:
+        """距离过期的秒数，已过期时为负数"""
+        return (weather['timestamp'] + WeatherCache.cache_duration() - datetime.utcnow()).total_seconds()
+
+    def _lookup(self, cache_key: str, record_stats: bool = True, use_memory: bool = True) -> Optional[Dict]:
+        """依次查询进程内缓存和数据库缓存，返回的数据可能已过期（不超过 WEATHER_CACHE_STALE_TTL）
+
+        进程内缓存只保存未过期的数据，过期后总是回到数据库查询，以便看到其他worker刷新的结果。
+
+        Args:
+            use_memory: 为False时跳过进程内缓存，直接查询数据库
+        """
+        memory = self._get_memory()
+        if use_memory:
+            weather = memory.get(cache_key)
+            if weather is not None:
+                return dict(weather)
+
+        cache = WeatherCache.lookup(cache_key)
+        usable = cache is not None and cache.expires_in > -self.stale_ttl()
+        if record_stats:
+            with self._stats_lock:
+                if usable:
+                    self._db_hits += 1
+                else:
+                    self._db_misses += 1
+        if not usable:
+            return None
+        weather = self._cache_to_dict(cache)
+        if cache.expires_in > 0:
+            memory.set(cache_key, weather, ttl=cache.expires_in)
+        return dict(weather)
+
+    def get_weather_from_cache(self, cache_key: str) -> Optional[Dict]:
+        """从两级缓存中获取未过期的天气数据"""
+        weather = self._lookup(cache_key)
+        if weather and self._expires_in(weather) > 0:
+            return weather
         return None
 
+    def cache_expires_in(self, cache_key: str) -> Optional[float]:
+        """数据库中的缓存距离过期的秒数（包含其他worker的刷新），没有缓存时返回None"""
+        weather = self._lookup(cache_key, record_stats=False, use_memory=False)
+        return self._expires_in(weather) if weather else None
+
+    def needs_refresh(self, cache_key: str, lead: float) -> bool:
+        """缓存不存在或距离过期不足lead秒，供 WeatherPrefetcher 判断是否需要刷新"""
+        expires_in = self.cache_expires_in(cache_key)
+        return expires_in is None or expires_in < lead
+
+    def purge_expired_cache(self, force: bool = False) -> int:
+        """删除过期的天气缓存，每 WEATHER_CACHE_PURGE_INTERVAL 秒最多执行一次，随调用方的事务一起提交"""
+        interval = current_app.config.get('WEATHER_CACHE_PURGE_INTERVAL', 600)
+        with self._purge_lock:
+            now = time.monotonic()
+            if not force and now - self._last_purge < interval:
+                return 0
+            self._last_purge = now
+        # 保留仍可作为旧数据返回的行
+        return WeatherCache.purge_expired(WeatherCache.cache_duration() + timedelta(seconds=self.stale_ttl()))
+
+    def stats(self) -> dict:
+        """各级缓存的命中统计和提前刷新的统计"""
+        with self._stats_lock:
+            db_hits, db_misses = self._db_hits, self._db_misses
+        lookups = db_hits + db_misses
+        return {
+            'memory': self._get_memory().stats(),
+            'db': {
+                'hits': db_hits,
+                'misses': db_misses,
+                'hit_ratio': round(db_hits / lookups, 4) if lookups else 0.0
+            },
+            'prefetch': self.prefetcher.stats()
+        }
+
     def fetch_weather(self, latitude: float, longitude: float) -> Optional[Dict]:
         """从OpenWeatherMap API获取天气数据"""
         try:
@@ -37,7 +157,7 @@ class WeatherService:
                 'units': 'metric'  # 使用摄氏度
             }
             
-            response = requests.get(self.base_url, params=params)
+            response = http_pool.get('openweather', service_url('openweather', self.base_url), params=params)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -50,65 +170,182 @@ class WeatherService:
             return None
 
     def get_weather(self, latitude: float, longitude: float, city: str) -> Optional[Dict]:
-        """获取天气信息，优先使用缓存"""
+        """获取天气信息，优先使用缓存
+
+        缓存已过期时，启用提前刷新（WEATHER_PREFETCH_ENABLED）则直接返回旧数据并由后台线程刷新，
+        否则同步刷新，天气API不可用时返回旧数据。没有缓存时同步获取，与后台刷新共用网格的 FlightLock，
+        同一网格只请求一次天气API。
+
+        Args:
+            city: 城市名，仅作为缓存记录的展示名称，缓存按经纬度所在网格查找
+        """
+        cache_key = self.cache_key(latitude, longitude)
+        prefetch = self.prefetcher.enabled()
+        if prefetch:
+            self.prefetcher.track(cache_key, latitude, longitude, city)
+
         # 先检查缓存
-        cache = self.get_weather_from_cache(city)
-        if cache and cache.location == city:
-            return {
-                'temperature': cache.temperature,
-                'condition': cache.weather_condition,
-                'humidity': cache.humidity,
-                'wind_speed': cache.wind_speed,
-                'timestamp': cache.timestamp
-            }
-        elif cache and cache.location != city:
-            db.session.delete(cache)
-            db.session.commit()
+        weather = self._lookup(cache_key)
+        if weather and self._expires_in(weather) > 0:
+            return weather
+        if weather and prefetch:
+            # stale-while-revalidate：不在请求中等待天气API
+            self.prefetcher.schedule(cache_key)
+            return weather
+
+        # 缓存不存在或已过期时从API获取新数据，同一网格的并发请求只调用一次API
+        lock = None
+        if prefetch or current_app.config.get('SINGLE_FLIGHT_DB_LOCK', False):
+            # 与后台刷新和其他worker使用同一个 FlightLock：后获取锁的一方等待锁释放后直接读取已更新的缓存
+            timeout = current_app.config.get('SINGLE_FLIGHT_LOCK_TIMEOUT', 30)
+            lock = lambda: FlightLock.hold(f"weather:{cache_key}", timeout)
+
+        def load():
+            if lock is not None:
+                # 等待其他worker释放锁后，缓存可能已经更新
+                cached = self.get_weather_from_cache(cache_key)
+                if cached:
+                    return cached
+            return self.refresh_weather(latitude, longitude, city)
 
-        # 如果缓存不存在或已过期，从API获取新数据
+        fresh, _ = single_flight.do(f"weather:{cache_key}", load, lock=lock)
+        if fresh:
+            return dict(fresh)
+        # 天气API不可用时返回旧数据
+        return weather
+
+    def refresh_weather(self, latitude: float, longitude: float, city: str) -> Optional[Dict]:
+        """从API获取天气并写入两级缓存"""
+        cache_key = self.cache_key(latitude, longitude)
         weather_data = self.fetch_weather(latitude, longitude)
         if weather_data:
-            # 保存到缓存
-            cache = WeatherCache(
-                location=city,
-                temperature=weather_data['main']['temp'],
-                weather_condition=weather_data['weather'][0]['main'],
-                humidity=weather_data['main']['humidity'],
-                wind_speed=weather_data['wind']['speed']
-            )
-            db.session.add(cache)
-            try:
-                db.session.commit()
-            except Exception as e:
-                current_app.logger.error(f"Error saving weather cache: {str(e)}")
-                db.session.rollback()
-
-            return {
-                'temperature': cache.temperature,
-                'condition': cache.weather_condition,
-                'humidity': cache.humidity,
-                'wind_speed': cache.wind_speed,
-                'timestamp': cache.timestamp
-            }
+            values, weather = self._parse_weather(weather_data)
+            self._store([(cache_key, city, values, weather)])
+            return weather
         return None
 
+    def refresh_many(self, locations: Iterable[Tuple[float, float, str]]) -> Dict[str, Dict]:
+        """批量从API获取多个位置的天气并写入两级缓存
+
+        位置先按网格去重，每个网格只请求一次；请求在有界线程池（WEATHER_BULK_CONCURRENCY）中并发执行，
+        全部完成后在一个事务中写入缓存。
+
+        Args:
+            locations: (纬度, 经度, 城市名) 列表
+        Returns:
+            cache_key -> 天气信息，获取失败的网格不包含在内
+        """
+        cells = {}
+        for latitude, longitude, city in locations:
+            cells.setdefault(self.cache_key(latitude, longitude), (latitude, longitude, city))
+        if not cells:
+            return {}
+
+        app = current_app._get_current_object()
+        executor = self._get_executor()
+        futures = {
+            cache_key: executor.submit(self._fetch_in_context, app, latitude, longitude)
+            for cache_key, (latitude, longitude, _) in cells.items()
+        }
+        entries = []
+        for cache_key, future in futures.items():
+            weather_data = future.result()
+            if weather_data:
+                values, weather = self._parse_weather(weather_data)
+                entries.append((cache_key, cells[cache_key][2], values, weather))
+        if entries:
+            self._store(entries)
+        return {cache_key: dict(weather) for cache_key, _, _, weather in entries}
+
+    def warm_user_locations(self, force: bool = False) -> Dict[str, int]:
+        """为所有用户保存的位置批量预热天气缓存
+
+        Args:
+            force: 为False时跳过缓存未过期的网格
+        """
+        rows = db.session.query(UserLocation.latitude, UserLocation.longitude, UserLocation.city).all()
+        cells = {}
+        for latitude, longitude, city in rows:
+            cells.setdefault(self.cache_key(latitude, longitude), (latitude, longitude, city))
+        fresh = set() if force else WeatherCache.fresh_keys(list(cells))
+        refreshed = self.refresh_many(cell for cache_key, cell in cells.items() if cache_key not in fresh)
+        return {
+            'locations': len(rows),
+            'cells': len(cells),
+            'skipped': len(fresh),
+            'refreshed': len(refreshed),
+            'failed': len(cells) - len(fresh) - len(refreshed)
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._stats_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=current_app.config.get('WEATHER_BULK_CONCURRENCY', 8),
+                        thread_name_prefix='weather-fetch'
+                    )
+        return self._executor
+
+    def _fetch_in_context(self, app, latitude: float, longitude: float) -> Optional[Dict]:
+        with app.app_context():
+            return self.fetch_weather(latitude, longitude)
+
+    @staticmethod
+    def _parse_weather(weather_data: Dict) -> Tuple[Dict, Dict]:
+        """将API响应转换为 (缓存表的列, 天气信息)"""
+        values = {
+            'temperature': weather_data['main']['temp'],
+            'weather_condition': weather_data['weather'][0]['main'],
+            'humidity': weather_data['main']['humidity'],
+            'wind_speed': weather_data['wind']['speed']
+        }
+        weather = {
+            'temperature': values['temperature'],
+            'condition': values['weather_condition'],
+            'humidity': values['humidity'],
+            'wind_speed': values['wind_speed'],
+            'timestamp': datetime.utcnow()
+        }
+        return values, weather
+
+    def _store(self, entries: List[Tuple[str, str, Dict, Dict]]):
+        """在一个事务中写入多个网格的天气，提交成功后写入进程内缓存
+
+        Args:
+            entries: (cache_key, 城市名, 缓存表的列, 天气信息) 列表
+        """
+        # 每个缓存键只有一行，原地更新
+        try:
+            for cache_key, city, values, _ in entries:
+                WeatherCache.upsert(cache_key, city or cache_key, values)
+            self.purge_expired_cache()
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(f"Error saving weather cache: {str(e)}")
+            db.session.rollback()
+            return
+        memory = self._get_memory()
+        ttl = WeatherCache.cache_duration().total_seconds()
+        for cache_key, _, _, weather in entries:
+            memory.set(cache_key, weather, ttl=ttl)
+
+    @staticmethod
+    def _cache_to_dict(cache: WeatherCache) -> Dict:
+        return {
+            'temperature': cache.temperature,
+            'condition': cache.weather_condition,
+            'humidity': cache.humidity,
+            'wind_speed': cache.wind_speed,
+            'timestamp': cache.timestamp
+        }
+
     def format_weather_for_prompt(self, weather_data: Dict) -> str:
         """将天气信息格式化为适合prompt的字符串"""
         if not weather_data:
             return "天气信息暂不可用"
 
-        condition_map = {
-            'Clear': '晴天',
-            'Clouds': '多云',
-            'Rain': '雨天',
-            'Snow': '雪天',
-            'Thunderstorm': '雷暴',
-            'Drizzle': '毛毛雨',
-            'Mist': '薄雾',
-            'Fog': '雾'
-        }
-
-        weather_condition = condition_map.get(
+        weather_condition = CONDITION_NAMES.get(
             weather_data['condition'], 
             weather_data['condition']
         )
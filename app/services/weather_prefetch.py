@@ -0,0 +1,146 @@
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+from flask import current_app
+from app.models.cache import FlightLock
+
+
+class WeatherPrefetcher:
+    """天气缓存的提前刷新，天气（WeatherService）和天气预报（ForecastService）各使用一个实例
+
+    记录最近被请求过的网格，由后台线程在缓存过期前提前刷新；缓存已过期时
+    服务先返回旧数据，再通过 schedule 交给后台线程刷新（stale-while-revalidate），
+    聊天等请求不再同步等待天气API。
+    每个worker都有自己的后台线程，刷新前先获取网格的 FlightLock 并重新检查数据库中的缓存，
+    同一网格在多个worker之间只刷新一次。
+    服务需要提供 needs_refresh(cache_key, lead) 和 refresh_many(locations)。
+    配置项：
+        WEATHER_PREFETCH_ENABLED: 是否启用（默认True）
+        WEATHER_PREFETCH_INTERVAL: 后台线程检查的间隔，秒（默认30）
+        WEATHER_PREFETCH_LEAD: 距离过期不足该秒数时提前刷新（默认300）
+        WEATHER_PREFETCH_ACTIVE_WINDOW: 只刷新该秒数内被请求过的网格（默认7200）
+    """
+
+    def __init__(self, service, name: str = 'weather'):
+        self._service = service
+        self.name = name  # FlightLock 键和线程名的前缀，与前台刷新使用的锁键一致
+        self._cells: Dict[str, Tuple[float, float, str, float]] = {}  # cache_key -> (纬度, 经度, 城市, 最近请求时间)
+        self._pending: Set[str] = set()  # 已过期、等待后台刷新的网格
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshed = 0
+        self.failed = 0
+        self.stale_served = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return current_app.config.get('WEATHER_PREFETCH_ENABLED', True)
+
+    def track(self, cache_key: str, latitude: float, longitude: float, city: str):
+        """记录一次天气请求，该网格在活跃期内会被提前刷新"""
+        with self._lock:
+            self._cells[cache_key] = (latitude, longitude, city, time.monotonic())
+        self._ensure_thread()
+
+    def schedule(self, cache_key: str):
+        """已返回过期数据，请后台线程尽快刷新"""
+        with self._lock:
+            self._pending.add(cache_key)
+            self.stale_served += 1
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            app = current_app._get_current_object()
+            self._thread = threading.Thread(
+                target=self._run, args=(app,), name=f'{self.name}-prefetch', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    self.refresh_due()
+            except Exception as e:
+                app.logger.error(f"{self.name} prefetch error: {str(e)}")
+            self._wakeup.wait(app.config.get('WEATHER_PREFETCH_INTERVAL', 30))
+            self._wakeup.clear()
+
+    def _due_cells(self) -> List[Tuple[str, float, float, str]]:
+        """需要刷新的网格：等待刷新的，以及活跃且即将过期的"""
+        config = current_app.config
+        window = config.get('WEATHER_PREFETCH_ACTIVE_WINDOW', 7200)
+        now = time.monotonic()
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            # 等待刷新的网格即使已不活跃也保留到本轮刷新
+            for cache_key in [key for key, cell in self._cells.items()
+                              if now - cell[3] > window and key not in pending]:
+                del self._cells[cache_key]
+            cells = dict(self._cells)
+
+        return [
+            (cache_key, latitude, longitude, city)
+            for cache_key, (latitude, longitude, city, _) in cells.items()
+            if cache_key in pending or self._is_due(cache_key)
+        ]
+
+    def _is_due(self, cache_key: str) -> bool:
+        """数据库中的缓存不存在或距离过期不足 WEATHER_PREFETCH_LEAD 秒"""
+        return self._service.needs_refresh(cache_key, current_app.config.get('WEATHER_PREFETCH_LEAD', 300))
+
+    def refresh_due(self) -> int:
+        """批量刷新需要刷新的网格，返回成功刷新的数量
+
+        每批网格先获取各自的 FlightLock：被其他worker持有的网格跳过，获取后重新检查数据库，
+        已被其他worker刷新的网格不再请求天气API。
+        """
+        due = self._due_cells()
+        batch_size = max(1, current_app.config.get('WEATHER_BULK_CONCURRENCY', 8) * 4)
+        refreshed = 0
+        for start in range(0, len(due), batch_size):
+            refreshed += self._refresh_locked(due[start:start + batch_size])
+        return refreshed
+
+    def _refresh_locked(self, cells: List[Tuple[str, float, float, str]]) -> int:
+        """持有 FlightLock 刷新一批网格，返回成功刷新的数量"""
+        ttl = current_app.config.get('SINGLE_FLIGHT_LOCK_TIMEOUT', 30)
+        owner = uuid.uuid4().hex
+        locked = []
+        try:
+            due = []
+            for cache_key, latitude, longitude, city in cells:
+                if not FlightLock.acquire(f"{self.name}:{cache_key}", owner, ttl):
+                    continue
+                locked.append(cache_key)
+                if self._is_due(cache_key):
+                    due.append((latitude, longitude, city))
+            if not due:
+                return 0
+            refreshed = self._service.refresh_many(due)
+        finally:
+            for cache_key in locked:
+                FlightLock.release(f"{self.name}:{cache_key}", owner)
+        with self._lock:
+            self.refreshed += len(refreshed)
+            self.failed += len(due) - len(refreshed)
+        return len(refreshed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'running': self._thread is not None,
+                'tracked_cells': len(self._cells),
+                'pending': len(self._pending),
+                'refreshed': self.refreshed,
+                'failed': self.failed,
+                'stale_served': self.stale_served
+            }
@@ -0,0 +1,40 @@
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# 各精度网格的近似尺寸（赤道附近，宽 x 高）
+PRECISION_SIZES = {
+    3: '156km x 156km',
+    4: '39.1km x 19.5km',
+    5: '4.9km x 4.9km',
+    6: '1.2km x 0.61km',
+    7: '153m x 153m',
+}
+
+
+def encode(latitude: float, longitude: float, precision: int = 5) -> str:
+    """将经纬度编码为geohash，相邻位置落在同一网格时编码相同
+
+    Args:
+        precision: 编码长度，越长网格越小，参见 PRECISION_SIZES
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # 偶数位编码经度，奇数位编码纬度
+    while len(chars) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits <<= 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app, has_app_context
+from app.utils.resilience import outbound, IDEMPOTENT_METHODS
+
+# 各外部服务默认的连接池与超时参数，可通过配置项 HTTP_POOL_SETTINGS 按名称覆盖
+DEFAULT_POOL_SETTINGS = {
+    'pool_connections': 4,    # 每个会话缓存的主机连接池数量
+    'pool_maxsize': 10,       # 每个主机保持的最大keep-alive连接数
+    'pool_block': False,      # 连接池耗尽时是否阻塞等待
+    'connect_timeout': 3.05,  # 建立连接的超时时间（秒）
+    'read_timeout': 60,       # 等待响应的超时时间（秒）
+}
+
+PROVIDER_POOL_SETTINGS = {
+    'baidu': {'pool_maxsize': 10},
+    'xunfei': {'pool_maxsize': 10},
+    'silicon': {'pool_maxsize': 10},
+    'openrouter': {'pool_maxsize': 20, 'read_timeout': 90},
+    'openweather': {'read_timeout': 5},
+    'ip-api': {'connect_timeout': 2, 'read_timeout': 3},
+    'nominatim': {'connect_timeout': 2, 'read_timeout': 3},
+}
+
+
+class HTTPSessionPool:
+    """进程级的HTTP会话池，每个外部服务复用一个带连接池的 requests.Session"""
+
+    def __init__(self):
+        self._sessions: Dict[str, requests.Session] = {}
+        self._settings: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _resolve_settings(self, name: str) -> dict:
+        """合并默认参数、服务商参数和应用配置中的覆盖参数"""
+        settings = dict(DEFAULT_POOL_SETTINGS)
+        settings.update(PROVIDER_POOL_SETTINGS.get(name, {}))
+        if has_app_context():
+            overrides = current_app.config.get('HTTP_POOL_SETTINGS', {})
+            settings.update(overrides.get('default', {}))
+            settings.update(overrides.get(name, {}))
+        return settings
+
+    def get_session(self, name: str) -> requests.Session:
+        """获取指定服务的共享会话，首次使用时创建"""
+        session = self._sessions.get(name)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is None:
+                settings = self._resolve_settings(name)
+                adapter = HTTPAdapter(
+                    pool_connections=settings['pool_connections'],
+                    pool_maxsize=settings['pool_maxsize'],
+                    pool_block=settings['pool_block']
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._settings[name] = settings
+                self._sessions[name] = session
+        return session
+
+    def get_timeout(self, name: str) -> Tuple[float, float]:
+        """获取指定服务的 (连接超时, 读取超时)"""
+        settings = self._settings.get(name) or self._resolve_settings(name)
+        return (settings['connect_timeout'], settings['read_timeout'])
+
+    def request(self, name: str, method: str, url: str, timeout: Optional[Tuple[float, float]] = None, **kwargs) -> requests.Response:
+        """通过指定服务的共享会话发送请求
+
+        未指定超时时使用该服务的默认超时。请求受该服务的调用策略约束（总时限、重试和熔断），
+        熔断时抛出 CircuitOpenError，超出总时限时抛出 DeadlineExceededError。
+        POST等非幂等请求只在请求确定未被服务端处理时重试。
+        """
+        session = self.get_session(name)
+        connect_timeout, read_timeout = timeout or self.get_timeout(name)
+
+        def send(remaining):
+            return session.request(method, url, timeout=(connect_timeout, min(read_timeout, remaining)), **kwargs)
+
+        return outbound.call(name, url, send, idempotent=method.upper() in IDEMPOTENT_METHODS)
+
+    def post(self, name: str, url: str, **kwargs) -> requests.Response:
+        return self.request(name, 'POST', url, **kwargs)
+
+    def get(self, name: str, url: str, **kwargs) -> requests.Response:
+        return self.request(name, 'GET', url, **kwargs)
+
+    def close(self):
+        """关闭所有会话（进程退出或测试时使用）"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._settings.clear()
+
+
+class AsyncHTTPClientPool:
+    """异步HTTP客户端池
+
+    httpx.AsyncClient 绑定在创建它的事件循环上，因此按 (事件循环, 服务名) 复用客户端。
+    同一事件循环上的所有并发请求共享同一组keep-alive连接。
+    """
+
+    def __init__(self, sync_pool: HTTPSessionPool):
+        self._sync_pool = sync_pool
+        self._clients = weakref.WeakKeyDictionary()  # loop -> {name: AsyncClient}
+
+    def get_client(self, name: str) -> httpx.AsyncClient:
+        """获取当前事件循环中指定服务的共享客户端"""
+        loop = asyncio.get_running_loop()
+        clients = self._clients.setdefault(loop, {})
+        client = clients.get(name)
+        if client is None:
+            settings = self._sync_pool._resolve_settings(name)
+            connect_timeout, read_timeout = settings['connect_timeout'], settings['read_timeout']
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings['pool_maxsize'],
+                    max_keepalive_connections=settings['pool_maxsize']
+                ),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+            )
+            clients[name] = client
+        return client
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """通过指定服务的共享客户端发送请求，受该服务的调用策略约束"""
+        client = self.get_client(name)
+        connect_timeout, read_timeout = self._sync_pool.get_timeout(name)
+
+        async def send(remaining):
+            timeout = httpx.Timeout(min(read_timeout, remaining), connect=connect_timeout)
+            return await client.request(method, url, timeout=timeout, **kwargs)
+
+        return await outbound.acall(name, url, send, idempotent=method.upper() in IDEMPOTENT_METHODS)
+
+    async def post(self, name: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(name, 'POST', url, **kwargs)
+
+    async def get(self, name: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(name, 'GET', url, **kwargs)
+
+    async def aclose(self):
+        """关闭当前事件循环上的所有客户端，应在事件循环结束前调用"""
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+
+def service_url(name: str, default: str) -> str:
+    """外部服务的地址，可通过配置项 SERVICE_URLS 按名称覆盖（如指向本地的模拟服务）"""
+    if has_app_context():
+        return current_app.config.get('SERVICE_URLS', {}).get(name, default)
+    return default
+
+
+class BackgroundEventLoop:
+    """在后台线程中常驻的事件循环
+
+    同步代码（如Flask视图）通过 run 提交协程并等待结果。所有调用共用同一个事件循环，
+    该循环上的 httpx.AsyncClient 在多次调用之间保持keep-alive连接。
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='async-http', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def run(self, coro):
+        """在常驻事件循环中运行协程并返回结果，协程中可以使用调用方的应用上下文"""
+        app = current_app._get_current_object() if has_app_context() else None
+
+        async def runner():
+            if app is None:
+                return await coro
+            with app.app_context():
+                return await coro
+
+        future = asyncio.run_coroutine_threadsafe(runner(), self._get_loop())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+
+def run_async(coro):
+    """在常驻的后台事件循环中运行协程，供同步代码调用异步接口使用"""
+    return background_loop.run(coro)
+
+
+# 创建全局会话池实例
+http_pool = HTTPSessionPool()
+async_http_pool = AsyncHTTPClientPool(http_pool)
+background_loop = BackgroundEventLoop()
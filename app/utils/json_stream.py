@@ -0,0 +1,138 @@
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """从逐段到达的文本中提取第一个完整的JSON对象
+
+    模型输出的JSON前后可能带有说明文字或代码块标记。解析器只扫描新到达的文本，
+    顶层对象的每个字段值完整时立即返回该字段，对象闭合后检查是否包含全部必需字段：
+    包含时 done 为True，调用方可停止读取；否则继续寻找下一个对象。
+
+    Args:
+        required_keys: 必需的顶层字段，为空时第一个完整对象即可
+    """
+
+    def __init__(self, required_keys: Iterable[str] = ()):
+        self.required_keys = set(required_keys)
+        self.result: Optional[dict] = None        # 第一个包含全部必需字段的对象
+        self.first_object: Optional[dict] = None  # 第一个完整的对象，缺少必需字段时作为备选
+        self._buffer = ''
+        self._pos = 0
+        self._reset()
+
+    def _reset(self):
+        self._depth = 0
+        self._start = None       # 当前对象在缓冲区中的起始位置
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect = None      # 顶层对象中下一个期望的成分：key、colon、value
+        self._key = None
+        self._value_start = None
+        self._fields = {}
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    @property
+    def fields(self) -> dict:
+        """当前对象中已完整的顶层字段"""
+        return dict(self._fields)
+
+    def _finish_value(self, end: int) -> Optional[Tuple[str, Any]]:
+        text = self._buffer[self._value_start:end].strip()
+        self._value_start = None
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return None
+        self._fields[self._key] = value
+        return self._key, value
+
+    def _close_object(self, end: int):
+        try:
+            data = json.loads(self._buffer[self._start:end])
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            if self.first_object is None:
+                self.first_object = data
+            if self.required_keys <= data.keys():
+                self.result = data
+        # 丢弃已扫描的文本，继续寻找下一个对象
+        self._buffer = self._buffer[end:]
+        self._pos = 0
+        self._reset()
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """追加一段文本，返回本次新完整的顶层字段 [(字段名, 值)]"""
+        completed = []
+        if self.done:
+            return completed
+        self._buffer += text
+        while self._pos < len(self._buffer) and not self.done:
+            if self._start is None:
+                # 对象之外的说明文字无需保留
+                index = self._buffer.find('{', self._pos)
+                if index == -1:
+                    self._buffer = ''
+                    self._pos = 0
+                    break
+                self._buffer = self._buffer[index:]
+                self._start = 0
+                self._pos = 1
+                self._depth = 1
+                self._expect = 'key'
+                continue
+
+            i = self._pos
+            char = self._buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == 'key':
+                        try:
+                            self._key = json.loads(self._buffer[self._string_start:i + 1])
+                        except ValueError:
+                            self._key = None
+                        self._expect = 'colon'
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._expect == 'value' and self._value_start is not None:
+                        field = self._finish_value(i)
+                        if field:
+                            completed.append(field)
+                    self._close_object(i + 1)
+            elif self._depth == 1:
+                if char == ':' and self._expect == 'colon':
+                    self._expect = 'value'
+                    self._value_start = i + 1
+                elif char == ',' and self._expect == 'value':
+                    field = self._finish_value(i)
+                    if field:
+                        completed.append(field)
+                    self._expect = 'key'
+        return completed
+
+
+def extract_json_object(text: str, required_keys: Iterable[str] = ()) -> Optional[dict]:
+    """从完整文本中提取第一个包含全部必需字段的JSON对象，没有时返回第一个完整的对象"""
+    parser = IncrementalJSONParser(required_keys)
+    parser.feed(text)
+    return parser.result or parser.first_object
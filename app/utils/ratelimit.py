@@ -0,0 +1,249 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from flask import current_app, has_app_context
+from app.utils.cache import LRUCache
+
+# 默认限制，可通过配置项 LLM_RATE_LIMITS 按范围或服务商名覆盖
+# rate: 每秒补充的令牌数；burst: 令牌桶容量；concurrency: 同时进行的请求数上限；为None时不限制
+DEFAULT_LIMITS = {
+    'user': {'rate': 1, 'burst': 10, 'concurrency': 3},
+    'provider': {'rate': 5, 'burst': 20, 'concurrency': 10},
+    # OpenRouter免费模型限制约为每分钟20次
+    'openrouter': {'rate': 0.3, 'burst': 5, 'concurrency': 4},
+}
+
+
+class RateLimitExceeded(Exception):
+    """在等待时限内未能获得令牌或并发名额"""
+    pass
+
+
+class TokenBucket:
+    """令牌桶
+
+    采用预约方式：取令牌时允许余额为负，调用方按欠缺的令牌数等待，先到的请求先获得令牌。
+    clock 为返回秒数的单调时钟，测试时可替换。
+    """
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        """当前可用的令牌数，为负时表示已被预约的欠额"""
+        with self._lock:
+            return min(self.burst, self._tokens + (self._clock() - self._updated) * self.rate)
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def cancel(self):
+        """放弃等待时退还预约的令牌"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class _Limit:
+    """单个键（某个用户或某个服务商的API Key）的令牌桶和并发名额"""
+
+    def __init__(self, policy: dict, clock: Callable[[], float] = time.monotonic):
+        self.bucket = TokenBucket(policy['rate'], policy.get('burst') or 1, clock) if policy.get('rate') else None
+        self.semaphore = threading.BoundedSemaphore(policy['concurrency']) if policy.get('concurrency') else None
+
+
+class Lease:
+    """已获得的并发名额，请求结束后释放"""
+
+    def __init__(self, semaphores: List[threading.BoundedSemaphore]):
+        self._semaphores = semaphores
+
+    def release(self):
+        for semaphore in self._semaphores:
+            semaphore.release()
+        self._semaphores = []
+
+
+class OutboundLimiter:
+    """按用户和服务商（API Key）限制外部调用的速率和并发
+
+    超出限制的请求排队等待，超过 LLM_LIMIT_WAIT 秒仍未获得令牌或名额时抛出 RateLimitExceeded。
+    各键的限制保存在LRU缓存中，超过 LLM_LIMITER_IDLE_TTL 秒未使用或超出 LLM_LIMITER_MAX_KEYS 个时淘汰。
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._limits: Optional[LRUCache] = None  # 键 -> _Limit
+        self._lock = threading.Lock()
+        self._waits: Dict[str, deque] = {}  # 范围 -> 最近的排队等待时间
+        self._rejected: Dict[str, int] = {}
+
+    def get_policy(self, scope: str, name: Optional[str] = None) -> dict:
+        policy = dict(DEFAULT_LIMITS[scope])
+        if name:
+            policy.update(DEFAULT_LIMITS.get(name, {}))
+        if has_app_context():
+            overrides = current_app.config.get('LLM_RATE_LIMITS', {})
+            policy.update(overrides.get(scope, {}))
+            if name:
+                policy.update(overrides.get(name, {}))
+        return policy
+
+    def _get_limits(self) -> LRUCache:
+        if self._limits is None:
+            config = current_app.config if has_app_context() else {}
+            with self._lock:
+                if self._limits is None:
+                    self._limits = LRUCache(
+                        maxsize=config.get('LLM_LIMITER_MAX_KEYS', 10000),
+                        ttl=config.get('LLM_LIMITER_IDLE_TTL', 3600)
+                    )
+        return self._limits
+
+    def _get_limit(self, key: str, scope: str, name: Optional[str]) -> _Limit:
+        limits = self._get_limits()
+        limit = limits.get(key)
+        if limit is None:
+            policy = self.get_policy(scope, name)
+            with self._lock:
+                limit = limits.get(key)
+                if limit is None:
+                    limit = _Limit(policy, self._clock)
+                    limits.set(key, limit)
+                    return limit
+        # 每次使用时刷新过期时间，只淘汰长时间未使用的键
+        limits.set(key, limit)
+        return limit
+
+    def _resolve(self, keys: List[Tuple[str, str, Optional[str]]]) -> List[Tuple[str, _Limit]]:
+        """keys: [(范围, 键, 服务商名)]，范围为 user 或 provider"""
+        return [(scope, self._get_limit(f"{scope}:{key}", scope, name)) for scope, key, name in keys]
+
+    @staticmethod
+    def _max_wait() -> float:
+        if has_app_context():
+            return current_app.config.get('LLM_LIMIT_WAIT', 30)
+        return 30
+
+    def _reserve_tokens(self, limits, deadline: float) -> Tuple[float, list]:
+        """为所有键预约令牌，返回 (需要等待的秒数, 已预约令牌的限制)，超出时限时退还令牌并抛出异常"""
+        reserved = []
+        wait = 0.0
+        limiting_scope = None  # 等待时间最长的范围
+        for scope, limit in limits:
+            if limit.bucket is None:
+                continue
+            scope_wait = limit.bucket.reserve()
+            if scope_wait > wait:
+                wait, limiting_scope = scope_wait, scope
+            reserved.append(limit)
+        if self._clock() + wait > deadline:
+            for limit in reserved:
+                limit.bucket.cancel()
+            self._reject([limiting_scope])
+            raise RateLimitExceeded(f"rate limit wait {wait:.1f}s exceeds deadline")
+        return wait, reserved
+
+    @staticmethod
+    def _refund(reserved):
+        """未发出请求（等待并发名额超时或被取消）时退还预约的令牌"""
+        for limit in reserved:
+            limit.bucket.cancel()
+
+    def _reject(self, scopes):
+        with self._lock:
+            for scope in set(scopes):
+                self._rejected[scope] = self._rejected.get(scope, 0) + 1
+
+    def _record_wait(self, limits, waited: float):
+        with self._lock:
+            for scope in {scope for scope, _ in limits}:
+                self._waits.setdefault(scope, deque(maxlen=1000)).append(waited)
+
+    def acquire(self, keys: List[Tuple[str, str, Optional[str]]]) -> Lease:
+        """等待令牌和并发名额，返回需要在请求结束后释放的Lease"""
+        limits = self._resolve(keys)
+        started = self._clock()
+        deadline = started + self._max_wait()
+        wait, reserved = self._reserve_tokens(limits, deadline)
+        acquired = []
+        try:
+            if wait:
+                time.sleep(wait)
+            for scope, limit in limits:
+                if limit.semaphore is None:
+                    continue
+                if not limit.semaphore.acquire(timeout=max(0.0, deadline - self._clock())):
+                    self._reject([scope])
+                    raise RateLimitExceeded(f"{scope} concurrency limit wait exceeds deadline")
+                acquired.append(limit.semaphore)
+        except BaseException:
+            Lease(acquired).release()
+            self._refund(reserved)
+            raise
+
+        self._record_wait(limits, self._clock() - started)
+        return Lease(acquired)
+
+    async def aacquire(self, keys: List[Tuple[str, str, Optional[str]]]) -> Lease:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        limits = self._resolve(keys)
+        started = self._clock()
+        deadline = started + self._max_wait()
+        wait, reserved = self._reserve_tokens(limits, deadline)
+        acquired = []
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            for scope, limit in limits:
+                if limit.semaphore is None:
+                    continue
+                while not limit.semaphore.acquire(blocking=False):
+                    if self._clock() >= deadline:
+                        self._reject([scope])
+                        raise RateLimitExceeded(f"{scope} concurrency limit wait exceeds deadline")
+                    await asyncio.sleep(0.05)
+                acquired.append(limit.semaphore)
+        except BaseException:
+            # 包括对冲请求被取消的情况
+            Lease(acquired).release()
+            self._refund(reserved)
+            raise
+
+        self._record_wait(limits, self._clock() - started)
+        return Lease(acquired)
+
+    def stats(self) -> dict:
+        """按范围统计最近请求的排队等待时间和被拒绝的次数"""
+        with self._lock:
+            waits = {scope: sorted(values) for scope, values in self._waits.items()}
+            rejected = dict(self._rejected)
+
+        stats = {}
+        for scope in set(waits) | set(rejected):
+            values = waits.get(scope, [])
+            stats[scope] = {
+                'requests': len(values),
+                'rejected': rejected.get(scope, 0),
+                'wait_avg': round(sum(values) / len(values), 3) if values else 0.0,
+                'wait_p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3) if values else 0.0,
+                'wait_max': round(values[-1], 3) if values else 0.0
+            }
+        return stats
+
+
+# 创建全局限流实例
+llm_limiter = OutboundLimiter()
@@ -0,0 +1,343 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+import httpx
+import requests
+from flask import current_app, has_app_context
+from urllib3.exceptions import NewConnectionError
+
+# 外部调用的默认策略，可通过配置项 OUTBOUND_POLICIES 按服务名覆盖
+DEFAULT_POLICY = {
+    'deadline': 60,            # 单次调用（包含重试）的总时限（秒）
+    'retries': 1,              # 失败后的最大重试次数
+    'backoff_base': 0.5,       # 重试退避的基础时间（秒），按指数增长并加入随机抖动
+    'backoff_max': 4,          # 单次退避的最长时间（秒）
+    'retry_statuses': (429, 500, 502, 503, 504),  # 需要重试的HTTP状态码
+    'unsafe_retry_statuses': (429, 503),  # 非幂等请求（如计费的对话补全POST）只在这些表示未处理的状态码时重试
+    'failure_threshold': 5,    # 连续失败多少次后熔断
+    'reset_timeout': 30,       # 熔断后多久允许试探请求（秒）
+}
+
+SERVICE_POLICIES = {
+    'baidu': {'deadline': 75},
+    'xunfei': {'deadline': 75},
+    'silicon': {'deadline': 75},
+    'openrouter': {'deadline': 120},
+    'openweather': {'deadline': 10, 'retries': 2},
+    'ip-api': {'deadline': 5},
+    'nominatim': {'deadline': 5, 'retries': 0},
+}
+
+# 视为连接失败、可以重试的异常
+RETRYABLE_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    httpx.TransportError,
+)
+
+# 可以安全重试的请求方法，其他方法（POST）在请求可能已被服务端处理时不重试
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# 按用户或API Key限流的状态码，不代表接口故障，不计入熔断
+RATE_LIMITED_STATUS = 429
+
+
+def request_not_sent(exc: BaseException) -> bool:
+    """连接阶段的失败，请求一定没有到达服务端，非幂等请求也可以重试"""
+    if isinstance(exc, (requests.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    # 连接被拒绝、DNS解析失败时 requests 抛出的 ConnectionError 包装了 NewConnectionError
+    if isinstance(exc, requests.ConnectionError) and exc.args:
+        return isinstance(getattr(exc.args[0], 'reason', exc.args[0]), NewConnectionError)
+    return False
+
+
+def retry_after(response) -> Optional[float]:
+    """解析响应的 Retry-After 头（秒数或HTTP日期），没有或无法解析时返回None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+    pass
+
+
+class DeadlineExceededError(Exception):
+    """调用（包含重试）超出总时限"""
+    pass
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败达到阈值后打开，在 reset_timeout 内直接拒绝请求；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.total_failures = 0
+        self.total_rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """判断是否允许发起请求"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """试探请求既未成功也未失败（如被取消）时释放试探名额，允许下一个请求重新试探"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self.total_failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def to_dict(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'total_failures': self.total_failures,
+                'total_rejected': self.total_rejected
+            }
+
+
+class OutboundPolicyManager:
+    """外部调用策略：总时限、带抖动的指数退避重试，以及按接口划分的熔断器
+
+    熔断器由所有用户和API Key共享，因此429（某个Key被限流）不计入熔断，只按 Retry-After 重试。
+    非幂等请求只在请求确定未被处理时重试（连接失败、429、503），读取超时等情况直接抛出，避免重复计费。
+    """
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get_policy(self, name: str) -> dict:
+        policy = dict(DEFAULT_POLICY)
+        policy.update(SERVICE_POLICIES.get(name, {}))
+        if has_app_context():
+            overrides = current_app.config.get('OUTBOUND_POLICIES', {})
+            policy.update(overrides.get('default', {}))
+            policy.update(overrides.get(name, {}))
+        return policy
+
+    @staticmethod
+    def endpoint_of(url: str) -> str:
+        """接口标识为主机名加路径，不包含查询参数（其中可能有access_token）"""
+        parsed = urlparse(url)
+        return f"{parsed.netloc}{parsed.path}"
+
+    def get_breaker(self, name: str, url: str, policy: dict = None) -> CircuitBreaker:
+        key = (name, self.endpoint_of(url))
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            policy = policy or self.get_policy(name)
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = self._breakers[key] = CircuitBreaker(
+                        failure_threshold=policy['failure_threshold'],
+                        reset_timeout=policy['reset_timeout']
+                    )
+        return breaker
+
+    @staticmethod
+    def _backoff(policy: dict, attempt: int) -> float:
+        """全抖动的指数退避时间"""
+        return random.uniform(0, min(policy['backoff_max'], policy['backoff_base'] * (2 ** attempt)))
+
+    def _retry_delay(self, policy: dict, attempt: int, deadline: float,
+                     server_delay: Optional[float] = None) -> Optional[float]:
+        """下一次重试前的等待时间，服务端给出 Retry-After 时按其等待；
+        重试次数用尽或等待后超出总时限时返回None"""
+        if attempt >= policy['retries']:
+            return None
+        delay = server_delay if server_delay is not None else self._backoff(policy, attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    @staticmethod
+    def _record_status(breaker: CircuitBreaker, status_code: int):
+        """记录需要重试的状态码，429只释放试探名额，不计入失败"""
+        if status_code == RATE_LIMITED_STATUS:
+            breaker.release_trial()
+        else:
+            breaker.record_failure()
+
+    def _status_retry_delay(self, policy: dict, response, attempt: int, deadline: float,
+                            idempotent: bool) -> Optional[float]:
+        if not idempotent and response.status_code not in policy['unsafe_retry_statuses']:
+            return None
+        return self._retry_delay(policy, attempt, deadline, retry_after(response))
+
+    def call(self, name: str, url: str, send: Callable[[float], requests.Response], idempotent: bool = True):
+        """按策略发送同步请求
+
+        总时限只约束到收到响应（流式请求为响应头）为止，流式响应体的读取不受总时限约束，
+        只受读取超时（相邻两次读取的最长间隔）约束。
+
+        Args:
+            name: 服务名
+            url: 请求地址，用于区分熔断器
+            send: 接收剩余时限（秒）并发送一次请求的函数
+            idempotent: 请求是否可以安全重试，为False时只在请求确定未被处理时重试
+        """
+        policy = self.get_policy(name)
+        breaker = self.get_breaker(name, url, policy)
+        deadline = time.monotonic() + policy['deadline']
+        attempt = 0
+
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"{name} circuit open for {self.endpoint_of(url)}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(f"{name} call exceeded deadline of {policy['deadline']}s")
+
+            try:
+                response = send(remaining)
+            except RETRYABLE_EXCEPTIONS as e:
+                breaker.record_failure()
+                delay = self._retry_delay(policy, attempt, deadline) if idempotent or request_not_sent(e) else None
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # 其他异常不计入失败，但必须释放半开状态的试探名额，否则熔断器无法恢复
+                breaker.release_trial()
+                raise
+
+            if response.status_code in policy['retry_statuses']:
+                self._record_status(breaker, response.status_code)
+                delay = self._status_retry_delay(policy, response, attempt, deadline, idempotent)
+                if delay is not None:
+                    response.close()
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                return response
+
+            breaker.record_success()
+            return response
+
+    async def acall(self, name: str, url: str, send: Callable[[float], Awaitable[httpx.Response]],
+                    idempotent: bool = True):
+        """按策略发送异步请求，参数同 call"""
+        policy = self.get_policy(name)
+        breaker = self.get_breaker(name, url, policy)
+        deadline = time.monotonic() + policy['deadline']
+        attempt = 0
+
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"{name} circuit open for {self.endpoint_of(url)}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(f"{name} call exceeded deadline of {policy['deadline']}s")
+
+            try:
+                response = await send(remaining)
+            except RETRYABLE_EXCEPTIONS as e:
+                breaker.record_failure()
+                delay = self._retry_delay(policy, attempt, deadline) if idempotent or request_not_sent(e) else None
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 包括对冲请求中被取消的任务（asyncio.CancelledError）
+                breaker.release_trial()
+                raise
+
+            if response.status_code in policy['retry_statuses']:
+                self._record_status(breaker, response.status_code)
+                delay = self._status_retry_delay(policy, response, attempt, deadline, idempotent)
+                if delay is not None:
+                    await response.aclose()
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                return response
+
+            breaker.record_success()
+            return response
+
+    def breaker_states(self, redact: bool = False) -> dict:
+        """返回所有熔断器的状态，供监控使用
+
+        Args:
+            redact: 为True时接口标识替换为其哈希前缀，不暴露用户自定义的服务地址（如api_base）
+        """
+        states = {}
+        for (name, endpoint), breaker in list(self._breakers.items()):
+            if redact:
+                endpoint = hashlib.sha256(endpoint.encode('utf-8')).hexdigest()[:12]
+            states.setdefault(name, {})[endpoint] = breaker.to_dict()
+        return states
+
+
+# 创建全局策略实例
+outbound = OutboundPolicyManager()
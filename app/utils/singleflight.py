@@ -0,0 +1,82 @@
+import threading
+from typing import Any, Callable, ContextManager, Dict, Optional, Tuple
+
+
+class _Call:
+    """一次进行中的调用，等待方通过done事件获取结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """合并相同键的并发调用
+
+    同一时刻相同键只有一个线程（领头调用）真正执行，其余线程等待并共享其结果或异常。
+    调用结束后立即移除记录，之后的调用会重新执行，结果缓存由调用方自行负责。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0  # 实际执行的次数
+        self.shared = 0   # 共享其他调用结果的次数
+
+    def do(self, key: str, fn: Callable[[], Any],
+           lock: Optional[Callable[[], ContextManager]] = None) -> Tuple[Any, bool]:
+        """执行fn，相同键已有调用进行中时等待其结果
+
+        Args:
+            key: 调用的键，相同键视为相同请求
+            fn: 实际执行的函数
+            lock: 可选，返回上下文管理器的函数，领头调用在其中执行fn（如跨进程锁）
+
+        Returns:
+            tuple: (结果, 是否共享了其他调用的结果)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            if lock is not None:
+                with lock():
+                    call.result = fn()
+            else:
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.shared
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'shared': self.shared,
+                'shared_ratio': round(self.shared / total, 4) if total else 0.0
+            }
+
+
+# 创建全局实例，键以 chat:、image:、weather: 等前缀区分
+single_flight = SingleFlight()
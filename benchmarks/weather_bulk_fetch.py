@@ -0,0 +1,120 @@
+"""批量预热天气缓存的耗时基准
+
+用户数量增长时，为所有 UserLocation 预热天气缓存的总耗时和天气API调用次数：
+    per-location  逐个位置调用 refresh_weather：每个位置一次请求、一次提交
+    bulk          WeatherService.warm_user_locations：按网格去重，有界并发请求，一次提交
+
+天气API由 loadtest/fake_servers.py 在本地模拟，--latency 控制每次请求的延迟。
+用户位置分布在 --cities 个城市附近，同一城市的用户大多落在相同的网格中。
+
+用法（需要项目根目录下的 config.py）：
+    python benchmarks/weather_bulk_fetch.py --users 100,1000,5000 --cities 50 --latency 100
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app, db
+from app.models import User
+from app.models.weather import UserLocation, WeatherCache
+from app.services import weather_service
+from loadtest import fake_servers
+
+
+def start_fake_weather(latency):
+    options = fake_servers.parse_args(['--port', '0', '--latency', str(latency), '--jitter', '0'])
+    server = fake_servers.FakeServiceServer(('127.0.0.1', 0), options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fill(users, cities):
+    """创建 users 个用户，每个用户的位置在某个城市中心约2km范围内"""
+    UserLocation.query.delete()
+    User.query.delete()
+    centers = [(random.uniform(22, 42), random.uniform(100, 122)) for _ in range(cities)]
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'bench{i}', 'email': f'bench{i}@example.com'} for i in range(users)
+    ])
+    user_ids = [user_id for user_id, in db.session.query(User.id).all()]
+    locations = []
+    for i, user_id in enumerate(user_ids):
+        latitude, longitude = centers[i % cities]
+        locations.append({
+            'user_id': user_id,
+            'latitude': latitude + random.uniform(-0.01, 0.01),
+            'longitude': longitude + random.uniform(-0.01, 0.01),
+            'city': f'城市{i % cities}'
+        })
+    db.session.execute(UserLocation.__table__.insert(), locations)
+    db.session.commit()
+
+
+def reset_cache():
+    WeatherCache.query.delete()
+    db.session.commit()
+    weather_service._get_memory().clear()
+
+
+def per_location():
+    for location in UserLocation.query.all():
+        weather_service.refresh_weather(location.latitude, location.longitude, location.city)
+
+
+def bulk():
+    weather_service.warm_user_locations(force=True)
+
+
+def measure(server, fn):
+    """返回 (耗时秒数, 天气API调用次数)"""
+    reset_cache()
+    calls = server.counts.get('openweather', 0)
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started, server.counts.get('openweather', 0) - calls
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='批量预热天气缓存的耗时基准')
+    parser.add_argument('--users', default='100,1000,5000', help='用户数量，逗号分隔')
+    parser.add_argument('--cities', type=int, default=50, help='用户分布的城市数量')
+    parser.add_argument('--latency', type=float, default=100, help='模拟天气API的响应延迟（毫秒）')
+    parser.add_argument('--concurrency', type=int, default=8, help='WEATHER_BULK_CONCURRENCY')
+    parser.add_argument('--skip-per-location', action='store_true', help='只测量批量预热')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = start_fake_weather(args.latency)
+    workdir = tempfile.mkdtemp(prefix='weather-bench-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        SERVICE_URLS = {'openweather': f'http://127.0.0.1:{server.server_port}/openweather/data/2.5/weather'}
+        WEATHER_BULK_CONCURRENCY = args.concurrency
+        WEATHER_PREFETCH_ENABLED = False
+
+    app = create_app(BenchConfig)
+    print(f"{'users':>8}{'per-loc s':>12}{'per-loc calls':>15}{'bulk s':>10}{'bulk calls':>12}")
+    with app.app_context():
+        for users in [int(size) for size in args.users.split(',')]:
+            fill(users, args.cities)
+            if args.skip_per_location:
+                per_seconds, per_calls = float('nan'), 0
+            else:
+                per_seconds, per_calls = measure(server, per_location)
+            bulk_seconds, bulk_calls = measure(server, bulk)
+            print(f"{users:>8}{per_seconds:>12.2f}{per_calls:>15}{bulk_seconds:>10.2f}{bulk_calls:>12}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
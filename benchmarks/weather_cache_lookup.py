@@ -0,0 +1,111 @@
+"""天气缓存查询耗时基准
+
+对比两种表结构下，城市数量增长时单次缓存查询的耗时：
+    legacy   旧结构：每次未命中追加一行、从不删除，按 location 过滤并 ORDER BY timestamp DESC，无索引
+    indexed  当前结构：WeatherCache 按唯一索引 cache_key 查找，每个城市一行
+
+用法（需要项目根目录下的 config.py）：
+    python benchmarks/weather_cache_lookup.py --sizes 100,1000,5000,20000 --history 24
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from config import Config
+from app import create_app, db
+from app.models.weather import WeatherCache
+
+LEGACY_TABLE = 'weather_cache_legacy'
+
+
+def create_legacy_table():
+    db.session.execute(text(f"DROP TABLE IF EXISTS {LEGACY_TABLE}"))
+    db.session.execute(text(
+        f"CREATE TABLE {LEGACY_TABLE} ("
+        "id INTEGER PRIMARY KEY, location VARCHAR(100) NOT NULL, temperature FLOAT NOT NULL, "
+        "weather_condition VARCHAR(50) NOT NULL, humidity INTEGER, wind_speed FLOAT, timestamp DATETIME)"
+    ))
+
+
+def fill(cities, history):
+    """旧结构中每个城市有 history 行历史数据，当前结构中每个城市一行"""
+    now = datetime.utcnow()
+    legacy_rows = [
+        {'location': city, 'temperature': 20.0, 'weather_condition': 'Clear', 'humidity': 50,
+         'wind_speed': 3.0, 'timestamp': now - timedelta(hours=hour)}
+        for city in cities
+        for hour in range(history)
+    ]
+    db.session.execute(text(
+        f"INSERT INTO {LEGACY_TABLE} (location, temperature, weather_condition, humidity, wind_speed, timestamp) "
+        "VALUES (:location, :temperature, :weather_condition, :humidity, :wind_speed, :timestamp)"
+    ), legacy_rows)
+    db.session.execute(WeatherCache.__table__.insert(), [
+        {'cache_key': city, 'location': city, 'temperature': 20.0, 'weather_condition': 'Clear',
+         'humidity': 50, 'wind_speed': 3.0, 'timestamp': now}
+        for city in cities
+    ])
+    db.session.commit()
+    return len(legacy_rows)
+
+
+def time_lookups(lookup, cities, count):
+    """返回平均每次查询的微秒数"""
+    targets = [random.choice(cities) for _ in range(count)]
+    started = time.perf_counter()
+    for city in targets:
+        lookup(city)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def legacy_lookup(city):
+    return db.session.execute(text(
+        f"SELECT * FROM {LEGACY_TABLE} WHERE location = :location ORDER BY timestamp DESC LIMIT 1"
+    ), {'location': city}).first()
+
+
+def indexed_lookup(city):
+    cache = WeatherCache.lookup(city)
+    db.session.expunge_all()  # 避免命中session的对象缓存
+    return cache
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='天气缓存查询耗时基准')
+    parser.add_argument('--sizes', default='100,1000,5000,20000', help='城市数量，逗号分隔')
+    parser.add_argument('--history', type=int, default=24, help='旧结构中每个城市累积的行数')
+    parser.add_argument('--lookups', type=int, default=2000, help='每组测量的查询次数')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    workdir = tempfile.mkdtemp(prefix='weather-bench-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    app = create_app(BenchConfig)
+    print(f"{'cities':>8}{'legacy rows':>14}{'legacy us':>12}{'indexed us':>12}")
+    with app.app_context():
+        for size in sizes:
+            WeatherCache.query.delete()
+            create_legacy_table()
+            cities = [f'城市{i}' for i in range(size)]
+            legacy_rows = fill(cities, args.history)
+            lookups = min(args.lookups, max(50, 2_000_000 // legacy_rows))  # 旧结构全表扫描，控制总耗时
+            legacy_us = time_lookups(legacy_lookup, cities, lookups)
+            indexed_us = time_lookups(indexed_lookup, cities, args.lookups)
+            print(f"{size:>8}{legacy_rows:>14}{legacy_us:>12.1f}{indexed_us:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""端到端压测脚本
+
+注册并登录一批模拟用户，为每个用户配置AI服务、创建对话和位置，
+然后按权重并发请求聊天、天气、位置和衣橱相关接口，结束后按接口输出吞吐量和延迟分位数。
+
+先启动模拟服务（loadtest/fake_servers.py）并在config.py中配置其打印的 SERVICE_URLS，再启动应用：
+    python loadtest/driver.py --base-url http://127.0.0.1:5678 --users 20 --duration 60
+
+使用 --mix 调整各场景的权重，例如只压测聊天和天气：
+    python loadtest/driver.py --mix chat=3,weather=1
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+import requests
+
+QUESTIONS = [
+    '今天穿什么合适？',
+    '明天要去面试，帮我搭配一套衣服',
+    '周末去爬山应该怎么穿？',
+    '下雨天有什么穿搭建议？',
+    '帮我搭配一套适合约会的衣服',
+]
+
+CITIES = [
+    ('北京', 39.9042, 116.4074), ('上海', 31.2304, 121.4737), ('广州', 23.1291, 113.2644),
+    ('成都', 30.5728, 104.0668), ('杭州', 30.2741, 120.1551), ('西安', 34.3416, 108.9398),
+]
+
+CATEGORIES = ['tops', 'bottoms', 'shoes', 'accessories']
+
+# 默认的场景权重
+DEFAULT_MIX = {
+    'chat': 3,
+    'chat_stream': 1,
+    'weather': 3,
+    'location': 1,
+    'wardrobe': 2,
+    'wardrobe_add': 1,
+    'analyze_image': 1,
+}
+
+_CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"|value="([^"]+)"[^>]*name="csrf_token"')
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    """按接口记录每次请求的耗时和结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route, seconds, status, ok):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            self.statuses[route][status] += 1
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, elapsed):
+        rows = []
+        for route in sorted(self.latencies):
+            values = self.latencies[route]
+            rows.append({
+                'route': route,
+                'requests': len(values),
+                'errors': self.errors[route],
+                'throughput': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 1),
+                'p95_ms': round(percentile(values, 95) * 1000, 1),
+                'p99_ms': round(percentile(values, 99) * 1000, 1),
+                'max_ms': round(max(values) * 1000, 1),
+                'statuses': dict(self.statuses[route])
+            })
+        return rows
+
+
+class SyntheticUser:
+    """一个模拟用户的会话和场景"""
+
+    def __init__(self, base_url, username, provider, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.provider = provider
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.conversation_id = None
+
+    def url(self, path):
+        return self.base_url + path
+
+    def setup(self):
+        """注册、登录、配置AI服务、创建对话并设置位置"""
+        password = 'loadtest-password'
+        self.session.post(self.url('/auth/register'), data={
+            'username': self.username,
+            'email': f'{self.username}@loadtest.local',
+            'password': password,
+            'confirm_password': password
+        }, timeout=self.timeout)
+        self.session.post(self.url('/auth/login'), data={
+            'username': self.username,
+            'password': password
+        }, timeout=self.timeout)
+
+        page = self.session.get(self.url('/api_keys/'), timeout=self.timeout)
+        match = _CSRF_RE.search(page.text)
+        if not match:
+            raise RuntimeError(f'{self.username}: 登录失败或无法获取csrf_token')
+        self.session.post(self.url('/api_keys/'), data={
+            'csrf_token': match.group(1) or match.group(2),
+            'model_type': self.provider,
+            'api_key': 'loadtest-key',
+            'api_secret': 'loadtest-secret',
+            'app_id': 'loadtest-app',
+            'api_base': '',
+            'is_active': 'y',
+            'is_default': 'y'
+        }, timeout=self.timeout)
+
+        response = self.session.post(self.url('/api/conversations/create'), json={}, timeout=self.timeout)
+        self.conversation_id = response.json()['conversation']['id']
+        self.update_location()
+
+    # ---- 场景，返回 (状态码, 是否成功) ----
+
+    def chat(self):
+        response = self.session.post(self.url('/api/chat'), json={
+            'message': random.choice(QUESTIONS),
+            'conversation_id': self.conversation_id
+        }, timeout=self.timeout)
+        return response.status_code, response.ok and response.json().get('success', False)
+
+    def chat_stream(self):
+        response = self.session.post(self.url('/api/chat/stream'), json={
+            'message': random.choice(QUESTIONS),
+            'conversation_id': self.conversation_id
+        }, timeout=self.timeout, stream=True)
+        body = b''.join(response.iter_content(chunk_size=None))
+        return response.status_code, response.ok and b'event: done' in body
+
+    def weather(self):
+        response = self.session.get(self.url('/api/weather'), timeout=self.timeout)
+        return response.status_code, response.ok
+
+    def update_location(self):
+        _, latitude, longitude = random.choice(CITIES)
+        response = self.session.post(self.url('/api/location'), json={
+            'latitude': latitude + random.uniform(-0.05, 0.05),
+            'longitude': longitude + random.uniform(-0.05, 0.05)
+        }, timeout=self.timeout)
+        return response.status_code, response.ok
+
+    def location(self):
+        if random.random() < 0.5:
+            return self.update_location()
+        response = self.session.get(self.url('/api/location'), timeout=self.timeout)
+        return response.status_code, response.ok
+
+    def wardrobe(self):
+        response = self.session.get(self.url('/wardrobe/'), timeout=self.timeout)
+        return response.status_code, response.ok
+
+    def wardrobe_add(self):
+        response = self.session.post(self.url('/wardrobe/add'), data={
+            'category': random.choice(CATEGORIES),
+            'description': f'压测衣物{random.randint(1, 100000)}',
+            'seasons': random.sample(['春', '夏', '秋', '冬'], 2),
+            'occasions': random.sample(['日常', '工作', '运动', '休闲'], 1)
+        }, timeout=self.timeout, allow_redirects=False)
+        return response.status_code, response.status_code in (200, 302)
+
+    def analyze_image(self):
+        # 随机内容的图片，避免命中识别结果缓存
+        image = os.urandom(2048)
+        response = self.session.post(self.url('/wardrobe/analyze-image'), files={
+            'clothing_image': ('loadtest.jpg', image, 'image/jpeg')
+        }, timeout=self.timeout)
+        return response.status_code, response.ok and response.json().get('success', False)
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f'未知场景: {name}，可选: {", ".join(DEFAULT_MIX)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_user(user, mix, deadline, recorder, think_time):
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    while time.monotonic() < deadline:
+        name = random.choices(scenarios, weights)[0]
+        started = time.monotonic()
+        try:
+            status, ok = getattr(user, name)()
+        except requests.RequestException as e:
+            status, ok = type(e).__name__, False
+        except ValueError:
+            # 响应不是合法的JSON
+            status, ok = 'invalid-json', False
+        recorder.record(name, time.monotonic() - started, status, ok)
+        if think_time:
+            time.sleep(random.uniform(0, think_time))
+
+
+def print_report(rows, elapsed):
+    header = f"{'route':<14}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(f'\n压测时长 {elapsed:.1f}s')
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['route']:<14}{row['requests']:>7}{row['errors']:>8}{row['throughput']:>9}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    total = sum(row['requests'] for row in rows)
+    print('-' * len(header))
+    print(f"{'total':<14}{total:>7}{sum(row['errors'] for row in rows):>8}{round(total / elapsed, 2):>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='穿搭助手端到端压测')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5678', help='应用地址')
+    parser.add_argument('--users', type=int, default=10, help='并发的模拟用户数')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒）')
+    parser.add_argument('--mix', help='场景权重，如 chat=3,weather=1；可选场景: ' + ', '.join(DEFAULT_MIX))
+    parser.add_argument('--provider', default='openrouter', choices=['baidu', 'xunfei', 'silicon', 'openrouter'],
+                        help='模拟用户使用的AI服务')
+    parser.add_argument('--think-time', type=float, default=0.0, help='每次请求后随机等待的最长时间（秒）')
+    parser.add_argument('--timeout', type=float, default=120, help='单次请求超时（秒）')
+    parser.add_argument('--user-prefix', default='loadtest', help='模拟用户名前缀')
+    parser.add_argument('--json', help='将结果写入该JSON文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    users = [SyntheticUser(args.base_url, f'{args.user_prefix}{i}', args.provider, args.timeout)
+             for i in range(args.users)]
+    print(f'准备 {len(users)} 个模拟用户...')
+    for user in users:
+        user.setup()
+
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=run_user, args=(user, mix, deadline, recorder, args.think_time), daemon=True)
+        for user in users
+    ]
+    print(f'开始压测，持续 {args.duration:.0f}s，场景权重: {mix}')
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    rows = recorder.report(elapsed)
+    print_report(rows, elapsed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed': elapsed, 'users': len(users), 'mix': mix, 'routes': rows}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
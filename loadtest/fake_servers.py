@@ -0,0 +1,284 @@
+"""本地模拟的外部服务，用于压测时替代真实的AI、天气和定位接口
+
+按路径前缀模拟以下服务的接口格式：
+    /baidu       百度文心一言（/baidu/token 获取access_token，/baidu/chat 对话）
+    /xunfei      讯飞星火（OpenAI兼容格式，响应包含code字段）
+    /silicon     硅基流动（OpenAI兼容格式）
+    /openrouter  OpenRouter（OpenAI兼容格式，支持图像识别）
+    /openweather OpenWeatherMap 当前天气和5天/3小时预报
+    /ip-api      ip-api.com IP定位
+    /nominatim   Nominatim 逆地理编码
+
+用法：
+    python loadtest/fake_servers.py --port 9000 --latency 800 --jitter 400 --error-rate 0.02
+
+启动后会打印 SERVICE_URLS 配置，复制到 config.py 即可让应用使用模拟服务。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CHAT_REPLY = "今天气温适中，建议穿一件浅色长袖衬衫搭配深色休闲裤，外面加一件薄款针织开衫，早晚温差大时可以穿上。"
+VISION_REPLY = '{"description": "藏青色纯棉圆领T恤", "season": ["春", "夏"], "occasion": ["日常", "休闲"]}'
+WEATHER_CONDITIONS = ['Clear', 'Clouds', 'Rain', 'Drizzle', 'Snow', 'Mist']
+CITIES = ['北京', '上海', '广州', '深圳', '杭州', '成都', '武汉', '西安']
+
+
+def service_urls(base: str) -> dict:
+    """应用的 SERVICE_URLS 配置"""
+    return {
+        'baidu': f'{base}/baidu/chat',
+        'baidu-token': f'{base}/baidu/token',
+        'xunfei': f'{base}/xunfei/chat/completions',
+        'silicon': f'{base}/silicon/chat/completions',
+        'openrouter': f'{base}/openrouter/chat/completions',
+        'openweather': f'{base}/openweather/data/2.5/weather',
+        'openweather-forecast': f'{base}/openweather/data/2.5/forecast',
+        'ip-api': f'{base}/ip-api/json/',
+        'nominatim': f'{base}/nominatim/reverse',
+    }
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    """模拟服务的请求处理，延迟和错误率由服务器上的options控制"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    # ---- 通用 ----
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send_json(self, data: dict, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self) -> bool:
+        """模拟网络延迟，按错误率返回错误响应。返回False表示已返回错误"""
+        options = self.server.options
+        latency = random.gauss(options.latency, options.jitter) if options.jitter else options.latency
+        time.sleep(max(0.0, latency) / 1000)
+        self.server.record(self.path)
+        if options.error_rate and random.random() < options.error_rate:
+            self._send_json({'error': {'message': 'simulated upstream error'}}, status=options.error_status)
+            return False
+        return True
+
+    def _route(self):
+        # 先读取请求体，返回错误响应时也不会在keep-alive连接上残留数据
+        self.body = self._read_json()
+        path = urlparse(self.path).path
+        routes = [
+            ('/baidu/token', self.baidu_token),
+            ('/baidu/chat', self.baidu_chat),
+            ('/xunfei/', self.openai_chat),
+            ('/silicon/', self.openai_chat),
+            ('/openrouter/', self.openai_chat),
+            ('/openweather/data/2.5/forecast', self.forecast),
+            ('/openweather/', self.weather),
+            ('/ip-api/', self.ip_api),
+            ('/nominatim/', self.nominatim),
+        ]
+        for prefix, handler in routes:
+            if path.startswith(prefix):
+                if self._simulate():
+                    handler()
+                return
+        self._send_json({'error': 'not found'}, status=404)
+
+    do_GET = _route
+    do_POST = _route
+
+    # ---- AI服务 ----
+
+    @staticmethod
+    def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+
+    def baidu_token(self):
+        self._send_json({'access_token': 'fake-baidu-token', 'expires_in': 2592000})
+
+    def baidu_chat(self):
+        prompt = ''.join(m.get('content', '') for m in self.body.get('messages', []))
+        self._send_json({
+            'id': 'as-fake',
+            'result': CHAT_REPLY,
+            'usage': self._usage(len(prompt), len(CHAT_REPLY))
+        })
+
+    def openai_chat(self):
+        body = self.body
+        messages = body.get('messages', [])
+        is_vision = bool(messages) and isinstance(messages[-1].get('content'), list)
+        reply = VISION_REPLY if is_vision else CHAT_REPLY
+        prompt_tokens = sum(len(json.dumps(m, ensure_ascii=False)) // 2 for m in messages)
+        # 讯飞的响应额外包含code字段
+        extra = {'code': 0, 'message': 'Success'} if self.path.startswith('/xunfei/') else {}
+
+        if body.get('stream'):
+            self._stream_chat(reply, prompt_tokens, extra)
+            return
+
+        self._send_json(dict(extra, **{
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+            'usage': self._usage(prompt_tokens, len(reply))
+        }))
+
+    def _stream_chat(self, reply: str, prompt_tokens: int, extra: dict):
+        """以SSE格式分段返回，最后一个数据块携带用量"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        step = self.server.options.stream_chunk_chars
+        try:
+            for i in range(0, len(reply), step):
+                chunk = dict(extra, choices=[{'index': 0, 'delta': {'content': reply[i:i + step]}}])
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(self.server.options.stream_delay / 1000)
+            final = dict(extra, choices=[], usage=self._usage(prompt_tokens, len(reply)))
+            self.wfile.write(f"data: {json.dumps(final, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端读取到需要的内容后提前关闭了连接
+            self.server.record_disconnect(self.path)
+
+    # ---- 天气和定位 ----
+
+    def weather(self):
+        query = parse_qs(urlparse(self.path).query)
+        lat = float(query.get('lat', ['39.9'])[0])
+        self._send_json({
+            'coord': {'lat': lat, 'lon': float(query.get('lon', ['116.4'])[0])},
+            'weather': [{'id': 800, 'main': random.choice(WEATHER_CONDITIONS), 'description': 'fake'}],
+            'main': {
+                'temp': round(25 - abs(lat) / 3 + random.uniform(-3, 3), 1),
+                'humidity': random.randint(30, 90)
+            },
+            'wind': {'speed': round(random.uniform(0, 8), 1)},
+            'name': 'Fake City'
+        })
+
+    def forecast(self):
+        query = parse_qs(urlparse(self.path).query)
+        lat = float(query.get('lat', ['39.9'])[0])
+        count = int(query.get('cnt', ['40'])[0])
+        start = int(time.time()) // 10800 * 10800 + 10800
+        self._send_json({
+            'cnt': count,
+            'list': [
+                {
+                    'dt': start + i * 10800,
+                    'main': {
+                        'temp': round(25 - abs(lat) / 3 + random.uniform(-5, 5), 1),
+                        'humidity': random.randint(30, 90)
+                    },
+                    'weather': [{'id': 800, 'main': random.choice(WEATHER_CONDITIONS), 'description': 'fake'}],
+                    'wind': {'speed': round(random.uniform(0, 8), 1)},
+                    'pop': round(random.random(), 2)
+                }
+                for i in range(count)
+            ],
+            'city': {'name': 'Fake City', 'timezone': 28800}
+        })
+
+    def ip_api(self):
+        self._send_json({
+            'status': 'success',
+            'country': '中国',
+            'regionName': '模拟省',
+            'city': random.choice(CITIES),
+            'lat': round(random.uniform(22, 40), 4),
+            'lon': round(random.uniform(104, 121), 4),
+            'query': urlparse(self.path).path.rsplit('/', 1)[-1]
+        })
+
+    def nominatim(self):
+        self._send_json({
+            'display_name': 'Fake Address',
+            'address': {'city': random.choice(CITIES), 'state': '模拟省', 'country': '中国'}
+        })
+
+
+class FakeServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, FakeServiceHandler)
+        self.options = options
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, path: str):
+        service = urlparse(path).path.strip('/').split('/', 1)[0]
+        with self._lock:
+            self.counts[service] = self.counts.get(service, 0) + 1
+
+    def record_disconnect(self, path: str):
+        service = urlparse(path).path.strip('/').split('/', 1)[0] + ':disconnected'
+        with self._lock:
+            self.counts[service] = self.counts.get(service, 0) + 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本地模拟的AI、天气和定位服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=500, help='平均响应延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=200, help='延迟的标准差（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误响应的比例，0~1')
+    parser.add_argument('--error-status', type=int, default=503, help='错误响应的HTTP状态码')
+    parser.add_argument('--stream-delay', type=float, default=50, help='流式响应每段之间的间隔（毫秒）')
+    parser.add_argument('--stream-chunk-chars', type=int, default=4, help='流式响应每段的字符数')
+    parser.add_argument('--verbose', action='store_true', help='打印每个请求')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    server = FakeServiceServer((options.host, options.port), options)
+    base = f'http://{options.host}:{server.server_port}'
+    print(f'模拟服务已启动: {base}')
+    print('在config.py中加入以下配置:')
+    print(f'    SERVICE_URLS = {json.dumps(service_urls(base), indent=8)}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'请求统计: {json.dumps(server.counts, ensure_ascii=False)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+import sys
+import types
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    # app 包在导入时读取项目根目录的 config.py（不在版本库中），单元测试不需要其中的配置
+    config = types.ModuleType('config')
+    config.Config = type('Config', (), {})
+    sys.modules['config'] = config
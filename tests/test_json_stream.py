@@ -0,0 +1,105 @@
+import json
+from app.utils.json_stream import IncrementalJSONParser, extract_json_object
+
+REQUIRED = ('description', 'season', 'occasion')
+
+
+def feed_all(parser, chunks):
+    """依次输入各段文本，返回所有新完整的字段"""
+    fields = []
+    for chunk in chunks:
+        fields.extend(parser.feed(chunk))
+    return fields
+
+
+def test_braces_and_quotes_inside_strings():
+    data = {
+        'description': '带{花括号}和[方括号]以及"引号"的, 描述: 结束}',
+        'season': ['春', '秋'],
+        'occasion': ['日常']
+    }
+    parser = IncrementalJSONParser(REQUIRED)
+    fields = parser.feed(json.dumps(data, ensure_ascii=False))
+
+    assert parser.done
+    assert parser.result == data
+    assert fields == list(data.items())
+
+
+def test_escape_sequences():
+    text = r'{"description": "反斜杠\\", "season": ["春"], "occasion": ["a\"}b", "tab\tnewline\n"]}'
+    parser = IncrementalJSONParser(REQUIRED)
+    parser.feed(text)
+
+    assert parser.result == json.loads(text)
+    assert parser.result['description'] == '反斜杠\\'
+    assert parser.result['season'] == ['春']
+    assert parser.result['occasion'] == ['a"}b', 'tab\tnewline\n']
+
+
+def test_every_chunk_boundary():
+    text = '结果如下：{"description": "白色\\"衬衫\\" {长袖}", "season": ["春", "夏"], "occasion": ["通勤"]} 以上'
+    expected = extract_json_object(text, REQUIRED)
+    assert expected is not None
+
+    for split in range(1, len(text)):
+        parser = IncrementalJSONParser(REQUIRED)
+        fields = feed_all(parser, [text[:split], text[split:]])
+        assert parser.result == expected, split
+        assert fields == list(expected.items()), split
+
+
+def test_single_character_chunks_report_fields_as_they_complete():
+    parser = IncrementalJSONParser(REQUIRED)
+    seen = []
+    for char in '{"description": "白衬衫", "season": ["春"], "occasion": ["日常"]}':
+        for name, _ in parser.feed(char):
+            seen.append((name, parser.done))
+
+    # 前两个字段在对象闭合前就已返回
+    assert seen == [('description', False), ('season', False), ('occasion', True)]
+
+
+def test_commentary_before_and_after_object():
+    text = (
+        '好的，下面是识别结果 {不是JSON}：\n```json\n'
+        '{"description": "牛仔裤", "season": ["秋"], "occasion": ["日常"]}\n'
+        '```\n如需调整请告诉我 {"description": "另一个"}'
+    )
+    parser = IncrementalJSONParser(REQUIRED)
+    parser.feed(text)
+
+    assert parser.result == {'description': '牛仔裤', 'season': ['秋'], 'occasion': ['日常']}
+    # 完成后继续输入的文本被忽略
+    assert parser.feed('{"description": "x", "season": [], "occasion": []}') == []
+    assert parser.result['description'] == '牛仔裤'
+
+
+def test_object_missing_required_keys_is_kept_as_fallback():
+    text = '{"note": "先说明"} 然后 {"description": "外套", "season": ["冬"], "occasion": ["户外"]}'
+    parser = IncrementalJSONParser(REQUIRED)
+    parser.feed(text)
+
+    assert parser.first_object == {'note': '先说明'}
+    assert parser.result['description'] == '外套'
+    assert extract_json_object('{"note": "只有这个"}', REQUIRED) == {'note': '只有这个'}
+
+
+def test_nested_values_are_not_reported_as_fields():
+    parser = IncrementalJSONParser()
+    fields = parser.feed('{"a": {"b": 1, "c": [1, {"d": 2}]}, "e": 3}')
+
+    assert fields == [('a', {'b': 1, 'c': [1, {'d': 2}]}), ('e', 3)]
+    assert parser.result == {'a': {'b': 1, 'c': [1, {'d': 2}]}, 'e': 3}
+
+
+def test_truncated_input():
+    parser = IncrementalJSONParser(REQUIRED)
+    fields = parser.feed('说明 {"description": "白衬衫", "season": ["春", "夏"')
+
+    assert fields == [('description', '白衬衫')]
+    assert parser.fields == {'description': '白衬衫'}
+    assert not parser.done
+    assert parser.first_object is None
+    assert extract_json_object('{"description": "白衬衫", "sea', REQUIRED) is None
+    assert extract_json_object('没有JSON的回复', REQUIRED) is None
@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+from flask import Flask
+from app.utils import cache
+from app.utils.ratelimit import OutboundLimiter, RateLimitExceeded, TokenBucket
+
+USER = [('user', '1', None)]
+
+
+class FakeClock:
+    """手动推进的时钟"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(
+        LLM_RATE_LIMITS={'user': {'rate': 1, 'burst': 2, 'concurrency': 1}},
+        LLM_LIMIT_WAIT=5
+    )
+    with app.app_context():
+        yield app
+
+
+def user_bucket(limiter, key='1'):
+    return limiter._get_limit(f'user:{key}', 'user', None).bucket
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # 余额为负时按欠缺的令牌数等待，先预约的先获得
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    clock.advance(1)
+    assert bucket.tokens == pytest.approx(0)
+    clock.advance(100)
+    assert bucket.tokens == 3
+
+
+def test_bucket_cancel_returns_token_without_exceeding_burst(clock):
+    bucket = TokenBucket(rate=1, burst=2, clock=clock)
+    bucket.reserve()
+    bucket.reserve()
+    bucket.reserve()
+    assert bucket.tokens == pytest.approx(-1)
+
+    bucket.cancel()
+    assert bucket.tokens == pytest.approx(0)
+    bucket.cancel()
+    bucket.cancel()
+    bucket.cancel()
+    assert bucket.tokens == 2
+
+
+def test_acquire_takes_token_and_concurrency_slot(app, clock):
+    limiter = OutboundLimiter(clock)
+    lease = limiter.acquire(USER)
+
+    assert user_bucket(limiter).tokens == pytest.approx(1)
+    lease.release()
+    assert limiter.stats()['user']['requests'] == 1
+
+
+def test_rate_wait_beyond_deadline_is_rejected_and_refunded(app, clock):
+    app.config['LLM_LIMIT_WAIT'] = 0.5
+    limiter = OutboundLimiter(clock)
+    limiter.acquire(USER).release()
+    limiter.acquire(USER).release()
+
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(USER)
+    assert user_bucket(limiter).tokens == pytest.approx(0)
+    assert limiter.stats()['user']['rejected'] == 1
+
+
+def test_concurrency_timeout_refunds_token(app, clock):
+    app.config['LLM_LIMIT_WAIT'] = 0
+    limiter = OutboundLimiter(clock)
+    lease = limiter.acquire(USER)
+
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(USER)
+    # 等待并发名额超时的请求没有发出，令牌退还
+    assert user_bucket(limiter).tokens == pytest.approx(1)
+
+    lease.release()
+    limiter.acquire(USER).release()
+    assert user_bucket(limiter).tokens == pytest.approx(0)
+
+
+def test_async_concurrency_timeout_refunds_token(app, clock):
+    app.config['LLM_LIMIT_WAIT'] = 0
+    limiter = OutboundLimiter(clock)
+    lease = limiter.acquire(USER)
+
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(limiter.aacquire(USER))
+    assert user_bucket(limiter).tokens == pytest.approx(1)
+    lease.release()
+
+
+def test_cancel_while_waiting_for_token_refunds_token(app, clock):
+    limiter = OutboundLimiter(clock)
+    limiter.acquire(USER).release()
+    limiter.acquire(USER).release()
+    assert user_bucket(limiter).tokens == pytest.approx(0)
+
+    async def cancel_during_wait():
+        task = asyncio.ensure_future(limiter.aacquire(USER))
+        await asyncio.sleep(0)  # 任务预约令牌后进入等待
+        assert user_bucket(limiter).tokens == pytest.approx(-1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_during_wait())
+    assert user_bucket(limiter).tokens == pytest.approx(0)
+    # 并发名额没有被占用
+    limit = limiter._get_limit('user:1', 'user', None)
+    assert limit.semaphore.acquire(blocking=False)
+
+
+def test_limiters_are_bounded_by_max_keys(app, clock):
+    app.config['LLM_LIMITER_MAX_KEYS'] = 3
+    limiter = OutboundLimiter(clock)
+    for user_id in range(10):
+        limiter.acquire([('user', str(user_id), None)]).release()
+
+    assert len(limiter._get_limits()) == 3
+    assert limiter._get_limits().stats()['evictions'] == 7
+
+
+def test_idle_limiters_expire(app, clock, monkeypatch):
+    app.config['LLM_LIMITER_IDLE_TTL'] = 60
+    wall = FakeClock()
+    monkeypatch.setattr(cache, 'time', type('FakeTime', (), {'time': staticmethod(wall)}))
+    limiter = OutboundLimiter(clock)
+    limiter.acquire([('user', 'idle', None)]).release()
+    limiter.acquire([('user', 'active', None)]).release()
+    active = limiter._get_limit('user:active', 'user', None)
+
+    wall.advance(45)
+    # 使用时刷新过期时间
+    assert limiter._get_limit('user:active', 'user', None) is active
+    wall.advance(30)
+    assert limiter._get_limits().get('user:idle') is None
+    assert limiter._get_limit('user:active', 'user', None) is active
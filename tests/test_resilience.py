@@ -0,0 +1,318 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import requests
+from flask import Flask, current_app
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from app.utils import resilience
+from app.utils.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceededError, OutboundPolicyManager
+)
+
+URL = 'https://api.example.com/v1/chat?access_token=secret'
+POLICY = {
+    'deadline': 10,
+    'retries': 2,
+    'backoff_base': 1,
+    'backoff_max': 4,
+    'failure_threshold': 3,
+    'reset_timeout': 30,
+}
+
+
+class FakeTime:
+    """替换 resilience 模块中的 time：sleep 只推进时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds: float):
+        self.sleep(seconds)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeTransport:
+    """按顺序返回预设的结果：状态码、(状态码, 响应头) 或需要抛出的异常
+
+    latency 为每次请求消耗的时间，记录每次调用收到的剩余时限。
+    """
+
+    def __init__(self, clock: FakeTime, outcomes, latency: float = 0):
+        self.clock = clock
+        self.outcomes = list(outcomes)
+        self.latency = latency
+        self.remaining = []
+        self.responses = []
+
+    def __call__(self, remaining: float):
+        self.remaining.append(remaining)
+        self.clock.now += self.latency
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        status_code, headers = outcome if isinstance(outcome, tuple) else (outcome, None)
+        response = FakeResponse(status_code, headers)
+        self.responses.append(response)
+        return response
+
+    async def asend(self, remaining: float):
+        return self(remaining)
+
+    @property
+    def calls(self) -> int:
+        return len(self.remaining)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(resilience, 'time', clock)
+    monkeypatch.setattr(resilience, 'asyncio', SimpleNamespace(sleep=clock.async_sleep))
+    # 退避取上限，便于断言等待时间
+    monkeypatch.setattr(resilience, 'random', SimpleNamespace(uniform=lambda low, high: high))
+    return clock
+
+
+@pytest.fixture
+def manager():
+    app = Flask(__name__)
+    app.config['OUTBOUND_POLICIES'] = {'test': POLICY}
+    with app.app_context():
+        yield OutboundPolicyManager()
+
+
+def breaker_of(manager):
+    return manager.get_breaker('test', URL)
+
+
+def refused():
+    """连接被拒绝时 requests 抛出的异常，请求没有发出"""
+    return requests.ConnectionError(MaxRetryError(None, '/v1/chat', NewConnectionError(None, 'refused')))
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.total_rejected == 1
+
+    clock.now += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 半开状态只放行一个试探请求
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # 试探失败后重新打开
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.to_dict()['consecutive_failures'] == 0
+
+
+def test_released_trial_lets_next_request_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_retries_server_errors_with_backoff(clock, manager):
+    transport = FakeTransport(clock, [503, 502, 200])
+
+    response = manager.call('test', URL, transport)
+
+    assert response.status_code == 200
+    assert transport.calls == 3
+    assert clock.sleeps == [1, 2]
+    assert transport.responses[0].closed and transport.responses[1].closed
+    assert breaker_of(manager).to_dict()['consecutive_failures'] == 0
+
+
+def test_retry_budget_exhausted_returns_last_response_and_opens_breaker(clock, manager):
+    transport = FakeTransport(clock, [500, 500, 500, 200])
+
+    response = manager.call('test', URL, transport)
+
+    assert response.status_code == 500
+    assert transport.calls == 3
+    assert not response.closed
+    assert breaker_of(manager).state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        manager.call('test', URL, transport)
+    assert transport.calls == 3
+
+
+def test_connection_errors_are_retried_then_raised(clock, manager):
+    transport = FakeTransport(clock, [requests.ConnectionError('reset')] * 3)
+
+    with pytest.raises(requests.ConnectionError):
+        manager.call('test', URL, transport)
+    assert transport.calls == 3
+    assert breaker_of(manager).total_failures == 3
+
+
+def test_retries_stop_at_deadline(clock, manager):
+    transport = FakeTransport(clock, [503, 503, 503], latency=4)
+
+    response = manager.call('test', URL, transport)
+
+    # 第二次请求结束时已用去9秒，再退避2秒会超出10秒的总时限
+    assert response.status_code == 503
+    assert transport.remaining == [10, 5]
+    assert clock.sleeps == [1]
+
+
+def test_deadline_exceeded_before_sending(clock, manager):
+    current_app.config['OUTBOUND_POLICIES'] = {'test': dict(POLICY, deadline=0)}
+    transport = FakeTransport(clock, [200])
+
+    with pytest.raises(DeadlineExceededError):
+        manager.call('test', URL, transport)
+    assert transport.calls == 0
+
+
+def test_rate_limited_response_does_not_trip_breaker(clock, manager):
+    transport = FakeTransport(clock, [429] * 9)
+
+    for _ in range(3):
+        assert manager.call('test', URL, transport).status_code == 429
+
+    assert transport.calls == 9
+    breaker = breaker_of(manager)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.total_failures == 0
+
+
+def test_retry_after_is_honoured(clock, manager):
+    transport = FakeTransport(clock, [(429, {'Retry-After': '3'}), 200])
+
+    assert manager.call('test', URL, transport).status_code == 200
+    assert clock.sleeps == [3]
+
+
+def test_retry_after_beyond_deadline_is_not_retried(clock, manager):
+    transport = FakeTransport(clock, [(503, {'Retry-After': '60'}), 200])
+
+    assert manager.call('test', URL, transport).status_code == 503
+    assert transport.calls == 1
+    assert clock.sleeps == []
+
+
+def test_half_open_trial_rate_limited_releases_trial(clock, manager):
+    breaker = breaker_of(manager)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    transport = FakeTransport(clock, [(429, {'Retry-After': '60'})])
+
+    assert manager.call('test', URL, transport).status_code == 429
+    # 429不代表接口故障，下一个请求可以重新试探
+    assert breaker.allow()
+
+
+def test_read_timeout_on_post_is_not_retried(clock, manager):
+    transport = FakeTransport(clock, [requests.ReadTimeout('read timed out'), 200])
+
+    with pytest.raises(requests.ReadTimeout):
+        manager.call('test', URL, transport, idempotent=False)
+    assert transport.calls == 1
+
+
+def test_read_timeout_on_get_is_retried(clock, manager):
+    transport = FakeTransport(clock, [requests.ReadTimeout('read timed out'), 200])
+
+    assert manager.call('test', URL, transport).status_code == 200
+    assert transport.calls == 2
+
+
+def test_post_retried_only_when_not_processed(clock, manager):
+    current_app.config['OUTBOUND_POLICIES'] = {'test': dict(POLICY, failure_threshold=10)}
+    transport = FakeTransport(clock, [refused(), requests.ConnectTimeout('connect'), 503, 502, 200])
+
+    response = manager.call('test', URL, transport, idempotent=False)
+
+    # 连接失败和503可以重试，502可能已被处理，直接返回
+    assert transport.calls == 3
+    assert response.status_code == 503
+    response = manager.call('test', URL, transport, idempotent=False)
+    assert response.status_code == 502
+    assert transport.calls == 4
+
+
+def test_unexpected_error_releases_half_open_trial(clock, manager):
+    breaker = breaker_of(manager)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    transport = FakeTransport(clock, [ValueError('bad payload')])
+
+    with pytest.raises(ValueError):
+        manager.call('test', URL, transport)
+    assert breaker.total_failures == 3
+    assert breaker.allow()
+
+
+def test_async_call_retries_and_honours_retry_after(clock, manager):
+    transport = FakeTransport(clock, [(429, {'Retry-After': '2'}), 500, 200])
+
+    response = asyncio.run(manager.acall('test', URL, transport.asend))
+
+    assert response.status_code == 200
+    assert clock.sleeps == [2, 2]
+    assert transport.responses[0].closed and transport.responses[1].closed
+    assert breaker_of(manager).total_failures == 1
+
+
+def test_async_read_timeout_on_post_is_not_retried(clock, manager):
+    transport = FakeTransport(clock, [requests.ReadTimeout('read timed out'), 200])
+
+    with pytest.raises(requests.ReadTimeout):
+        asyncio.run(manager.acall('test', URL, transport.asend, idempotent=False))
+    assert transport.calls == 1
+
+
+def test_async_cancellation_releases_half_open_trial(clock, manager):
+    breaker = breaker_of(manager)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    transport = FakeTransport(clock, [asyncio.CancelledError()])
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(manager.acall('test', URL, transport.asend))
+    assert breaker.allow()